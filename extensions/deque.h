@@ -0,0 +1,91 @@
+#ifndef __DEQUE_H__
+#define __DEQUE_H__
+
+/*
+ * deque.h -- Monotonic index deques
+ *
+ * Shared by the sliding window QC algorithms to track the running minimum
+ * and maximum of a window in amortized constant time per sample.
+ */
+
+#include <stddef.h>
+
+/*
+ * index_deque
+ *
+ * A ring buffer of indices into the data vector, sized to a power of two so
+ * the head and tail counters can simply be masked. Used as a monotonic
+ * deque: the values referenced from front to back are kept increasing (for a
+ * running minimum) or decreasing (for a running maximum), so the front is
+ * always the extreme of the elements currently in the window.
+ */
+typedef struct {
+    size_t *idx;
+    size_t mask;
+    size_t head;
+    size_t tail;
+} index_deque;
+
+static inline size_t deque_front(const index_deque *q)
+{
+    return q->idx[q->head & q->mask];
+}
+
+static inline size_t deque_back(const index_deque *q)
+{
+    return q->idx[(q->tail - 1) & q->mask];
+}
+
+/*
+ * Drops the front of the deque while it refers to an index before lo
+ */
+static inline void deque_expire(index_deque *q, size_t lo)
+{
+    while(q->head != q->tail && deque_front(q) < lo)
+        q->head++;
+}
+
+/*
+ * Pushes index i onto the back of a running minimum deque, discarding every
+ * element that can no longer be the minimum of the window.
+ */
+static inline void deque_push_min(index_deque *q, const double *dat, size_t i)
+{
+    while(q->head != q->tail && dat[deque_back(q)] >= dat[i])
+        q->tail--;
+    q->idx[q->tail++ & q->mask] = i;
+}
+
+/*
+ * Pushes index i onto the back of a running maximum deque
+ */
+static inline void deque_push_max(index_deque *q, const double *dat, size_t i)
+{
+    while(q->head != q->tail && dat[deque_back(q)] <= dat[i])
+        q->tail--;
+    q->idx[q->tail++ & q->mask] = i;
+}
+
+/*
+ * Returns the ring buffer size needed to hold n indices
+ */
+static inline size_t deque_capacity(size_t n)
+{
+    size_t cap = 1;
+    while(cap < n)
+        cap <<= 1;
+    return cap;
+}
+
+/*
+ * Initializes q to hold up to n indices out of buf, which must have room for
+ * deque_capacity(n) indices.
+ */
+static inline void deque_init(index_deque *q, size_t *buf, size_t n)
+{
+    q->idx = buf;
+    q->mask = deque_capacity(n) - 1;
+    q->head = q->tail = 0;
+}
+
+#endif /* __DEQUE_H__ */
@@ -0,0 +1,76 @@
+/*
+ * fused.c -- Single pass QC engine
+ *
+ * Description:
+ *
+ *   Runs the global range, spike, stuck value and gradient tests over a data
+ *   vector in one traversal, sharing the reads of the data between tests.
+ *
+ */
+
+#include <stdlib.h>
+#include <stdbool.h>
+
+#include "fused.h"
+#include "spike.h"
+#include "stuck.h"
+#include "gradient.h"
+
+/*
+ * Number of values each test consumes in turn, 2048 doubles of data (and as
+ * many of x) plus the flags stay well within L1/L2.
+ */
+#define FUSED_BLOCK 2048
+
+int fused(signed char *out, const double *dat, const double *x, size_t len, const fused_params *p)
+{
+    size_t i, start, end;
+    signed char *range_out = out + FUSED_GLOBALRANGE * len;
+    signed char *spike_out = out + FUSED_SPIKE * len;
+    signed char *stuck_out = out + FUSED_STUCK * len;
+    signed char *gradient_out = out + FUSED_GRADIENT * len;
+    bool do_spike = false;
+    bool do_stuck = false;
+    bool do_gradient = p->gradient && len > 0;
+    spike_state spike_s;
+    stuck_state stuck_s;
+    gradient_state gradient_s;
+
+    if(p->spike)
+        do_spike = spike_init(&spike_s, dat, len, p->spike_L, p->spike_N, p->spike_acc);
+    if(p->stuck && p->stuck_num >= 1 && len >= p->stuck_num) {
+        if(stuck_init(&stuck_s, p->stuck_reso, p->stuck_num) < 0) {
+            if(do_spike)
+                spike_finish(&spike_s, spike_out, dat, len);
+            return -1;
+        }
+        do_stuck = true;
+    }
+    if(do_gradient)
+        gradient_start(&gradient_s, gradient_out, dat, p->startdat, p->toldat);
+
+    for(start=0;start<len;start=end) {
+        end = (len - start > FUSED_BLOCK) ? start + FUSED_BLOCK : len;
+        if(p->globalrange) {
+            for(i=start;i<end;i++) {
+                range_out[i] = (p->dat_min <= dat[i] && dat[i] <= p->dat_max);
+            }
+        }
+        if(do_spike)
+            spike_update(&spike_s, spike_out, dat, start, end);
+        if(do_stuck)
+            stuck_update(&stuck_s, stuck_out, dat, start, end);
+        if(do_gradient) {
+            /* dat[0] was evaluated by gradient_start */
+            gradient_resume(gradient_out, dat, x, (start) ? start : 1, end,
+                    p->grad_min, p->grad_max, p->mindx, p->toldat,
+                    p->skipped_value, &gradient_s);
+        }
+    }
+
+    if(do_spike)
+        spike_finish(&spike_s, spike_out, dat, len);
+    if(do_stuck)
+        stuck_free(&stuck_s);
+    return 0;
+}
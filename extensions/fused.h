@@ -0,0 +1,70 @@
+#ifndef __FUSED_H__
+#define __FUSED_H__
+
+#include <stddef.h>
+#include <stdbool.h>
+
+/*
+ * Rows of the output of fused, one per test
+ */
+#define FUSED_GLOBALRANGE 0
+#define FUSED_SPIKE 1
+#define FUSED_STUCK 2
+#define FUSED_GRADIENT 3
+#define FUSED_NTESTS 4
+
+/*
+ * fused_params
+ *
+ * The parameters of every test run by fused. Tests that are not enabled are
+ * not evaluated and their row of the output is left untouched.
+ */
+typedef struct {
+    bool globalrange;
+    double dat_min;
+    double dat_max;
+
+    bool spike;
+    int spike_L;
+    double spike_N;
+    double spike_acc;
+
+    bool stuck;
+    double stuck_reso;
+    int stuck_num;
+
+    bool gradient;
+    double grad_min;
+    double grad_max;
+    double mindx;
+    double startdat;
+    double toldat;
+    signed char skipped_value;
+} fused_params;
+
+/*
+ * fused
+ *
+ * Runs the global range, spike, stuck value and gradient tests in a single
+ * pass over dat. The data are walked in blocks small enough to stay in
+ * cache and every enabled test consumes a block before moving on to the
+ * next one, so dat (and x) are read from memory once no matter how many
+ * tests are enabled.
+ *
+ * The flags of test t are written to out[t*len:(t+1)*len] (see FUSED_*),
+ * the client should initialize out to 1s. Each row is identical to the
+ * output of the corresponding kernel (spike, stuck, gradient) run alone.
+ *
+ * Arguments:
+ * signed char *out         - The output array of flags, FUSED_NTESTS * len
+ * const double *dat        - The data vector
+ * const double *x          - The axis for the gradient test, may be NULL if
+ *                            the gradient test is not enabled
+ * size_t len               - Length of the data vector
+ * const fused_params *p    - The parameters of the tests
+ *
+ * Returns -1 if the working memory could not be allocated, 0 otherwise.
+ */
+int fused(signed char *out, const double *dat, const double *x, size_t len, const fused_params *p);
+
+#endif /* __FUSED_H__ */
@@ -86,23 +86,69 @@ int gradient(
         double toldat, 
         const signed char skipped_value) 
 { 
-    double ddatdx; 
-    size_t i=0; 
-    int j=0; 
-    int skipped=0; 
-    bool bad=false; 
+    gradient_state state;
+
+    gradient_start(&state, out, dat, startdat, toldat);
+    return gradient_resume(out, dat, x, 1, len, grad_min, grad_max, mindx, toldat, skipped_value, &state);
+}
+
 
-    /*
-     * If startdat is not set, set it to dat[0]. Otherwise, use it to evaluate 
-     * the tolerance of dat[0].
-     */
+/*
+ * gradient_start
+ *
+ * Initializes the state for a new series from its first value.
+ *
+ * If startdat is not set, set it to dat[0]. Otherwise, use it to evaluate 
+ * the tolerance of dat[0].
+ */
+void gradient_start(
+        gradient_state *state,
+        signed char *out,
+        const double *dat,
+        double startdat,
+        double toldat)
+{
+    state->skipped = 0;
+    state->bad = false;
     if (startdat == 0) { 
         startdat = dat[0];
     } else if ( !tolerance(dat[0], startdat, toldat) ) {
-        bad = true;
+        state->bad = true;
         out[0] = 0;
     }
-    for(i = 1; i < len; i++) {
+    state->startdat = startdat;
+}
+
+
+/*
+ * gradient_resume
+ *
+ * Continues the gradient algorithm from dat[start] given the state left
+ * after evaluating dat[start-1]. Values are compared against the last value
+ * that was not skipped, so the state->skipped + 1 values before start must
+ * be present in out, dat and x.
+ */
+int gradient_resume(
+        signed char *out, 
+        const double *dat, 
+        const double *x, 
+        size_t start,
+        size_t len, 
+        double grad_min, 
+        double grad_max, 
+        double mindx, 
+        double toldat, 
+        const signed char skipped_value,
+        gradient_state *state)
+{ 
+    double ddatdx; 
+    size_t i=0; 
+    int j=0; 
+    int skipped=state->skipped; 
+    bool bad=state->bad; 
+    double startdat=state->startdat;
+
+    for(i = start; i < len; i++) {
 
         /* 
          * Check if dx < mindx and skip if it's not.
@@ -145,8 +191,9 @@ int gradient(
             skipped = 0;
         }
     }
+    state->skipped = skipped;
+    state->bad = bad;
+    state->startdat = startdat;
     return 0;
 }
 
-
-
@@ -2,6 +2,24 @@
 #define __GRADIENT_H__
 
 #include <stddef.h>
+#include <stdbool.h>
+
+/*
+ * gradient_state
+ *
+ * The state of the gradient algorithm between two values, allows a series
+ * to be evaluated in pieces.
+ *
+ * double startdat - The last known good value.
+ * int skipped     - Number of values skipped (dx < mindx) since the last
+ *                   value that was evaluated.
+ * bool bad        - The series is currently bad.
+ */
+typedef struct {
+    double startdat;
+    int skipped;
+    bool bad;
+} gradient_state;
 
 /*
  * gradient
@@ -56,4 +74,36 @@ int gradient(signed char *out,
         double toldat, 
         const signed char skipped_value);
 
+/*
+ * gradient_start
+ *
+ * Initializes state to evaluate a new series and evaluates dat[0] against
+ * startdat (if set).
+ */
+void gradient_start(gradient_state *state,
+        signed char *out,
+        const double *dat,
+        double startdat,
+        double toldat);
+
+/*
+ * gradient_resume
+ *
+ * Continues the gradient algorithm from dat[start] through dat[len-1], given
+ * the state left after evaluating dat[start-1], and updates the state. The
+ * state->skipped + 1 values before start must be present in out, dat and x:
+ * the flags of skipped values may be set to 0 by a later bad value.
+ */
+int gradient_resume(signed char *out, 
+        const double *dat, 
+        const double *x, 
+        size_t start,
+        size_t len, 
+        double grad_min, 
+        double grad_max, 
+        double mindx, 
+        double toldat, 
+        const signed char skipped_value,
+        gradient_state *state);
+
 #endif /* __GRADIENT_H__ */
@@ -1,4 +1,7 @@
 #include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
+#include "spike.h"
 
 
 static inline double double_max(double a, double b)
@@ -12,6 +15,13 @@ static inline double double_abs(double a)
 }
 
 
+/*
+ * Windows up to this length are evaluated directly, beyond it the sliding
+ * window is faster.
+ */
+#define SPIKE_DIRECT_MAX_L 24
+
+
 static signed char window_spike(
             const double *sub_array, 
             size_t window_len, 
@@ -68,6 +78,224 @@ static signed char window_spike(
     return 1;
 }
 
+
+/*
+ * running_sum
+ *
+ * A Neumaier compensated sum that supports removing values as well as
+ * adding them, so the mean of the window does not drift over a long record
+ * (or lose every digit after a very large value enters and leaves the
+ * window). Non-finite values are counted instead of summed; the window mean
+ * is NaN or infinite while any of them are present.
+ */
+static inline void running_sum_add(running_sum *s, double x)
+{
+    double t;
+    if(!isfinite(x)) {
+        s->nonfinite++;
+        return;
+    }
+    t = s->sum + x;
+    if(double_abs(s->sum) >= double_abs(x))
+        s->c += (s->sum - t) + x;
+    else
+        s->c += (x - t) + s->sum;
+    s->sum = t;
+}
+
+static inline void running_sum_sub(running_sum *s, double x)
+{
+    if(!isfinite(x)) {
+        s->nonfinite--;
+        return;
+    }
+    running_sum_add(s, -x);
+}
+
+
+/*
+ * spike_init
+ *
+ * Prepares state to evaluate the spike test over dat. Windows up to
+ * SPIKE_DIRECT_MAX_L are evaluated directly; longer ones with a sliding
+ * window: the L-1 peers of each focus value are the L/2 values before it and
+ * the W = L-L/2-1 values after it. A single pair of monotonic deques tracks
+ * the minimum and maximum of every W wide run of the data; the right half of
+ * a window is the run starting just after the focus and the left half is the
+ * run starting L/2 values before it (plus the value just before the focus
+ * when L is even), so the extremes of the left half are read back from a
+ * short history of earlier runs. The sum of the peers is kept with a running
+ * compensated sum, so every sample costs O(1) regardless of L. If the
+ * working memory of the sliding window cannot be allocated we fall back to
+ * the direct evaluation.
+ *
+ * Returns 0 if there is nothing to evaluate (L < 1 or len < L), 1 otherwise.
+ */
+int spike_init(spike_state *state, const double *dat, size_t len, int L, double N, double ACC)
+{
+    size_t k, qcap;
+
+    state->buf = NULL;
+    state->hist = NULL;
+    if(L < 1 || len < L)
+        return 0;
+    state->L = L;
+    state->L2 = L/2;
+    state->W = L - state->L2 - 1;
+    state->N = N;
+    state->ACC = ACC;
+    state->direct = 1;
+    if(L <= SPIKE_DIRECT_MAX_L)
+        return 1;
+
+    qcap = deque_capacity(state->W);
+    state->hmask = deque_capacity(state->L2 + 2) - 1;
+    state->buf = malloc(sizeof(size_t) * 2 * qcap);
+    state->hist = malloc(sizeof(double) * 2 * (state->hmask + 1));
+    if(!state->buf || !state->hist) {
+        free(state->buf);
+        free(state->hist);
+        state->buf = NULL;
+        state->hist = NULL;
+        return 1;
+    }
+    state->direct = 0;
+    deque_init(&state->qmin, state->buf, state->W);
+    deque_init(&state->qmax, state->buf + qcap, state->W);
+    state->hmin = state->hist;
+    state->hmax = state->hist + state->hmask + 1;
+
+    /*
+     * Prime the sum with the peers of the first full window
+     */
+    state->peers.sum = state->peers.c = 0;
+    state->peers.nonfinite = 0;
+    for(k=0;k<L;k++) {
+        if(k != state->L2)
+            running_sum_add(&state->peers, dat[k]);
+    }
+    return 1;
+}
+
+/*
+ * spike_update
+ *
+ * Receives dat[start] through dat[end-1] and evaluates every window that is
+ * complete, i.e. the window of the focus value dat[k-W] once dat[k] is in.
+ */
+void spike_update(spike_state *state, signed char *out, const double *dat, size_t start, size_t end)
+{
+    size_t L = state->L;
+    size_t L2 = state->L2;
+    size_t W = state->W;
+    size_t hmask = state->hmask;
+    double *hmin = state->hmin;
+    double *hmax = state->hmax;
+    running_sum *peers = &state->peers;
+    size_t c, k;
+    double min, max, mean, R;
+
+    if(state->direct) {
+        /*
+         * Short windows are cheaper to evaluate directly than to track
+         * (and we fall back to it if we are out of memory).
+         */
+        for(k=(start + 1 < L) ? L - 1 : start;k<end;k++) {
+            out[k - W] = window_spike(dat + (k + 1 - L), L, L2, state->N, state->ACC);
+        }
+        return;
+    }
+
+    for(k=start;k<end;k++) {
+        /*
+         * Push the next value; once a run of W values is complete, record
+         * its extremes under the index where the run starts.
+         */
+        if(k >= W) {
+            deque_expire(&state->qmin, k + 1 - W);
+            deque_expire(&state->qmax, k + 1 - W);
+        }
+        deque_push_min(&state->qmin, dat, k);
+        deque_push_max(&state->qmax, dat, k);
+        if(k + 1 < W)
+            continue;
+        hmin[(k + 1 - W) & hmask] = dat[deque_front(&state->qmin)];
+        hmax[(k + 1 - W) & hmask] = dat[deque_front(&state->qmax)];
+        if(k + 1 < L)
+            continue;
+
+        /*
+         * The run starting after the focus is complete, evaluate the focus
+         */
+        c = k - W;
+        if(c > L2) {
+            /*
+             * Slide the sum: the old focus joins the left half, the leftmost
+             * peer leaves, the focus leaves the right half and a new value
+             * joins it.
+             */
+            running_sum_add(peers, dat[c - 1]);
+            running_sum_sub(peers, dat[c - 1 - L2]);
+            running_sum_sub(peers, dat[c]);
+            running_sum_add(peers, dat[k]);
+        }
+        if(peers->nonfinite) {
+            /*
+             * A NaN or infinite peer makes the comparison below false
+             */
+            out[c] = 1;
+            continue;
+        }
+        min = hmin[(c + 1) & hmask];
+        max = hmax[(c + 1) & hmask];
+        if(hmin[(c - L2) & hmask] < min)
+            min = hmin[(c - L2) & hmask];
+        if(hmax[(c - L2) & hmask] > max)
+            max = hmax[(c - L2) & hmask];
+        if(W < L2) {
+            /*
+             * Even window lengths have one more peer before the focus
+             */
+            if(dat[c - 1] < min)
+                min = dat[c - 1];
+            if(dat[c - 1] > max)
+                max = dat[c - 1];
+        }
+        mean = (peers->sum + peers->c)/(L-1);
+        R = double_max(max - min, state->ACC);
+        out[c] = (double_abs(dat[c] - mean) > (state->N*R)) ? 0 : 1;
+    }
+}
+
+/*
+ * spike_finish
+ *
+ * Evaluates the first and last L/2 values of the series of length len
+ * against the first/last L values, exactly as the DPS describes, and
+ * releases the state.
+ */
+void spike_finish(spike_state *state, signed char *out, const double *dat, size_t len)
+{
+    size_t i;
+    size_t L = state->L;
+    for(i=0;i<state->L2;i++) {
+        /*
+         * Do the beginning
+         */
+        out[i] = window_spike(dat, L, i, state->N, state->ACC);
+    }
+    for(i=state->L2;i<L;i++) {
+        /*
+         * Do the ending
+         */
+        out[(len-L) + i] = window_spike(dat + (len-L), L, i, state->N, state->ACC);
+    }
+    free(state->buf);
+    free(state->hist);
+    state->buf = NULL;
+    state->hist = NULL;
+}
+
 /*
  * spike
  *
@@ -76,6 +304,10 @@ static signed char window_spike(
  * of this document is to serve as a reference in order to document which
  * processing steps have been applied to a data product.
  *
+ * The center of the array is evaluated in O(len) with a sliding window, the
+ * first and last L/2 values are evaluated against the first/last L values
+ * exactly as the DPS describes.
+ *
  * Arguments:
  * signed char *out  - The output array of flags
  * const double *dat - The data vector
@@ -84,31 +316,14 @@ static signed char window_spike(
  * double N          - Range multipier
  * double ACC        - accuracy
  */
-int spike(signed char *out, const double *dat, size_t len, int L, double N, double ACC) 
+int spike(signed char *out, const double *dat, size_t len, int L, double N, double ACC)
 {
-    size_t i;
-    size_t L2 = L/2;
-    if(len < L) {
+    spike_state state;
+    if(!spike_init(&state, dat, len, L, N, ACC)) {
         return 0;
     }
-    for(i=0;i<=(len-L);i++) {
-        /*
-         * Iterate through the main (center) part of the array
-         */
-        out[i+L2] = window_spike(dat + i, L, L2, N, ACC);
-    }
-    for(i=0;i<L2;i++) {
-        /*
-         * Do the beginning
-         */
-        out[i] = window_spike(dat, L, i, N, ACC);
-    }
-    for(i=L2;i<L;i++) {
-        /*
-         * Do the ending
-         */
-        out[(len-L) + i] = window_spike(dat + (len-L), L, i, N, ACC);
-    }
+    spike_update(&state, out, dat, 0, len);
+    spike_finish(&state, out, dat, len);
     return 1;
 }
 
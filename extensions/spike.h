@@ -1,6 +1,43 @@
 #ifndef __SPIKE_H__
 #define __SPIKE_H__
 
+#include <stddef.h>
+#include "deque.h"
+
+/*
+ * running_sum
+ *
+ * A compensated sum that values can be removed from (see spike.c).
+ */
+typedef struct {
+    double sum;
+    double c;
+    size_t nonfinite;
+} running_sum;
+
+/*
+ * spike_state
+ *
+ * The state of the spike test between calls to spike_update, allows the
+ * values of a series to be evaluated in pieces.
+ */
+typedef struct {
+    size_t L;
+    size_t L2;
+    size_t W;
+    double N;
+    double ACC;
+    int direct;         /* evaluate every window directly */
+    size_t *buf;
+    double *hist;
+    double *hmin;
+    double *hmax;
+    size_t hmask;
+    index_deque qmin;
+    index_deque qmax;
+    running_sum peers;
+} spike_state;
+
 /*
  * spike
  *
@@ -9,6 +46,8 @@
  * of this document is to serve as a reference in order to document which
  * processing steps have been applied to a data product.
  *
+ * Runs in O(len) for any window length L.
+ *
  * Arguments:
  * signed char *out  - The output array of flags
  * const double *dat - The data vector
@@ -19,4 +58,29 @@
  */
 int spike(signed char *out, const double *dat, size_t len, int L, double N, double acc);
 
+/*
+ * spike_init
+ *
+ * Prepares state to run the spike test over the len values of dat. Returns
+ * 0 if there is nothing to evaluate (L < 1 or len < L), 1 otherwise, in
+ * which case the state must be released with spike_finish.
+ */
+int spike_init(spike_state *state, const double *dat, size_t len, int L, double N, double ACC);
+
+/*
+ * spike_update
+ *
+ * Evaluates the windows completed by dat[start] through dat[end-1]; must be
+ * called on consecutive ranges. dat and out hold the whole series.
+ */
+void spike_update(spike_state *state, signed char *out, const double *dat, size_t start, size_t end);
+
+/*
+ * spike_finish
+ *
+ * Evaluates the first and last L/2 values once the whole series of length
+ * len has been passed to spike_update, and releases the state.
+ */
+void spike_finish(spike_state *state, signed char *out, const double *dat, size_t len);
+
 #endif /* __SPIKE_H__ */
@@ -1,49 +1,107 @@
 #include <math.h>
 #include <stdlib.h>
+#include "stuck.h"
 
-static int all(const int *arr, size_t len);
 static double double_abs(double a);
-static int int_min(int a, int b);
 static int comp_res(double a, double b, double res);
 
 /*
- * stuck
- * sets out[i] to 0 where i in dat is a stuck value
+ * stuck_init
+ *
+ * Allocates the running minimum/maximum deques for runs of num values.
+ * Returns -1 if the working memory could not be allocated, 0 otherwise.
  */
-int stuck(signed char *out, const double *dat, size_t len, double reso, int num)
+int stuck_init(stuck_state *state, double reso, int num)
 {
-    int i,j,k;
-    int i_max;
-    int *tmp = malloc(sizeof(int) * (num-1));
-    for(i=0;i<(len - num + 1);i++) {
-        i_max = int_min(i+num, len)-1;
-        
-        if(comp_res(dat[i], dat[i_max], reso)) {
-            for(j=i;j<i_max;j++) {
-                tmp[(i_max)-1-j] = comp_res(dat[j], dat[i_max], reso);
-            }
-            if(all(tmp, num-1)) {
-                for(k=i;k<=i_max;k++) {
-                    out[k] = 0;
-                }
+    size_t cap;
+    state->buf = NULL;
+    state->n = (num < 1) ? 0 : num;
+    state->reso = reso;
+    state->filled = 0;
+    state->nonfinite = 0;
+    if(!state->n)
+        return 0;
+    cap = deque_capacity(state->n);
+    state->buf = malloc(sizeof(size_t) * 2 * cap);
+    if(!state->buf)
+        return -1;
+    deque_init(&state->qmin, state->buf, state->n);
+    deque_init(&state->qmax, state->buf + cap, state->n);
+    return 0;
+}
+
+/*
+ * stuck_update
+ *
+ * A run of num successive values is stuck when every value in it is within
+ * reso of the last value of the run. Rather than comparing every run
+ * element by element, the minimum and maximum of the run are tracked with
+ * monotonic deques while scanning dat once: all of the values are within
+ * reso of the last one exactly when the minimum and the maximum are. Runs
+ * containing NaN or infinite values are never stuck. Flags are back-filled
+ * only from the end of the previous stuck run, so the whole scan is O(len).
+ */
+void stuck_update(stuck_state *state, signed char *out, const double *dat, size_t start, size_t end)
+{
+    size_t i, j;
+    size_t n = state->n;
+
+    if(!n)
+        return;
+    for(i=start;i<end;i++) {
+        if(i >= n) {
+            /*
+             * dat[i-n] leaves the run
+             */
+            deque_expire(&state->qmin, i + 1 - n);
+            deque_expire(&state->qmax, i + 1 - n);
+            if(!isfinite(dat[i - n]))
+                state->nonfinite--;
+        }
+        deque_push_min(&state->qmin, dat, i);
+        deque_push_max(&state->qmax, dat, i);
+        if(!isfinite(dat[i]))
+            state->nonfinite++;
+        if(i + 1 < n || state->nonfinite)
+            continue;
+
+        if(comp_res(dat[deque_front(&state->qmin)], dat[i], state->reso) &&
+           comp_res(dat[deque_front(&state->qmax)], dat[i], state->reso)) {
+            /*
+             * dat[i-n+1:i+1] is stuck
+             */
+            j = (state->filled > i + 1 - n) ? state->filled : i + 1 - n;
+            for(;j<=i;j++) {
+                out[j] = 0;
             }
+            state->filled = i + 1;
         }
     }
-    free(tmp);
-    return 0;
 }
-                
+
+void stuck_free(stuck_state *state)
+{
+    free(state->buf);
+    state->buf = NULL;
+}
+
 /*
- * Performs a boolean evaluation on an entire array
+ * stuck
+ * sets out[i] to 0 where i in dat is a stuck value
+ *
+ * Returns -1 if the working memory could not be allocated, 0 otherwise.
  */
-static int all(const int *arr, size_t len) 
+int stuck(signed char *out, const double *dat, size_t len, double reso, int num)
 {
-    int i=0;
-    for(i=0;i<len;i++) {
-        if(!arr[i])
-            return 0;
-    }
-    return 1;
+    stuck_state state;
+
+    if(num < 1 || len < num)
+        return 0;
+    if(stuck_init(&state, reso, num) < 0)
+        return -1;
+    stuck_update(&state, out, dat, 0, len);
+    stuck_free(&state);
+    return 0;
 }
 
 /* double_abs
@@ -55,16 +113,6 @@ static double double_abs(double a)
         return a;
     return -a;
 }
-/*
- * int_min
- * Returns the minimum value between a and b
- */
-static int int_min(int a, int b) 
-{
-    if(a<=b) 
-        return a;
-    return b;
-}
 
 /*
  * comp_res
@@ -1,6 +1,62 @@
 #ifndef __STUCK_H__
 #define __STUCK_H__
 
+#include <stddef.h>
+#include "deque.h"
+
+/*
+ * stuck_state
+ *
+ * The state of the stuck value scan, allows a series to be evaluated in
+ * pieces (see stuck_update).
+ */
+typedef struct {
+    size_t n;
+    double reso;
+    size_t filled;      /* out[0:filled] has already been back-filled */
+    size_t nonfinite;   /* NaN or infinite values in the current run */
+    size_t *buf;
+    index_deque qmin;
+    index_deque qmax;
+} stuck_state;
+
+/*
+ * stuck
+ *
+ * Sets out[i] to 0 where dat[i] is part of a run of at least num successive
+ * values that are all within reso of the last value of the run. Only stuck
+ * values are set, the client should initialize out to 1s. Runs in O(len) for
+ * any num.
+ *
+ * Arguments:
+ * signed char *out  - The output array of flags
+ * const double *dat - The data vector
+ * size_t len        - Length of the data vector
+ * double reso       - Resolution, values closer than reso are repeats
+ * int num           - Minimum number of repeated values to flag
+ *
+ * Returns -1 if the working memory could not be allocated, 0 otherwise.
+ */
 int stuck(signed char *out, const double *dat, size_t len, double reso, int num);
 
+/*
+ * stuck_init
+ *
+ * Prepares state to scan a series for runs of num values within reso.
+ * Returns -1 if the working memory could not be allocated, 0 otherwise. The
+ * state must be released with stuck_free.
+ */
+int stuck_init(stuck_state *state, double reso, int num);
+
+/*
+ * stuck_update
+ *
+ * Continues the scan from dat[start] through dat[end-1]. dat and out must
+ * hold the series from its first value, the num-1 values before start are
+ * read and their flags may be set.
+ */
+void stuck_update(stuck_state *state, signed char *out, const double *dat, size_t start, size_t end);
+
+void stuck_free(stuck_state *state);
+
 #endif /* __STUCK_H__ */
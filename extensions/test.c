@@ -1,4 +1,5 @@
 #include <stdio.h>
+#include <string.h>
 #include <strings.h>
 #include <unistd.h>
 #include <stdlib.h>
@@ -6,10 +7,12 @@
 #include <math.h>
 #include <float.h>
 #include "spike.h"
+#include "stuck.h"
 #include "utils.h"
 #include "polycals.h"
 #include "time_utils.h"
 #include "gradient.h"
+#include "fused.h"
 #include "wmm.h"
 
 void arange(double *arr, size_t len);
@@ -20,6 +23,10 @@ void print_array_size_t(size_t *array, size_t len);
 char test_spike_simple(void);
 char test_spike_l(void);
 char test_spike_long(void);
+char test_spike_sliding(void);
+char test_stuck(void);
+char test_stuck_parity(void);
+char test_fused(void);
 char test_polyval(void);
 char test_gradient(void);
 char test_gradient2(void);
@@ -46,6 +53,10 @@ int main(int argc, char *argv[])
     test(&test_spike_simple);
     test(&test_spike_l);
     test(&test_spike_long);
+    test(&test_spike_sliding);
+    test(&test_stuck);
+    test(&test_stuck_parity);
+    test(&test_fused);
     test(&test_polyval);
     test(&test_gradient);
     test(&test_gradient2);
@@ -475,6 +486,218 @@ char test_spike_long()
     return 1;
 }
 
+/*
+ * Reference evaluation of a single spike window, kept independent from the
+ * sliding window implementation in spike.c
+ */
+static signed char reference_spike(const double *win, size_t L, size_t focus, double N, double acc)
+{
+    double min=INFINITY, max=-INFINITY, mean=0;
+    size_t j;
+    for(j=0;j<L;j++) {
+        if(j==focus)
+            continue;
+        if(win[j] < min)
+            min = win[j];
+        if(win[j] > max)
+            max = win[j];
+        mean += win[j];
+    }
+    mean /= (L-1);
+    if(fabs(win[focus] - mean) > N * fmax(max - min, acc))
+        return 0;
+    return 1;
+}
+
+char test_spike_sliding()
+{
+    const size_t len = 5000;
+    const int windows[] = {3, 4, 5, 8, 25, 26, 51, 200, 1001};
+    double dat[len];
+    signed char output[len];
+    signed char expected;
+    size_t i, k, L2;
+    int L;
+    printf("test_spike_sliding... ");
+
+    srand(7);
+    for(i=0;i<len;i++) {
+        dat[i] = (double)rand() / RAND_MAX;
+        if(!(i%37))
+            dat[i] += 50.0; /* Sprinkle some spikes */
+        if(!(i%997))
+            dat[i] = 1e30; /* and a few huge values that leave the window */
+    }
+    for(k=0;k<sizeof(windows)/sizeof(int);k++) {
+        L = windows[k];
+        L2 = L/2;
+        spike(output, dat, len, L, 3, 0.1);
+        for(i=0;i<len;i++) {
+            if(i < L2)
+                expected = reference_spike(dat, L, i, 3, 0.1);
+            else if(i > len - L + L2)
+                expected = reference_spike(dat + (len-L), L, i - (len-L), 3, 0.1);
+            else
+                expected = reference_spike(dat + i - L2, L, L2, 3, 0.1);
+            if(expected != output[i]) {
+                message = "Expected does not match received.";
+                printf("\nL=%d index=%lu expected=%d received=%d\n", L, i, (int)expected, (int)output[i]);
+                return 0;
+            }
+        }
+    }
+    return 1;
+}
+
+char test_stuck()
+{
+    double dat[] = {4.83, 1.40, 3.33, 3.33, 3.33, 3.33, 4.09, 2.97, 2.85, 3.67};
+    signed char expected[] = {1, 1, 0, 0, 0, 0, 1, 1, 1, 1};
+    signed char output[10];
+    size_t i;
+    printf("test_stuck... ");
+
+    memset(output, 1, 10);
+    stuck(output, dat, 10, 0.001, 4);
+    for(i=0;i<10;i++) {
+        if(expected[i] != output[i]) {
+            message = "Expected does not match received.";
+            printf("\n");
+            print_array(expected, 10);
+            print_array(output, 10);
+            return 0;
+        }
+    }
+    return 1;
+}
+
+/*
+ * The original O(len * num) stuck value scan, kept to check the single pass
+ * implementation against.
+ */
+static void reference_stuck(signed char *out, const double *dat, size_t len, double reso, int num)
+{
+    size_t i, j, i_max;
+    int ok;
+    for(i=0;i<(len - num + 1);i++) {
+        i_max = i + num - 1;
+        ok = 1;
+        for(j=i;j<i_max && ok;j++)
+            ok = fabs(dat[i_max] - dat[j]) < reso;
+        if(ok && fabs(dat[i_max] - dat[i]) < reso) {
+            for(j=i;j<=i_max;j++)
+                out[j] = 0;
+        }
+    }
+}
+
+char test_stuck_parity()
+{
+    const size_t len = 20000;
+    const int nums[] = {1, 2, 3, 4, 10, 37, 100};
+    const double resos[] = {0.001, 0.5, 1.5};
+    double dat[len];
+    signed char output[len];
+    signed char expected[len];
+    size_t i, k, r;
+    printf("test_stuck_parity... ");
+
+    srand(11);
+    for(i=0;i<len;i++) {
+        /*
+         * Coarsely quantized random walk so that runs of every length occur
+         */
+        dat[i] = (i ? dat[i-1] : 0) + (double)(rand() % 5 - 2) * (rand() % 4 ? 0 : 0.5);
+        if(!(i%4001))
+            dat[i] = NAN;
+    }
+    for(k=0;k<sizeof(nums)/sizeof(int);k++) {
+        for(r=0;r<sizeof(resos)/sizeof(double);r++) {
+            memset(output, 1, len);
+            memset(expected, 1, len);
+            stuck(output, dat, len, resos[r], nums[k]);
+            reference_stuck(expected, dat, len, resos[r], nums[k]);
+            for(i=0;i<len;i++) {
+                if(expected[i] != output[i]) {
+                    message = "Expected does not match received.";
+                    printf("\nnum=%d reso=%f index=%lu expected=%d received=%d\n",
+                            nums[k], resos[r], i, (int)expected[i], (int)output[i]);
+                    return 0;
+                }
+            }
+        }
+    }
+    return 1;
+}
+
+char test_fused()
+{
+    const size_t len = 10000;
+    const int windows[] = {5, 51};
+    double dat[len];
+    double x[len];
+    signed char output[FUSED_NTESTS * len];
+    signed char expected[len];
+    fused_params p;
+    size_t i, k;
+    printf("test_fused... ");
+
+    srand(5);
+    for(i=0;i<len;i++) {
+        dat[i] = (i ? dat[i-1] : 0) + (double)(rand() % 5 - 2) * (rand() % 4 ? 0 : 0.5);
+        if(!(i%41))
+            dat[i] += 20.0;
+        x[i] = i + (double)(rand() % 3) * 0.3;
+    }
+    memset(&p, 0, sizeof(p));
+    p.globalrange = true;
+    p.dat_min = -10;
+    p.dat_max = 10;
+    p.spike = true;
+    p.spike_N = 3;
+    p.spike_acc = 0.1;
+    p.stuck = true;
+    p.stuck_reso = 0.01;
+    p.stuck_num = 6;
+    p.gradient = true;
+    p.grad_min = -5;
+    p.grad_max = 5;
+    p.mindx = 1.2;
+    p.toldat = 1;
+    p.skipped_value = -99;
+    for(k=0;k<sizeof(windows)/sizeof(int);k++) {
+        p.spike_L = windows[k];
+        memset(output, 1, FUSED_NTESTS * len);
+        fused(output, dat, x, len, &p);
+
+        for(i=0;i<len;i++) {
+            if(output[FUSED_GLOBALRANGE * len + i] != (dat[i] >= -10 && dat[i] <= 10)) {
+                message = "Global range does not match.";
+                return 0;
+            }
+        }
+        memset(expected, 1, len);
+        spike(expected, dat, len, p.spike_L, p.spike_N, p.spike_acc);
+        if(memcmp(expected, output + FUSED_SPIKE * len, len)) {
+            message = "Spike does not match.";
+            return 0;
+        }
+        memset(expected, 1, len);
+        stuck(expected, dat, len, p.stuck_reso, p.stuck_num);
+        if(memcmp(expected, output + FUSED_STUCK * len, len)) {
+            message = "Stuck does not match.";
+            return 0;
+        }
+        memset(expected, 1, len);
+        gradient(expected, dat, x, len, p.grad_min, p.grad_max, p.mindx, p.startdat, p.toldat, -99);
+        if(memcmp(expected, output + FUSED_GRADIENT * len, len)) {
+            message = "Gradient does not match.";
+            return 0;
+        }
+    }
+    return 1;
+}
+
 char test_search_sorted()
 {
     double a[] = {1, 2, 3, 4, 5};
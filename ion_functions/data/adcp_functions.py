@@ -5,8 +5,10 @@
 @author Christopher Wingard
 @brief Module containing ADCP related data-calculations.
 """
+import threading
+
 import numpy as np
-from ion_functions.data.generic_functions import magnetic_declination
+from ion_functions.data.generic_functions import magnetic_declination, magnetic_rotation
 
 
 # Wrapper functions to create the VELPROF L1 data products for instruments
@@ -70,14 +72,11 @@ def adcp_beam_eastward(b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt):
     lon = np.atleast_1d(lon)
     dt = np.atleast_1d(dt)
 
-    # compute the beam to instrument transform
-    u, v, w, _ = adcp_beam2ins(b1, b2, b3, b4)
-
-    # compute the instrument to earth beam transform
-    uu, vv, _ = adcp_ins2earth(u, v, w, h, p, r, vf)
+    # compute the beam to instrument and instrument to earth beam transforms
+    uu, vv, _, _ = adcp_beam2earth_memo(b1, b2, b3, b4, h, p, r, vf)
 
     # compute the magnetic variation, and ...
-    theta = magnetic_declination(lat, lon, dt, z)
+    theta = magnetic_declination_memo(lat, lon, dt, z)
 
     # ... correct for it
     uu_cor, _ = magnetic_correction(theta, uu, vv)
@@ -149,14 +148,11 @@ def adcp_beam_northward(b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt):
     lon = np.atleast_1d(lon)
     dt = np.atleast_1d(dt)
 
-    # compute the beam to instrument transform
-    u, v, w, _ = adcp_beam2ins(b1, b2, b3, b4)
-
-    # compute the instrument to earth beam transform
-    uu, vv, _ = adcp_ins2earth(u, v, w, h, p, r, vf)
+    # compute the beam to instrument and instrument to earth beam transforms
+    uu, vv, _, _ = adcp_beam2earth_memo(b1, b2, b3, b4, h, p, r, vf)
 
     # compute the magnetic variation, and ...
-    theta = magnetic_declination(lat, lon, dt, z)
+    theta = magnetic_declination_memo(lat, lon, dt, z)
 
     # ... correct for it
     _, vv_cor = magnetic_correction(theta, uu, vv)
@@ -217,11 +213,8 @@ def adcp_beam_vertical(b1, b2, b3, b4, h, p, r, vf):
     r = np.atleast_1d(r) / 100.  # scale cdegrees input to degrees
     vf = np.atleast_1d(vf)
 
-    # compute the beam to instrument transform
-    u, v, w, _ = adcp_beam2ins(b1, b2, b3, b4)
-
-    # compute the instrument to earth beam transform
-    _, _, ww = adcp_ins2earth(u, v, w, h, p, r, vf)
+    # compute the beam to instrument and instrument to earth beam transforms
+    _, _, ww, _ = adcp_beam2earth_memo(b1, b2, b3, b4, h, p, r, vf)
 
     # scale upward velocity to m/s
     ww = ww / 1000.  # mm/s -> m/s
@@ -263,7 +256,7 @@ def adcp_beam_error(b1, b2, b3, b4):
     b4 = np.atleast_2d(b4)
 
     # compute the beam to instrument transform
-    _, _, _, e = adcp_beam2ins(b1, b2, b3, b4)
+    _, _, _, e = adcp_beam2ins_memo(b1, b2, b3, b4)
 
     # scale error velocity to m/s
     e = e / 1000.   # mm/s
@@ -272,6 +265,80 @@ def adcp_beam_error(b1, b2, b3, b4):
     return e
 
 
+def adcp_beam_all(b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt):
+    """
+    Description:
+
+        Wrapper function to compute all of the velocity profile data products
+        (VELPROF-VLE, VELPROF-VLN, VELPROF-VLU and VELPROF-ERR) from beam
+        coordinate transformed velocity profiles as defined in the Data
+        Product Specification for Velocity Profile and Echo Intensity - DCN
+        1341-00750. The results are those of adcp_beam_eastward,
+        adcp_beam_northward, adcp_beam_vertical and adcp_beam_error, with the
+        coordinate transforms and the magnetic declination computed once.
+
+    Usage:
+
+        uu_cor, vv_cor, ww, e = adcp_beam_all(b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
+
+            where
+
+        uu_cor = east velocity profiles in Earth coordinates corrected for the
+                 magnetic declination (VELPROF-VLE_L1) [m s-1]
+        vv_cor = north velocity profiles in Earth coordinates corrected for the
+                 magnetic declination (VELPROF-VLN_L1) [m s-1]
+        ww = vertical velocity profiles (VELPROF-VLU_L1) [m s-1]
+        e = Error velocity profiles (VELPROF-ERR_L1) [m s-1]
+
+        b1 = "beam 1" velocity profiles in beam coordinates (VELPROF-B1_L0) [mm s-1]
+        b2 = "beam 2" velocity profiles in beam coordinates (VELPROF-B2_L0) [mm s-1]
+        b3 = "beam 3" velocity profiles in beam coordinates (VELPROF-B3_L0) [mm s-1]
+        b4 = "beam 4" velocity profiles in beam coordinates (VELPROF-B4_L0) [mm s-1]
+        h = instrument's uncorrected magnetic heading [cdegrees]
+        p = instrument pitch [cdegrees]
+        r = instrument roll [cdegrees]
+        vf = instrument's vertical orientation (0 = downward looking and
+            1 = upward looking)
+        lat = instrument's deployment latitude [decimal degrees]
+        lon = instrument's deployment longitude [decimal degrees]
+        z = instrument's pressure sensor reading (depth) [daPa]
+        dt = sample date and time value [seconds since 1900-01-01]
+    """
+    # force shapes of inputs to arrays of the correct dimensions
+    b1 = np.atleast_2d(b1)
+    b2 = np.atleast_2d(b2)
+    b3 = np.atleast_2d(b3)
+    b4 = np.atleast_2d(b4)
+    h = np.atleast_1d(h) / 100.  # scale cdegrees input to degrees
+    p = np.atleast_1d(p) / 100.  # scale cdegrees input to degrees
+    r = np.atleast_1d(r) / 100.  # scale cdegrees input to degrees
+    vf = np.atleast_1d(vf)
+    z = np.atleast_1d(z) / 1000.  # scale daPa depth input to dbar
+    z = z * 1.019716  # use a simple approximation to calculate depth in m
+    lat = np.atleast_1d(lat)
+    lon = np.atleast_1d(lon)
+    dt = np.atleast_1d(dt)
+
+    # compute the beam to instrument and instrument to earth beam transforms
+    u, v, w, e = adcp_beam2ins(b1, b2, b3, b4)
+    uu, vv, ww = adcp_ins2earth(u, v, w, h, p, r, vf)
+
+    # compute the magnetic variation, and ...
+    theta = magnetic_declination(lat, lon, dt, z)
+
+    # ... correct for it
+    uu_cor, vv_cor = magnetic_correction(theta, uu, vv)
+
+    # scale velocities to m/s
+    uu_cor = uu_cor / 1000.  # mm/s -> m/s
+    vv_cor = vv_cor / 1000.
+    ww = ww / 1000.
+    e = e / 1000.
+
+    # return the Eastward, Northward, Upward and Error Velocity Profiles
+    return uu_cor, vv_cor, ww, e
+
+
 # Wrapper functions to create the VELPROF L1 data products for instruments
 # programmed in Earth coordinates by CGSN (Pioneer and Endurance) (ADCPA,
 # ADCPS-J,L,N and ADCPT-C,F,G,M)
@@ -322,7 +389,7 @@ def adcp_earth_eastward(u, v, z, lat, lon, dt):
     dt = np.atleast_1d(dt)
 
     # compute the magnetic variation, and ...
-    theta = magnetic_declination(lat, lon, dt, z)
+    theta = magnetic_declination_memo(lat, lon, dt, z)
 
     # ... correct for it
     uu_cor, _ = magnetic_correction(theta, u, v)
@@ -381,7 +448,7 @@ def adcp_earth_northward(u, v, z, lat, lon, dt):
     dt = np.atleast_1d(dt)
 
     # compute the magnetic variation, and ...
-    theta = magnetic_declination(lat, lon, dt, z)
+    theta = magnetic_declination_memo(lat, lon, dt, z)
 
     # ... correct for it
     _, vv_cor = magnetic_correction(theta, u, v)
@@ -507,14 +574,11 @@ def vadcp_beam_eastward(b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt):
     lon = np.atleast_1d(lon)
     dt = np.atleast_1d(dt)
 
-    # compute the beam to instrument transform
-    u, v, w, _ = adcp_beam2ins(b1, b2, b3, b4)
-
-    # compute the instrument to earth beam transform
-    uu, vv, _ = adcp_ins2earth(u, v, w, h, p, r, vf)
+    # compute the beam to instrument and instrument to earth beam transforms
+    uu, vv, _, _ = adcp_beam2earth_memo(b1, b2, b3, b4, h, p, r, vf)
 
     # compute the magnetic variation, and ...
-    theta = magnetic_declination(lat, lon, dt, z)
+    theta = magnetic_declination_memo(lat, lon, dt, z)
 
     # ... correct for it
     uu_cor, _ = magnetic_correction(theta, uu, vv)
@@ -577,14 +641,11 @@ def vadcp_beam_northward(b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt):
     lon = np.atleast_1d(lon)
     dt = np.atleast_1d(dt)
 
-    # compute the beam to instrument transform
-    u, v, w, _ = adcp_beam2ins(b1, b2, b3, b4)
-
-    # compute the instrument to earth beam transform
-    uu, vv, _ = adcp_ins2earth(u, v, w, h, p, r, vf)
+    # compute the beam to instrument and instrument to earth beam transforms
+    uu, vv, _, _ = adcp_beam2earth_memo(b1, b2, b3, b4, h, p, r, vf)
 
     # compute the magnetic variation, and ...
-    theta = magnetic_declination(lat, lon, dt, z)
+    theta = magnetic_declination_memo(lat, lon, dt, z)
 
     # ... corect for it
     _, vv_cor = magnetic_correction(theta, uu, vv)
@@ -641,11 +702,8 @@ def vadcp_beam_vertical_est(b1, b2, b3, b4, h, p, r, vf):
     r = np.atleast_1d(r) / 100.  # scale cdegrees input to degrees
     vf = np.atleast_1d(vf)
 
-    # compute the beam to instrument transform
-    u, v, w, _ = adcp_beam2ins(b1, b2, b3, b4)
-
-    # compute the instrument to earth beam transform
-    _, _, ww = adcp_ins2earth(u, v, w, h, p, r, vf)
+    # compute the beam to instrument and instrument to earth beam transforms
+    _, _, ww, _ = adcp_beam2earth_memo(b1, b2, b3, b4, h, p, r, vf)
 
     # scale upward velocity to m/s
     ww = ww / 1000.  # mm/s -> m/s
@@ -701,7 +759,7 @@ def vadcp_beam_vertical_true(b1, b2, b3, b4, b5, h, p, r, vf):
     vf = np.atleast_1d(vf)
 
     # compute the beam to instrument transform
-    u, v, _, _ = adcp_beam2ins(b1, b2, b3, b4)
+    u, v, _, _ = adcp_beam2ins_memo(b1, b2, b3, b4)
 
     # compute the instrument to earth beam transform
     _, _, ww = adcp_ins2earth(u, v, b5, h, p, r, vf)
@@ -746,7 +804,7 @@ def vadcp_beam_error(b1, b2, b3, b4):
     b4 = np.atleast_2d(b4)
 
     # compute the beam to instrument transform
-    _, _, _, e = adcp_beam2ins(b1, b2, b3, b4)
+    _, _, _, e = adcp_beam2ins_memo(b1, b2, b3, b4)
 
     # scale error velocity to m/s
     e = e / 1000.   # mm/s
@@ -755,6 +813,92 @@ def vadcp_beam_error(b1, b2, b3, b4):
     return e
 
 
+def vadcp_beam_all(b1, b2, b3, b4, b5, h, p, r, vf, lat, lon, z, dt):
+    """
+    Description:
+
+        Wrapper function to compute all of the turbulent velocity profile data
+        products (VELTURB-VLE, VELTURB-VLN, VELTURB-VLU, VELTURB-W5 and
+        VELTURB-ERR) from the beam coordinate transformed velocity profiles as
+        defined in the Data Product Specification for Turbulent Velocity
+        Profile and Echo Intensity - DCN 1341-00760. The results are those of
+        vadcp_beam_eastward, vadcp_beam_northward, vadcp_beam_vertical_est,
+        vadcp_beam_vertical_true and vadcp_beam_error, with the coordinate
+        transforms and the magnetic declination computed once.
+
+    Usage:
+
+        uu_cor, vv_cor, ww_est, ww_true, e = vadcp_beam_all(b1, b2, b3, b4, b5, h, p, r,
+                                                            vf, lat, lon, z, dt)
+
+            where
+
+        uu_cor = east velocity profiles in Earth coordinates corrected for the
+                  magnetic declination (VELTURB-VLE_L1) [m s-1]
+        vv_cor = north velocity profiles in Earth coordinates corrected for the
+                  magnetic declination (VELTURB-VLN_L1) [m s-1]
+        ww_est = estimated vertical velocity profiles in Earth coordinates
+                 (VELTURB-VLU_L1) [m s-1]
+        ww_true = true vertical velocity profiles in Earth coordinates
+                  (VELTURB-W5_L1) [m s-1]
+        e = error velocity profiles (VELTURB-ERR_L1) [m s-1]
+
+        b1 = "beam 1" velocity profiles in beam coordinates (VELTURB-B1_L0) [mm s-1]
+        b2 = "beam 2" velocity profiles in beam coordinates (VELTURB-B2_L0) [mm s-1]
+        b3 = "beam 3" velocity profiles in beam coordinates (VELTURB-B3_L0) [mm s-1]
+        b4 = "beam 4" velocity profiles in beam coordinates (VELTURB-B4_L0) [mm s-1]
+        b5 = "beam 5" velocity profiles in beam coordinates (VELTURB-B5_L0) [mm s-1]
+        h = instrument's uncorrected magnetic heading [cdegrees]
+        p = instrument pitch [cdegrees]
+        r = instrument roll [cdegrees]
+        vf = instrument's vertical orientation (0 = downward looking and
+            1 = upward looking)
+        lat = instrument's deployment latitude [decimal degrees]
+        lon = instrument's deployment longitude [decimal degrees]
+        z = instrument's pressure sensor reading (depth) [daPa]
+        dt = sample date and time value [seconds since 1900-01-01]
+    """
+    # force shapes of inputs to arrays of the correct dimensions
+    b1 = np.atleast_2d(b1)
+    b2 = np.atleast_2d(b2)
+    b3 = np.atleast_2d(b3)
+    b4 = np.atleast_2d(b4)
+    b5 = np.atleast_2d(b5)
+    h = np.atleast_1d(h) / 100.  # scale cdegrees input to degrees
+    p = np.atleast_1d(p) / 100.  # scale cdegrees input to degrees
+    r = np.atleast_1d(r) / 100.  # scale cdegrees input to degrees
+    vf = np.atleast_1d(vf)
+    z = np.atleast_1d(z) / 1000.  # scale daPa depth input to dbar
+    z = z * 1.019716  # use a simple approximation to calculate depth in m
+    lat = np.atleast_1d(lat)
+    lon = np.atleast_1d(lon)
+    dt = np.atleast_1d(dt)
+
+    # compute the beam to instrument and instrument to earth beam transforms
+    u, v, w, e = adcp_beam2ins(b1, b2, b3, b4)
+    uu, vv, ww_est = adcp_ins2earth(u, v, w, h, p, r, vf)
+
+    # the true vertical velocity uses beam 5 in place of the 4 beam estimate
+    _, _, ww_true = adcp_ins2earth(u, v, b5, h, p, r, vf)
+
+    # compute the magnetic variation, and ...
+    theta = magnetic_declination(lat, lon, dt, z)
+
+    # ... correct for it
+    uu_cor, vv_cor = magnetic_correction(theta, uu, vv)
+
+    # scale velocities to m/s
+    uu_cor = uu_cor / 1000.  # mm/s -> m/s
+    vv_cor = vv_cor / 1000.
+    ww_est = ww_est / 1000.
+    ww_true = ww_true / 1000.
+    e = e / 1000.
+
+    # return the Eastward, Northward, estimated and true Upward, and Error
+    # Velocity Profiles
+    return uu_cor, vv_cor, ww_est, ww_true, e
+
+
 # Calculates bin depths tRDI ADCPs configured to output data using the PD0 and PD12 formats
 def adcp_bin_depths(dist_first_bin, bin_size, num_bins, pressure, adcp_orientation, latitude):
     """
@@ -1088,6 +1232,119 @@ def adcp_ins2earth(u, v, w, heading, pitch, roll, vertical):
     return (uu, vv, ww)
 
 
+# Results of the coordinate transforms and magnetic declinations of the most
+# recently used inputs, so that the single product wrappers called
+# back-to-back on the data of one instrument (e.g. adcp_beam_eastward, then
+# adcp_beam_northward, or adcp_beam_error which only needs the beam to
+# instrument transform) share them. Each entry keeps a copy of its inputs,
+# which are compared byte for byte with the inputs of a call (cheaper than
+# hashing them), most recently used last. The entries (inputs and results)
+# hold at most ADCP_MEMO_BYTES in total; larger results are not kept, and
+# ADCP_MEMO_BYTES = 0 turns the memo off. adcp_beam_all and vadcp_beam_all
+# compute all of the products at once without relying on the memo.
+_adcp_memo = []
+_adcp_memo_lock = threading.Lock()
+ADCP_MEMO_BYTES = 64 * 2**20
+
+
+def _adcp_same(a, b):
+    a = np.asarray(a)
+    if a.shape != b.shape or a.dtype != b.dtype:
+        return False
+    a = np.ascontiguousarray(a).reshape(-1)
+    return np.array_equal(a.view(np.uint8), b.reshape(-1).view(np.uint8))
+
+
+def _adcp_memoize(name, func, *args):
+    with _adcp_memo_lock:
+        for i, (entry_name, entry_args, value, _) in enumerate(_adcp_memo):
+            if entry_name == name and all(_adcp_same(a, b) for a, b in zip(args, entry_args)):
+                _adcp_memo.append(_adcp_memo.pop(i))
+                return value
+
+    value = func(*args)
+    # the arrays are shared between calls
+    for arr in value:
+        arr.flags.writeable = False
+    nbytes = (sum(np.asarray(arg).nbytes for arg in args) +
+              sum(arr.nbytes for arr in value))
+    if nbytes > ADCP_MEMO_BYTES:
+        return value
+
+    args = tuple(np.array(arg, copy=True, order='C') for arg in args)
+    with _adcp_memo_lock:
+        _adcp_memo.append((name, args, value, nbytes))
+        total = sum(entry[3] for entry in _adcp_memo)
+        while total > ADCP_MEMO_BYTES:
+            total -= _adcp_memo.pop(0)[3]
+    return value
+
+
+def _adcp_beam2earth(b1, b2, b3, b4, heading, pitch, roll, vertical):
+    u, v, w, e = adcp_beam2ins_memo(b1, b2, b3, b4)
+    uu, vv, ww = adcp_ins2earth(u, v, w, heading, pitch, roll, vertical)
+    return (uu, vv, ww, e)
+
+
+def adcp_beam2ins_memo(b1, b2, b3, b4):
+    """
+    Description:
+
+        Returns adcp_beam2ins(b1, b2, b3, b4), reusing the result of a previous
+        call with equal inputs (see adcp_beam2earth_memo). The output arrays
+        are read-only.
+    """
+    return _adcp_memoize('beam2ins', adcp_beam2ins, b1, b2, b3, b4)
+
+
+def adcp_beam2earth_memo(b1, b2, b3, b4, heading, pitch, roll, vertical):
+    """
+    Description:
+
+        Converts the Beam Coordinate transformed velocity profiles to the
+        Earth coordinate system (adcp_beam2ins followed by adcp_ins2earth),
+        reusing the result of a previous call with equal inputs. The most
+        recently used results are kept, up to ADCP_MEMO_BYTES in total.
+
+    Usage:
+
+        uu, vv, ww, e = adcp_beam2earth_memo(b1, b2, b3, b4, heading, pitch,
+                                             roll, vertical)
+
+            where
+
+        uu = "east" velocity profiles in earth coordinates [mm s-1]
+        vv = "north" velocity profiles in earth coordinates [mm s-1]
+        ww = "vertical" velocity profiles in earth coordinates [mm s-1]
+        e = "error" velocity profiles [mm s-1]
+
+        The output arrays are read-only, as they are shared between calls. The
+        inputs are as documented in adcp_beam2ins and adcp_ins2earth.
+    """
+    return _adcp_memoize('beam2earth', _adcp_beam2earth, b1, b2, b3, b4,
+                         heading, pitch, roll, vertical)
+
+
+def magnetic_declination_memo(lat, lon, dt, z):
+    """
+    Description:
+
+        Returns magnetic_declination(lat, lon, dt, z), reusing the result of a
+        previous call with equal inputs (see adcp_beam2earth_memo). The
+        output array is read-only.
+    """
+    return _adcp_memoize('declination', lambda *args: (magnetic_declination(*args),),
+                         lat, lon, dt, z)[0]
+
+
+def clear_adcp_memo():
+    """
+    Discards the memoized ADCP coordinate transforms and magnetic declinations
+    """
+    with _adcp_memo_lock:
+        del _adcp_memo[:]
+
+
 def magnetic_correction(theta, u, v):
     """
     Description:
@@ -1147,32 +1404,8 @@ def magnetic_correction(theta, u, v):
     u = np.atleast_2d(u)
     v = np.atleast_2d(v)
 
-    theta_rad = np.radians(theta)
-    cosT = np.cos(theta_rad)
-    sinT = np.sin(theta_rad)
-
-    M = np.array([[cosT, sinT],
-                  [-sinT, cosT]])
-
-    # roll axes so that the lead index represents data packet #.
-    M = np.rollaxis(M, 2)
-
-    # the coordinate system is 2D, so the middle dimension is sized at 2.
-    uv = np.zeros((u.shape[0], 2, u.shape[1]))
-
-    # pack the coordinates to be rotated into the appropriate slices
-    uv[:, 0, :] = u
-    uv[:, 1, :] = v
-
-    # the Einstein summation is here configured to do the matrix
-    # multiplication uv_cor(i,k) = M(i,j) * uv(j,k) on each slice h.
-    uv_cor = np.einsum('hij,hjk->hik', M, uv)
-
-    # the magnetically corrected u values are:
-    u_cor = uv_cor[:, 0, :]
-
-    # the magnetically corrected v values are:
-    v_cor = uv_cor[:, 1, :]
+    # rotate the velocities of each packet by its theta, across all bins
+    u_cor, v_cor = magnetic_rotation(theta, u, v)
 
     # return corrected u and v values
     return (u_cor, v_cor)
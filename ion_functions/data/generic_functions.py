@@ -22,12 +22,11 @@ def magnetic_declination(lat, lon, ntp_timestamp, z=0.0, zflag=-1):
     """
     Description:
 
-        Wrapper function, vectorizing inputs to wmm_declination. Provides the
-        magnetic declination for a platform given its location (latitude and
-        longitude), the date (from the ntp_timestamp), the depth or height of
-        the instrument in meters (z), and a flag value (zflag) to indicate
-        whether the instrument is underwater (zflag = -1) or above water (zflag
-        = 1).
+        Wrapper function to WMM.declination_array, which is called once for
+        all of the inputs and evaluates the model once per distinct (lat, lon,
+        z, day). Provides the magnetic declination for a platform given its
+        location (latitude and longitude), the date (from the ntp_timestamp)
+        and the depth or height of the instrument in meters (z).
 
     Usage:
 
@@ -45,28 +44,30 @@ def magnetic_declination(lat, lon, ntp_timestamp, z=0.0, zflag=-1):
             [secs since 1900-01-01].
         z = depth or height of instrument relative to sealevel [meters].
             Positive values only. Default value is 0.
-        zflag = indicates whether to use z as a depth or height relative
-            to sealevel. -1=depth (i.e. -z) and 1=height (i.e. +z). -1
-            is the default
+        zflag = ignored, kept for compatibility. z is passed to the model with
+            its sign as given, which is what wmm_declination_remod did for
+            either value of zflag.
 
     Implemented by:
 
         2014-02-02: Christopher Wingard. Initial Code.
     """
 
-    # CSF move WMM instantiation outside of the vectorize call, to prevent
-    # repeated build/teardown during the vectorize.  Need to then pass it as
-    # an arg
-    # NOTE that this means that all the data being vectorized over are assumed
-    # to have the same appropriate model year.  If this is not the case, we
-    # should add code to split and batch the vectorize call to like year sets
+    # NOTE that all the data are assumed to have the same appropriate model
+    # year.  If this is not the case, we should add code to split and batch
+    # the call to like year sets
 
     # determine which WMM model to use (only one currently is for 2010-2015).
     wmm_model = set_wmm_model(2010)
     wmm = WMM(wmm_model)
 
-    decln = np.vectorize(wmm_declination_remod)
-    mag_dec = decln(lat, lon, ntp_timestamp, wmm, z, zflag)
+    # convert from meters to kilometers. z is passed to the model with its
+    # sign as given, as in wmm_declination_remod (whose check
+    # `z > 0 & zflag == -1` is always False due to operator precedence).
+    z = np.asanyarray(z, dtype=np.float) / 1000.  # m -> km
+
+    # the declination is computed once per distinct position and day
+    mag_dec = wmm.declination_array(lat, lon, z, ntp_timestamp)
     return mag_dec
 
 
@@ -116,20 +117,70 @@ def magnetic_correction(theta, u, v):
             >> Controlled >> 1000 System Level >>
             1341-00760_Data_Product_SPEC_VELPROF_OOI.pdf)
     """
+    u = np.atleast_1d(u)
+    v = np.atleast_1d(v)
+    return magnetic_rotation(theta, u, v)
+
+
+def magnetic_rotation(theta, u, v, out_u=None, out_v=None):
+    """
+    Description:
+
+        Rotates the vectors (u, v) from the magnetic to the true compass frame
+        by the magnetic declination theta. This is the kernel shared by all
+        the magnetic corrections (see magnetic_correction):
+
+            u_cor = u * cos(theta) + v * sin(theta)
+            v_cor = v * cos(theta) - u * sin(theta)
+
+        evaluated elementwise on whole arrays, without building a rotation
+        matrix per value. theta is aligned with the leading axes of u and v,
+        so an (N,) array of declinations applies to (N, nbins) arrays of ADCP
+        velocity profiles, one declination per ensemble.
+
+    Usage:
+
+        u_cor, v_cor = magnetic_rotation(theta, u, v, out_u=None, out_v=None)
+
+            where
+
+        u_cor = eastward components in the true compass frame (out_u if
+            given).
+        v_cor = northward components in the true compass frame (out_v if
+            given).
+
+        theta = magnetic variation based on location (latitude, longitude and
+            altitude) and date [degrees]
+        u = eastward components in the magnetic compass frame
+        v = northward components in the magnetic compass frame
+        out_u, out_v = [optional] float arrays of the shape of the results in
+            which to store them. They may be u and v themselves, to correct
+            the vectors in place.
+    """
+    theta = np.asanyarray(theta, dtype=np.float)
+    u = np.asanyarray(u, dtype=np.float)
+    v = np.asanyarray(v, dtype=np.float)
+
+    # align theta with the leading axes of u and v
+    ndim = max(u.ndim, v.ndim)
+    if theta.ndim < ndim:
+        theta = np.reshape(theta, theta.shape + (1,) * (ndim - theta.ndim))
     theta_rad = np.radians(theta)
     cosT = np.cos(theta_rad)
     sinT = np.sin(theta_rad)
 
-    M = np.array([
-        [cosT, sinT],
-        [-1*sinT, cosT]
-    ])
+    shape = np.broadcast(theta, u, v).shape
+    if out_u is None:
+        out_u = np.empty(shape)
+    if out_v is None:
+        out_v = np.empty(shape)
 
-    u = np.atleast_1d(u)
-    v = np.atleast_1d(v)
-    cor = np.dot(M, np.array([u, v]))
+    # u is needed for v_cor, keep its part aside in case out_u is u
+    usinT = u * sinT
+    ne.evaluate('u * cosT + v * sinT', out=out_u)
+    ne.evaluate('v * cosT - usinT', out=out_v)
 
-    return cor[0], cor[1]
+    return out_u, out_v
 
 
 def set_wmm_model(year):
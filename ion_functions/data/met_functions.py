@@ -6,11 +6,13 @@
 @brief Module containing functions for the met family of instruments
 """
 
+import hashlib
 import numpy as np
 import numexpr as ne
+from collections import OrderedDict
 from pygsw import vectors as gsw
 
-from ion_functions.data.generic_functions import magnetic_declination, magnetic_correction
+from ion_functions.data.generic_functions import magnetic_declination, magnetic_rotation
 
 
 # Set global switches used in METBK bulk flux calculations
@@ -21,6 +23,10 @@ JWARMFL = 1      # 1=do warmlayer calc
 #JWAVEFL         # only the windspeed parametrization of the charnok
                  # variable is coded; this switch is not used.
 
+# Convergence tolerance of the coare35vn bulk loop used by the data products;
+# None runs the hardwired number of iterations (see coare35vn).
+COARE35VN_TOL = None
+
 """
     LISTING OF SUBROUTINES BY ORDER IN THIS MODULE
         Grouped by sections; alphabetical within each section.
@@ -79,6 +85,7 @@ JWARMFL = 1      # 1=do warmlayer calc
         TEMPSKN:  metadata
         WIND10M
     These products are calculated on hourly averages.
+    All of them can be calculated with one call to met_bulkflx_all.
 #...................................................................................
 #...................................................................................
     Simple subroutines used in the routines in the sections above.
@@ -98,6 +105,7 @@ JWARMFL = 1      # 1=do warmlayer calc
 #...................................................................................
 #...................................................................................
     seasurface_skintemp_correct  (wrapper; calls warmlayer and coare35vn)
+    BulkFluxContext, bulkflux_context  (cached hourly data and skin corrections)
 #...................................................................................
 #...................................................................................
     warmlayer ('warmlayer' toga-coare routine)
@@ -117,6 +125,7 @@ JWARMFL = 1      # 1=do warmlayer calc
     Data conditioning and averaging routines
         condition_data
         make_hourly_data
+        HourlyAccumulator
         warmlayer_time_keys
 #...................................................................................
 
@@ -224,10 +233,10 @@ def met_windavg_mag_corr_east(uu, vv, lat, lon, timestamp, zwindsp=0.0):
             Company Home >> OOI >> Controlled >> 1000 System Level >>
             1341-00360_Data_Product_SPEC_BULKMET_OOI.pdf)
 
-        The magnetic_declination function and the magnetic_correction function are
+        The magnetic_declination function and the magnetic_rotation function are
         called from the ion_functions.data.generic_function module.
             magnetic_declination calculates the value(s) for the declination;
-            magnetic_correction rotates the velocity vectors from the magnetic
+            magnetic_rotation rotates the velocity vectors from the magnetic
                 compass headings to true compass headings.
     """
     # calculate the magnetic declination using the WMM model
@@ -235,8 +244,7 @@ def met_windavg_mag_corr_east(uu, vv, lat, lon, timestamp, zwindsp=0.0):
     mag_dec = magnetic_declination(lat, lon, timestamp, zwindsp, zflag)
 
     # rotate the vectors from the magnetic to the true compass frame
-    magvar = np.vectorize(magnetic_correction)
-    uu_cor, vv_cor = magvar(mag_dec, uu, vv)
+    uu_cor, vv_cor = magnetic_rotation(mag_dec, uu, vv)
 
     return uu_cor
 
@@ -275,10 +283,10 @@ def met_windavg_mag_corr_north(uu, vv, lat, lon, timestamp, zwindsp=0.0):
             Company Home >> OOI >> Controlled >> 1000 System Level >>
             1341-00360_Data_Product_SPEC_BULKMET_OOI.pdf)
 
-        The magnetic_declination function and the magnetic_correction function are
+        The magnetic_declination function and the magnetic_rotation function are
         called from the ion_functions.data.generic_function module.
             magnetic_declination calculates the value(s) for the declination;
-            magnetic_correction rotates the velocity vectors from the magnetic
+            magnetic_rotation rotates the velocity vectors from the magnetic
                 compass headings to true compass headings.
     """
     # calculate the magnetic declination using the WMM model
@@ -286,8 +294,7 @@ def met_windavg_mag_corr_north(uu, vv, lat, lon, timestamp, zwindsp=0.0):
     mag_dec = magnetic_declination(lat, lon, timestamp, zwindsp, zflag)
 
     # rotate the vectors from the magnetic to the true compass frame
-    magvar = np.vectorize(magnetic_correction)
-    uu_cor, vv_cor = magvar(mag_dec, uu, vv)
+    uu_cor, vv_cor = magnetic_rotation(mag_dec, uu, vv)
 
     return vv_cor
 
@@ -800,13 +807,11 @@ def met_buoyfls(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
-    (usr, tsr, qsr, _, _, _, _, _, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (usr, tsr, qsr, _, _, _, _, _, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, _, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -884,13 +889,11 @@ def met_buoyflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
-
-    (usr, tsr, qsr, _, _, _, _, _, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (usr, tsr, qsr, _, _, _, _, _, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, _, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -966,13 +969,11 @@ def met_frshflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
-    args[0] = calc_rain_rate(*args[0:2])
-
-    (usr, _, qsr, _, _, _, _, _, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (usr, _, qsr, _, _, _, _, _, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (rain_rate, _, _, _, _, _, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -1050,13 +1051,11 @@ def met_heatflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
-    (usr, tsr, qsr, _, dter, dqer, _, _, _, _, _, _, _, dsea) = seasurface_skintemp_correct(*args)
+    (usr, tsr, qsr, _, dter, dqer, _, _, _, _, _, _, _, dsea) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (rain_rate, _, _, _, tC_sea, _, _, tC_air, _, relhum, _, pr_air, Rshort_down,
@@ -1137,14 +1136,12 @@ def met_latnflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # dsea is the warmlayer correction to the sea surface temperature
-    (usr, _, qsr, _, _, _, _, _, _, _, _, _, _, dsea) = seasurface_skintemp_correct(*args)
+    (usr, _, qsr, _, _, _, _, _, _, _, _, _, _, dsea) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, tC_sea, _, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -1222,13 +1219,11 @@ def met_mommflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
-
-    (usr, _, _, ut, _, _, _, _, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (usr, _, _, ut, _, _, _, _, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, wnd, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -1301,15 +1296,13 @@ def met_netlirr(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # dter is the coolskin temperature depression [degC]
     # dsea is the warmlayer correction to the sea surface temperature [degC]
-    (_, _, _, _, dter, _, _, _, _, _, _, _, _, dsea) = seasurface_skintemp_correct(*args)
+    (_, _, _, _, dter, _, _, _, _, _, _, _, _, dsea) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, tC_sea, _, _, _, _, _, _, _, _, Rlong_down, _, _, _, _) = args
@@ -1383,14 +1376,12 @@ def met_rainflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # dsea is the warmlayer correction to the sea surface temperature [degC]
-    (_, _, _, _, _, _, _, _, _, _, _, _, _, dsea) = seasurface_skintemp_correct(*args)
+    (_, _, _, _, _, _, _, _, _, _, _, _, _, dsea) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (rain_rate, _, _, _, tC_sea, _, _, tC_air, _, relhum, _, pr_air,
@@ -1464,13 +1455,11 @@ def met_sensflx(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
-
-    (usr, tsr, _, _, _, _, _, _, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (usr, tsr, _, _, _, _, _, _, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, _, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -1545,14 +1534,12 @@ def met_sphum2m(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # L is the Obukhov length scale [m]
-    (_, _, qsr, _, _, _, _, L, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (_, _, qsr, _, _, _, _, L, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, _, _, tC_air, _, relhum, _, pr_air, _, _, _, _, _, _) = args
@@ -1622,14 +1609,12 @@ def met_stablty(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # L is the Obukhov length scale [m]
-    (_, _, _, _, _, _, _, L, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (_, _, _, _, _, _, _, L, _, _, _, _, _, _) = ctx.skin
 
     return zwindsp / L
 
@@ -1696,14 +1681,12 @@ def met_tempa2m(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # L is the Obukhov length scale [m]
-    (_, tsr, _, _, _, _, _, L, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (_, tsr, _, _, _, _, _, L, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, _, _, tC_air, _, _, _, _, _, _, lat, _, _, _) = args
@@ -1774,15 +1757,13 @@ def met_tempskn(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # dter is the coolskin temperature depression [degC]
     # dsea is the warmlayer correction to the sea surface temperature [degC]
-    (_, _, _, _, dter, _, _, _, _, _, _, _, _, dsea) = seasurface_skintemp_correct(*args)
+    (_, _, _, _, dter, _, _, _, _, _, _, _, _, dsea) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, tC_sea, _, _, _, _, _, _, _, _, _, _, _, _, _) = args
@@ -1855,14 +1836,12 @@ def met_wind10m(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
             tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
             Rlong_down, lat, zinvpbl, jcool, jwarm]
 
-    args = condition_data(*args)
-
-    args = make_hourly_data(*args)
-
-    args[0] = calc_rain_rate(*args[0:2])
+    # hourly data and skin corrections, computed once per set of inputs
+    ctx = bulkflux_context(*args)
+    args = ctx.args
 
     # L is the Obukhov length scale [m]
-    (usr, _, _, ut, _, _, _, L, _, _, _, _, _, _) = seasurface_skintemp_correct(*args)
+    (usr, _, _, ut, _, _, _, L, _, _, _, _, _, _) = ctx.skin
 
     # make the necessary processed hourly data available for the final calculation
     (_, _, _, _, _, wnd, _, _, _, _, _, _, _, _, _, _, _, _) = args
@@ -1872,6 +1851,72 @@ def met_wind10m(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
     return wind10m
 
 
+def met_bulkflx_all(tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
+                    zwindsp, ztmpair, zhumair, lat=45.0, pr_air=1013.0,
+                    Rshort_down=150.0, Rlong_down=370.0, cumu_prcp=0.0,
+                    zinvpbl=600.0, jwarm=JWARMFL, jcool=JCOOLFL):
+    """
+    Description:
+
+        Calculates all of the METBK L2 data products (and the STABLTY and TEMPSKN
+        metadata products) that require the warmlayer/coolskin algorithm. The
+        hourly averaging and the warmlayer and coolskin (coare35vn) calculations
+        are run once and shared by all of the products.
+
+    Usage:
+
+        The input arguments are those of the individual data product functions
+        (for example met_heatflx).
+
+        products = met_bulkflx_all(tC_sea, wnd, tC_air, relhum, timestamp, lon,
+                                   ztmpwat, zwindsp, ztmpair, zhumair, lat,
+                                   pr_air, Rshort_down, Rlong_down, cumu_prcp)
+
+            where
+
+        products = dictionary of the hourly data products, keyed by the lower
+                   case data product name ('buoyfls', 'buoyflx', 'frshflx',
+                   'heatflx', 'latnflx', 'mommflx', 'netlirr', 'rainflx',
+                   'sensflx', 'sphum2m', 'stablty', 'tempa2m', 'tempskn',
+                   'wind10m'), plus 'timeflx', the hourly timestamps.
+    """
+    # package input arguments as the data product functions do.
+    args = [cumu_prcp, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp,
+            tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
+            Rlong_down, lat, zinvpbl, jcool, jwarm]
+
+    ctx = bulkflux_context(*args)
+
+    # the data product functions find the context computed above in the cache.
+    dpa_args = (tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat,
+                zwindsp, ztmpair, zhumair, lat, pr_air, Rshort_down,
+                Rlong_down, cumu_prcp, zinvpbl, jwarm, jcool)
+    products = {}
+    for name, dpa in BULKFLX_PRODUCTS:
+        products[name] = dpa(*dpa_args)
+    products['timeflx'] = np.array(ctx.args[1])
+
+    return products
+
+
+# the data product functions evaluated by met_bulkflx_all
+BULKFLX_PRODUCTS = [
+    ('buoyfls', met_buoyfls),
+    ('buoyflx', met_buoyflx),
+    ('frshflx', met_frshflx),
+    ('heatflx', met_heatflx),
+    ('latnflx', met_latnflx),
+    ('mommflx', met_mommflx),
+    ('netlirr', met_netlirr),
+    ('rainflx', met_rainflx),
+    ('sensflx', met_sensflx),
+    ('sphum2m', met_sphum2m),
+    ('stablty', met_stablty),
+    ('tempa2m', met_tempa2m),
+    ('tempskn', met_tempskn),
+    ('wind10m', met_wind10m)]
+
+
 """
 #...................................................................................
 #...................................................................................
@@ -2547,6 +2592,99 @@ def windspeed_at_refheight(wnd, usr, ut, zrefht, zwindsp, L):
 """
 
 
+# Hourly data and skin corrections of the most recently used METBK inputs,
+# shared by the L2 data product functions (see bulkflux_context)
+_bulkflux_cache = OrderedDict()
+BULKFLUX_CACHE_SIZE = 4
+
+
+class BulkFluxContext(object):
+    """
+    Description:
+
+        Runs the front end common to the METBK L2 data products on one set of
+        inputs: the data conditioning, hourly averaging, rain rate calculation
+        and the warmlayer and coolskin corrections (seasurface_skintemp_correct).
+
+    Usage:
+
+        ctx = BulkFluxContext(*args)
+
+            where
+
+        args = argument list of seasurface_skintemp_correct, with the cumulative
+               precipitation [mm] in place of the rain rate, of each minute data.
+        ctx.args = the hourly argument list (rain rate [mm/hr] first), as passed
+                   to seasurface_skintemp_correct.
+        ctx.skin = the output tuple of seasurface_skintemp_correct.
+
+        The arrays of a context are read-only, as contexts are shared between
+        calls through bulkflux_context.
+    """
+    def __init__(self, *args):
+        inputs = [a for a in args if isinstance(a, np.ndarray)]
+
+        args = condition_data(*args)
+
+        args = make_hourly_data(*args)
+
+        args[0] = calc_rain_rate(*args[0:2])
+
+        skin = seasurface_skintemp_correct(*args)
+
+        # the sensor heights and switches are passed through unaveraged; copy
+        # them (and anything else still referring to the inputs) rather than
+        # making the caller's arrays read-only.
+        def freeze(value):
+            if isinstance(value, np.ndarray):
+                if any(np.may_share_memory(value, a) for a in inputs):
+                    value = value.copy()
+                value.flags.writeable = False
+            return value
+        self.args = tuple(freeze(value) for value in args)
+        self.skin = tuple(freeze(value) for value in skin)
+
+
+def _bulkflux_key(args):
+    key = []
+    for arg in args:
+        arg = np.ascontiguousarray(arg)
+        key.append((arg.shape, arg.dtype.str, hashlib.sha1(arg.view(np.uint8)).hexdigest()))
+    return tuple(key)
+
+
+def bulkflux_context(*args):
+    """
+    Description:
+
+        Returns the BulkFluxContext of the inputs, reusing the context of a
+        previous call with equal inputs, so that the L2 data products of one
+        data set run the warmlayer and coolskin algorithms only once. The
+        BULKFLUX_CACHE_SIZE most recently used contexts are kept.
+
+    Usage:
+
+        ctx = bulkflux_context(*args)
+
+            where args and ctx are as documented in BulkFluxContext.
+    """
+    key = (_bulkflux_key(args), COARE35VN_TOL)
+    ctx = _bulkflux_cache.pop(key, None)
+    if ctx is None:
+        ctx = BulkFluxContext(*args)
+        while len(_bulkflux_cache) >= BULKFLUX_CACHE_SIZE:
+            _bulkflux_cache.popitem(last=False)
+    _bulkflux_cache[key] = ctx
+    return ctx
+
+
+def clear_bulkflux_cache():
+    """
+    Discards the cached METBK hourly data and skin corrections
+    """
+    _bulkflux_cache.clear()
+
+
 def seasurface_skintemp_correct(*args):
     """
     Description:
@@ -2690,7 +2828,7 @@ def seasurface_skintemp_correct(*args):
     coolskin_args = (args[4]+dsea,) + args[5:-1]    # does not pass jwarm
     # append results of warmlayer calculation to output,
     # as is also done in original coare35vn warmlayer matlab code.
-    return coare35vn(*coolskin_args) + (dt_wrm, tk_pwp, dsea)
+    return coare35vn(*coolskin_args, tol=COARE35VN_TOL) + (dt_wrm, tk_pwp, dsea)
 
 """
 #...................................................................................
@@ -2704,7 +2842,7 @@ def seasurface_skintemp_correct(*args):
 
 
 def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum,
-              zhumair, pr_air, Rshort_down, Rlong_down, lat, zinvpbl, jcool):
+              zhumair, pr_air, Rshort_down, Rlong_down, lat, zinvpbl, jcool, by_day=True):
     """
     Description:
 
@@ -2724,7 +2862,7 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
         (dt_wrm, tk_pwp, dsea) = warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea,
                                            wnd, zwindsp, tC_air, ztmpair, relhum,
                                            zhumair, pr_air, Rshort_down, Rlong_down,
-                                           lat, zinvpbl, jcool)
+                                           lat, zinvpbl, jcool, by_day)
 
 
             where
@@ -2755,6 +2893,8 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
             lat = latitude [deg]
             zinvpbl = inversion height; default is 600m [m]
             jcool = switch to activate coolskin algorithm (hardwired to 1 = true)
+            by_day = if True (default), the days are processed together (see Notes);
+                     if False, the data records are processed one at a time.
 
     References:
 
@@ -2781,6 +2921,12 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
         negative local times; a mystery addend of 7.5 in the local time calculation, resulting
         in increasing local time by half an hour, was deleted.
 
+        The warmlayer recurrence is reset at the start of each day, so the days are
+        independent of each other. With by_day=True the n[th] records of all of the days
+        are processed together, so that coare35vn and the warmlayer calculations are run
+        once on a vector of days for each record number in a day (24 times for hourly
+        data) instead of once for every data record.
+
     """
     # set constants
     c2k = 273.15        # Converts degC to Kelvin
@@ -2835,6 +2981,13 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
     #             the output at these indices will be changed from initialized to nan.
     idx_warm, newday_bool, nanmask = warmlayer_time_keys(local_date_time)
 
+    if by_day:
+        _warmlayer_by_day(idx_warm, newday_bool, delta_time, rain_rate, ztmpwat, tC_sea,
+                          wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
+                          Rshort_down, Rlong_down, lat, zinvpbl, jcool, rhoa, Rns,
+                          ctd1, ctd2, dt_wrm, tk_pwp, dsea)
+        idx_warm = []   # skip the record by record loop
+
     #.. the original code has been changed to show the explicit dependence
     #.. of the variables upon iteration count (data record number).
     for ii in idx_warm:   # step through each timepoint
@@ -2869,7 +3022,7 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
                 pr_air[ii-1:ii], Rshort_down[ii-1:ii], Rlong_down[ii-1:ii], lat[ii-1:ii], zinvpbl[ii-1:ii],
                 jcool)
 
-        (usr, tsr, qsr, ut, dter, dqer, _, _, _, _, _) = coare35vn(*args)
+        (usr, tsr, qsr, ut, dter, dqer, _, _, _, _, _) = coare35vn(*args, tol=COARE35VN_TOL)
 
         # in the original matlab code, Le was calculated inside of the coare35vn
         # subroutine, which was called using tC_sea+dsea for seawater temperature:
@@ -2944,6 +3097,123 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
 
     return dt_wrm, tk_pwp, dsea
 
+
+def _warmlayer_by_day(idx_warm, newday_bool, delta_time, rain_rate, ztmpwat, tC_sea,
+                      wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
+                      Rshort_down, Rlong_down, lat, zinvpbl, jcool, rhoa, Rns,
+                      ctd1, ctd2, dt_wrm, tk_pwp, dsea):
+    """
+    Description:
+
+        Runs the record by record loop of the warmlayer routine on all of the days
+        at once: the state variables of the recurrence are held per day, and at step
+        n the n[th] record of each day (that has one) is processed. The calculation
+        of each record is that of the loop in warmlayer, written with masks in place
+        of the branches. dt_wrm, tk_pwp and dsea are filled in place.
+
+    Usage:
+
+        Called by warmlayer, whose documentation describes the arguments.
+    """
+    cpa = 1004.67       # specific heat capacity of (dry) air [J/kg/K]
+    max_pwp = 19.0      # maximum depth of warm layer (adjustable)
+
+    if idx_warm.size == 0:
+        return
+
+    # day number and record number within the day of each record to be processed.
+    # every day processed starts with a newday record, which resets the recurrence.
+    newday = newday_bool[idx_warm]
+    day = np.cumsum(newday) - 1
+    first = np.nonzero(newday)[0]
+    step = np.arange(idx_warm.size) - first[day]
+
+    #.. initialize the warmlayer state variables of each day
+    ndays = first.size
+    jamset = np.zeros(ndays, dtype=bool)  # warmlayer threshold indicator
+    fxp = np.zeros(ndays) + 0.5           # solar flux absorption
+    qcol_ac = np.zeros(ndays)             # accumulates heat from integral
+    tau_ac = np.zeros(ndays)              # accumulates stress from integral
+
+    # order the records by step; the records of one step are in order of day.
+    order = np.argsort(step, kind='mergesort')
+    bounds = np.searchsorted(step[order], np.arange(1, step.max() + 2))
+    for jj in range(bounds.size - 1):
+        sel = order[bounds[jj]:bounds[jj+1]]
+        ii = idx_warm[sel]      # records of this step
+        im1 = ii - 1            # the previous record of the same day
+        dd = day[sel]           # their days
+
+        tsea_corr = tC_sea[im1] + dsea[im1]
+        args = (tsea_corr, wnd[im1], zwindsp, tC_air[im1], ztmpair, relhum[im1], zhumair,
+                pr_air[im1], Rshort_down[im1], Rlong_down[im1], lat[im1], zinvpbl[im1],
+                jcool)
+
+        (usr, tsr, qsr, ut, dter, dqer, _, _, _, _, _) = coare35vn(*args, tol=COARE35VN_TOL)
+
+        Le = latent_heat_vaporization_pure_water(tsea_corr)
+        tau_old = rhoa[im1] * usr * usr * wnd[im1] / ut  # stress
+        hs_old = -rhoa[im1] * cpa * usr * tsr             # sensible heat flux
+        hl_old = -rhoa[im1] * Le * usr * qsr              # latent heat flux
+
+        Rnl = net_longwave_up(tC_sea[ii]-dter, Rlong_down[ii])
+        RF_old = rain_heat_flux(rain_rate[im1], tC_sea[im1]+dsea[im1], tC_air[im1],
+                                relhum[im1], pr_air[im1])
+
+        qr_out = Rnl + hs_old + hl_old + RF_old  # total cooling at surface
+        q_pwp = fxp[dd] * Rns[ii] - qr_out       # tot heat abs in warm layer
+
+        # records for which the threshold is (or has been) crossed
+        jam = (q_pwp >= 50.0) | jamset[dd]
+        # propagate dt_wrm and tk_pwp values for the others
+        dt_wrm[ii[~jam]] = dt_wrm[im1[~jam]]
+        tk_pwp[ii[~jam]] = tk_pwp[im1[~jam]]
+
+        ii, im1, dd = ii[jam], im1[jam], dd[jam]
+        q_pwp, qr_out, tau_old = q_pwp[jam], qr_out[jam], tau_old[jam]
+        dtime = delta_time[ii]
+        jamset[dd] = True
+        tau_ac[dd] = tau_ac[dd] + np.maximum(.002, tau_old) * dtime  # momentum integral
+
+        # check threshold for warm layer existence
+        warm = qcol_ac[dd] + q_pwp * dtime > 0.0
+        qjoule = np.zeros(ii.size)
+        fxp_jam = np.zeros(ii.size) + 0.75       # warm layer wiped out
+        tkpwp_jam = np.zeros(ii.size) + max_pwp  # warm layer wiped out
+        qjoule[~warm] = (0.75 * Rns[ii[~warm]] - qr_out[~warm]) * dtime[~warm]
+        if np.any(warm):
+            # compute the absorption profile
+            Rns_w, qr_out_w, dtime_w = Rns[ii[warm]], qr_out[warm], dtime[warm]
+            qcol_ac_w, tau_ac_w = qcol_ac[dd[warm]], tau_ac[dd[warm]]
+            ctd1_w = ctd1[ii[warm]]
+            tkpwp = tk_pwp[im1[warm]]
+            for i in range(5):               # loop 5 times for fxp
+                fxp_w = 1.0 - (0.28 * 0.014 * (1.0 - np.exp(-tkpwp / 0.014)) +
+                               0.27 * 0.357 * (1.0 - np.exp(-tkpwp / 0.357)) +
+                               0.45 * 12.82 * (1.0 - np.exp(-tkpwp / 12.82))) / tkpwp
+                qjoule_w = (fxp_w * Rns_w - qr_out_w) * dtime_w
+                k = qcol_ac_w + qjoule_w > 0.0   # Compute warm-layer depth
+                tkpwp[k] = np.minimum(max_pwp,
+                                      ctd1_w[k] * tau_ac_w[k] / np.sqrt(qcol_ac_w[k] + qjoule_w[k]))
+            fxp_jam[warm] = fxp_w
+            tkpwp_jam[warm] = tkpwp
+            qjoule[warm] = qjoule_w
+        fxp[dd] = fxp_jam
+        tk_pwp[ii] = tkpwp_jam
+
+        qcol_ac[dd] = qcol_ac[dd] + qjoule           # heat integral
+
+        #*******  compute dt_warm  ******
+        dt_wrm[ii] = 0.0
+        k = qcol_ac[dd] > 0.0
+        dt_wrm[ii[k]] = ctd2[ii[k]] * (qcol_ac[dd[k]])**1.5 / tau_ac[dd[k]]
+
+        # Compute warm layer correction dsea for the records of this step
+        ii = idx_warm[sel]
+        k = tk_pwp[ii] < ztmpwat
+        dsea[ii[k]] = dt_wrm[ii[k]]
+        dsea[ii[~k]] = dt_wrm[ii[~k]] * ztmpwat / tk_pwp[ii[~k]]
+
 """
 #...................................................................................
 #...................................................................................
@@ -2967,7 +3237,7 @@ def warmlayer(rain_rate, timestamp, lon, ztmpwat, tC_sea, wnd, zwindsp, tC_air,
 
 
 def coare35vn(tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
-              Rshort_down, Rlong_down, lat, zinvpbl, jcool):
+              Rshort_down, Rlong_down, lat, zinvpbl, jcool, tol=None):
     """
     Description:
 
@@ -2990,7 +3260,7 @@ def coare35vn(tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
 
         (usr, tsr, qsr, ut, dter, dqer, tkt, L, zou, zot, zoq) = coare35vn(
                             tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair,
-                            pr_air, Rshort_down, Rlong_down, lat, zinvpbl, jcool)
+                            pr_air, Rshort_down, Rlong_down, lat, zinvpbl, jcool, tol)
 
             where
 
@@ -3023,6 +3293,10 @@ def coare35vn(tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
             lat = latitude [deg]
             zinvpbl = inversion height; default is 600m [m]
             jcool = switch to activate coolskin algorithm (hardwired to 1 = true)
+            tol = if None (default), the bulk loop is run the hardwired 6 times for
+                  all elements. otherwise the relative tolerance on the change of
+                  usr, tsr and qsr between iterations at which an element is
+                  considered converged (see Notes).
 
     References:
 
@@ -3065,6 +3339,13 @@ def coare35vn(tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
         each data product, and in some cases may expose an inconsistent application of either
         the coolskin or warmlayer corrections to the bulk seasurface temperature when these
         data products are calculated.
+
+        When tol is set, an element leaves the bulk loop after the first iteration in which
+        usr, tsr and qsr each change by no more than tol times their new magnitude (and, for
+        the stable cases k50, after the first iteration, whose solution is their output as
+        in the fixed iteration); the others are iterated at most the hardwired 6 times. Most
+        elements converge within 2 or 3 iterations, so that the later iterations are run on
+        a small subset of the data.
     """
     # convert relative humidity to specific humidity [kg/kg]
     Qsea = sea_spechum(tC_sea, pr_air) / 1000.0          # surface water specific humidity
@@ -3142,6 +3423,14 @@ def coare35vn(tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
     nits = 6  # hardwired number of iterations
 
     #**************  bulk loop ***********************************************
+    if tol is not None:
+        # iterate each element only until it has converged (see Notes).
+        return _coare35vn_converge(
+            tol, nits, k50, von, fdg, Beta, cpa, be, cpw, visw, rhow, tcw, jcool,
+            grav, tK_air, Qair, visa, zwindsp, zhumair, ztmpair, dq, dt, Rns, rhoa,
+            Le, Al, bigc, tC_sea, Qsea, pr_air, Rlong_down, tv, zinvpbl, wnd,
+            usr, tsr, qsr, dter, dqer, tkt, Rnl, ut, charnC)
+
     for ii in range(nits):
 
         L = obukhov_length_scale(von, grav, tK_air, Qair, usr, tsr, qsr)
@@ -3207,6 +3496,91 @@ def coare35vn(tC_sea, wnd, zwindsp, tC_air, ztmpair, relhum, zhumair, pr_air,
 #-------------------------------------------------------------------------
 
 
+#-------------------------------------------------------------------------
+def _coare35vn_converge(tol, nits, k50, von, fdg, Beta, cpa, be, cpw, visw, rhow, tcw,
+                        jcool, grav, tK_air, Qair, visa, zwindsp, zhumair, ztmpair, dq, dt,
+                        Rns, rhoa, Le, Al, bigc, tC_sea, Qsea, pr_air, Rlong_down, tv,
+                        zinvpbl, wnd, usr, tsr, qsr, dter, dqer, tkt, Rnl, ut, charnC):
+    """
+        bulk loop of coare35vn run on the elements that have not converged yet.
+
+        the outputs are written into preallocated arrays as elements converge; the
+        per-element variables of the loop are compressed to the remaining elements.
+    """
+    n = usr.size
+    output = [np.empty(n) for _ in range(11)]
+    active = np.arange(n)
+
+    def compress(values, keep):
+        return [v[keep] if isinstance(v, np.ndarray) and v.size == keep.size else v
+                for v in values]
+
+    for ii in range(nits):
+        usr_prev, tsr_prev, qsr_prev = usr, tsr, qsr
+
+        L = obukhov_length_scale(von, grav, tK_air, Qair, usr, tsr, qsr)
+        zou, zoq, zot = roughness_lengths(charnC, usr, grav, visa)
+
+        usr, qsr, tsr = scaling_parameters(dter, dqer, von, fdg, zwindsp,
+                                           zhumair, ztmpair, zou, zoq, zot, L, ut,
+                                           dq, dt)
+
+        dter, dqer, tkt = coolskin_parameters(usr, qsr, tsr, Rnl, Rns, rhoa, cpa,
+                                              Le, tkt, Al, be, cpw, visw, rhow,
+                                              bigc, tcw, tC_sea, Qsea, pr_air)
+
+        # these coolskin parameters must be reset to 0 if coolskin is off, so:
+        dter = dter * jcool
+        dqer = dqer * jcool
+
+        Rnl = net_longwave_up(tC_sea-dter, Rlong_down)
+
+        ut = effective_relwind(tsr, tK_air, qsr, grav, tv, usr, Beta, zinvpbl, wnd)
+
+        #.. update charnock variable.
+        u10N_for_charnC = usr / von / ut * wnd * np.log(10.0/zou)
+        charnC = charnock_wind(u10N_for_charnC)
+
+        results = (usr, tsr, qsr, ut, dter, dqer, tkt, L, zou, zot, zoq)
+
+        # for stable cases designated by k50 save the results from the
+        # first iteration as the algorithm output.
+        if ii == 0:
+            stable_cases = [res[k50] for res in results]
+            stable = np.zeros(n, dtype=bool)
+            stable[k50] = True
+
+        if ii == nits - 1:
+            done = np.ones(active.size, dtype=bool)
+        else:
+            done = ((np.abs(usr - usr_prev) <= tol * np.abs(usr)) &
+                    (np.abs(tsr - tsr_prev) <= tol * np.abs(tsr)) &
+                    (np.abs(qsr - qsr_prev) <= tol * np.abs(qsr))) | stable
+            # compressing the variables costs about as much as an iteration,
+            # so wait until enough elements have converged.
+            if np.count_nonzero(done) * 8 < active.size:
+                continue
+        for out, res in zip(output, results):
+            out[active[done]] = res[done]
+
+        keep = ~done
+        if not np.any(keep):
+            break
+        active = active[keep]
+        (grav, tK_air, Qair, visa, zwindsp, zhumair, ztmpair, dq, dt, Rns, rhoa, Le, Al,
+            bigc, tC_sea, Qsea, pr_air, Rlong_down, tv, zinvpbl, wnd, usr, tsr, qsr, dter,
+            dqer, tkt, Rnl, ut, charnC, stable) = compress(
+                [grav, tK_air, Qair, visa, zwindsp, zhumair, ztmpair, dq, dt, Rns, rhoa, Le,
+                 Al, bigc, tC_sea, Qsea, pr_air, Rlong_down, tv, zinvpbl, wnd, usr, tsr, qsr,
+                 dter, dqer, tkt, Rnl, ut, charnC, stable], keep)
+
+    # insert first iteration solution for stable cases.
+    for out, res in zip(output, stable_cases):
+        out[k50] = res
+
+    return tuple(output)
+
+
 #-------------------------------------------------------------------------
 def charnock_wind(u10N):
     """
@@ -3570,6 +3944,137 @@ def make_hourly_data(*args):
     return args
 
 
+class HourlyAccumulator(object):
+    """
+    Description:
+
+        Incremental version of make_hourly_data for data arriving in chunks (for
+        example, near real time telemetry). The hourly bins are anchored to the
+        absolute (UTC) hours of the timestamps instead of to the first timestamp,
+        so the bins do not depend on where the data start. The sums and counts of
+        the bins that are still open are kept between calls, and the means of an
+        hour are returned as soon as data from a later hour have been received.
+
+    Usage:
+
+        acc = HourlyAccumulator()
+        for chunk in chunks:
+            args_out = acc.update(*args_in)
+        args_out = acc.flush()
+
+            where
+
+        args_in = argument list of each minute data, laid out as for
+                  make_hourly_data (including the 18 argument bulk flux layout,
+                  in which the sensor heights and switches are passed through).
+        args_out = argument list of hourly data for the hours completed by this
+                   chunk (flush returns the remaining hours and resets the
+                   accumulator). The hourly timestamps are the midpoints of the
+                   hours. Hours without data are not returned.
+
+        The timestamps must be nondecreasing across chunks; data for an hour
+        that has already been returned raise a ValueError.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the open bins; the next update starts a new data set.
+        """
+        self._first_bin = None    # bin number of the first open bin
+        self._last_bin = None     # bin number of the latest datum
+        self._counts = None
+        self._sums = None
+        self._args = None         # last argument list, for the passed through args
+
+    def _layout(self, nargs):
+        number_of_bulk_vars = 18
+        idx_to_skip = [17, 16, 10, 8, 6, 3]
+        idx = range(nargs)
+        if nargs >= number_of_bulk_vars:
+            for ii in idx_to_skip:
+                del idx[ii]
+        # timestamps must be the 2nd variable in the input argument list,
+        # unless there is only 1 variable.
+        index_timedata = np.sign(nargs-1)
+        idx.remove(index_timedata)
+        return index_timedata, idx
+
+    def update(self, *args):
+        args = list(args)
+        index_timedata, idx = self._layout(len(args))
+        time_sec = np.atleast_1d(np.asanyarray(args[index_timedata], dtype=np.float))
+        bin_number = np.floor(time_sec / 3600.0).astype(np.int64)
+
+        if self._args is not None and len(args) != len(self._args):
+            raise ValueError('number of arguments differs from the previous chunks')
+        self._args = args
+        if bin_number.size == 0:
+            return self._emit(0)
+        if self._first_bin is None:
+            self._first_bin = bin_number[0]
+            self._last_bin = bin_number[0]
+            self._counts = np.zeros(0)
+            self._sums = np.zeros((len(idx), 0))
+        if bin_number.min() < self._first_bin:
+            raise ValueError('data received for an hour that has already been returned')
+
+        # grow the open bins to the latest hour and accumulate the chunk
+        self._last_bin = max(self._last_bin, bin_number.max())
+        nbins = self._last_bin - self._first_bin + 1
+        offset = bin_number - self._first_bin
+        self._counts = np.hstack((self._counts, np.zeros(nbins - self._counts.size)))
+        self._counts += np.bincount(offset, minlength=nbins)
+        sums = np.zeros((len(idx), nbins))
+        sums[:, :self._sums.shape[1]] = self._sums
+        for row, ivar in enumerate(idx):
+            values = np.broadcast_to(np.asanyarray(args[ivar], dtype=np.float), time_sec.shape)
+            sums[row] += np.bincount(offset, values, minlength=nbins)
+        self._sums = sums
+
+        # all but the latest hour are complete
+        return self._emit(nbins - 1)
+
+    def flush(self):
+        """
+        Returns the means of the remaining hours and resets the accumulator.
+        """
+        if self._args is None:
+            return []
+        nbins = 0 if self._counts is None else self._counts.size
+        out = self._emit(nbins)
+        self.reset()
+        return out
+
+    def _emit(self, nbins):
+        """
+        Returns the hourly argument list of the first nbins open bins and
+        drops those bins.
+        """
+        args = list(self._args)
+        index_timedata, idx = self._layout(len(args))
+        if self._counts is None:
+            counts = np.zeros(0)
+            sums = np.zeros((len(idx), 0))
+            first_bin = 0
+        else:
+            counts = self._counts[:nbins]
+            sums = self._sums[:, :nbins]
+            first_bin = self._first_bin
+            self._counts = self._counts[nbins:]
+            self._sums = self._sums[:, nbins:]
+            self._first_bin += nbins
+
+        # keep only the hours with data
+        mask = (counts != 0)
+        for row, ivar in enumerate(idx):
+            args[ivar] = sums[row][mask] / counts[mask]
+        args[index_timedata] = (first_bin + np.arange(counts.size)[mask]) * 3600.0 + 1800.0
+
+        return args
+
+
 def warmlayer_time_keys(localdate):
     """
     Description:
@@ -7,6 +7,52 @@
 """
 
 import numpy as np
+from collections import OrderedDict
+
+# Rows of the pseudo-inverse of the nitrate fit design matrix that give the
+# nitrate concentration, keyed by the fitted wavelengths and extinction
+# coefficients, most recently used last. These only change with the
+# calibration, so each is computed once per deployment.
+_nitrate_fit_cache = OrderedDict()
+NITRATE_FIT_CACHE_SIZE = 16
+
+
+def _nitrate_fit_row(WL, ENO3):
+    """
+    Returns the first row of pinv(M), where M = [ENO3, 1/100, WL/1000] is the
+    design matrix of the fit of the nitrate absorbance plus a linear
+    baseline, so that the nitrate concentration is the dot product of this
+    row with the corrected absorbances. Cached across calls.
+    """
+    key = (WL.dtype.str, WL.tostring(), ENO3.dtype.str, ENO3.tostring())
+    row = _nitrate_fit_cache.pop(key, None)
+    if row is None:
+        # ENO3 plus a linear baseline
+        subset_array_size = np.shape(ENO3)
+        # for the constant in the linear baseline
+        Ones = np.ones((subset_array_size[0],), dtype='float64') / 100
+        M = np.vstack((ENO3, Ones, WL / 1000)).T
+        # the pseudo-inverse gives NO3, baseline constant, and slope (vs. WL)
+        row = np.linalg.pinv(M)[0]
+        while len(_nitrate_fit_cache) >= NITRATE_FIT_CACHE_SIZE:
+            _nitrate_fit_cache.popitem(last=False)
+    _nitrate_fit_cache[key] = row
+    return row
+
+
+def _group_rows(sig):
+    """
+    Returns a list of arrays of the indices of the identical rows of the 2-D
+    array sig, one array per distinct row.
+    """
+    if (sig == sig[0]).all():
+        return [np.arange(sig.shape[0])]
+    sig = np.ascontiguousarray(sig)
+    rows = sig.view(np.dtype((np.void, sig.dtype.itemsize * sig.shape[1]))).ravel()
+    _, inverse = np.unique(rows, return_inverse=True)
+    order = np.argsort(inverse, kind='mergesort')
+    splits = np.flatnonzero(np.diff(inverse[order])) + 1
+    return np.split(order, splits)
 
 
 def ts_corrected_nitrate(cal_temp, wl, eno3, eswa, di, dark_value, ctd_t,
@@ -86,8 +132,10 @@ def ts_corrected_nitrate(cal_temp, wl, eno3, eswa, di, dark_value, ctd_t,
             ENO3, ESWA, and DI were originally set up outside the loop. However, with this CI
             change, it is now possible that the cal coefficients could change inside of the
             cal coeff variable arrays (reflecting data coming from two different instruments).
-            I took the conservative approach and moved these calculations inside the loop to
-            be calculated for each data packet.
+            The light frames are therefore grouped by their wavelength bins, ENO3 coefficients
+            and fit limits; useindex, WL, ENO3 and the least squares fit (the pseudo-inverse
+            row of ENO3 plus a linear baseline, cached per calibration) are computed once per
+            group, and ESWA and DI are taken for each data packet of the group.
 
             Fill values on output have been changed to np.nan.
 
@@ -117,6 +165,13 @@ def ts_corrected_nitrate(cal_temp, wl, eno3, eswa, di, dark_value, ctd_t,
     if np.isscalar(wlupper):
         wlupper = np.tile(wlupper, n_data_packets)
 
+    wllower = np.asarray(wllower).reshape(-1)
+    wlupper = np.asarray(wlupper).reshape(-1)
+    cal_temp = np.asarray(cal_temp).reshape(-1)
+    dark_value = np.asarray(dark_value).reshape(-1)
+    ctd_t = np.asarray(ctd_t).reshape(-1)
+    ctd_sp = np.asarray(ctd_sp).reshape(-1)
+
     # coefficients to equation 4 of Sakamoto et al 2009 that give the
     # absorbance of seasalt at 35 salinity versus temperature
     Asak = 1.1500276
@@ -124,56 +179,54 @@ def ts_corrected_nitrate(cal_temp, wl, eno3, eswa, di, dark_value, ctd_t,
     Csak = -0.3101349
     Dsak = 0.001222
 
-    NO3_conc = np.ones(n_data_packets)
-
-    for i in range(0, n_data_packets):
-
-        if frame_type[i] == 'SDB' or frame_type[i] == 'SDF' or frame_type[i] == "NDF":
-
-            ## Ignore and fill dark frame measurements
-            #NO3_conc[i] = -9999999.0
-
-            # change this to output nans instead.
-            NO3_conc[i] = np.nan
-
-        else:
-
-            # Find wavelength bins that fall between the upper and lower
-            # limits for spectra fit
-            useindex = np.logical_and(wllower[i] <= wl[i, :], wl[i, :] <= wlupper[i])
-
-            # subset data so that we only use wavelengths between wllower & wlupper
-            WL = wl[i, useindex]
-            ENO3 = eno3[i, useindex]
-            ESWA = eswa[i, useindex]
-            DI = np.array(di[i, useindex], dtype='float64')
-            SW = np.array(data_in[i, useindex], dtype='float64')
-
-            # correct each SW intensity for dark current
-            SWcorr = SW - dark_value[i]
-
-            # calculate absorbance
-            Absorbance = np.log10(DI / SWcorr)
-
-            # now estimate molar absorptivity of seasalt at in situ temperature
-            # use Satlantic calibration and correct as in Sakamoto et al. 2009.
-            SWA_Ext_at_T = (ESWA * ((Asak + Bsak * ctd_t[i]) / (Asak + Bsak * cal_temp[i]))
-                            * np.exp(Dsak * (ctd_t[i] - cal_temp[i]) * (WL - 210.0)))
-
-            # absorbance due to seasalt
-            A_SWA = ctd_sp[i] * SWA_Ext_at_T
-            # subtract seasalt absorbance from measured absorbance
-            Acomp = np.array(Absorbance - A_SWA, ndmin=2).T
-
-            # ENO3 plus a linear baseline
-            subset_array_size = np.shape(ENO3)
-            # for the constant in the linear baseline
-            Ones = np.ones((subset_array_size[0],), dtype='float64') / 100
-            M = np.vstack((ENO3, Ones, WL / 1000)).T
-
-            # C has NO3, baseline constant, and slope (vs. WL)
-            C = np.dot(np.linalg.pinv(M), Acomp)
-
-            NO3_conc[i] = C[0, 0]
+    # Ignore and fill dark frame measurements with nans
+    NO3_conc = np.ones(n_data_packets) * np.nan
+    light = np.flatnonzero(~np.in1d(frame_type, ['SDB', 'SDF', 'NDF']))
+    if light.size == 0:
+        return NO3_conc
+
+    # The cal coeffs are time-vectorized and may change within a call (data
+    # from two different instruments), so the light frames are grouped by
+    # their wavelength bins, extinction coefficients and fit limits. All the
+    # frames of a group share the same fit, which is solved for all of them
+    # at once.
+    sig = np.column_stack((wl[light], eno3[light], wllower[light], wlupper[light]))
+    for group in _group_rows(sig):
+        rows = light[group]
+        i = rows[0]
+
+        # Find wavelength bins that fall between the upper and lower
+        # limits for spectra fit
+        useindex = np.logical_and(wllower[i] <= wl[i, :], wl[i, :] <= wlupper[i])
+        cols = np.flatnonzero(useindex)
+        subset = np.ix_(rows, cols)
+
+        # subset data so that we only use wavelengths between wllower & wlupper
+        WL = wl[i, useindex]
+        ENO3 = eno3[i, useindex]
+        ESWA = eswa[subset]
+        DI = np.array(di[subset], dtype='float64')
+        SW = np.array(data_in[subset], dtype='float64')
+
+        # correct each SW intensity for dark current
+        SWcorr = SW - dark_value[rows, np.newaxis]
+
+        # calculate absorbance
+        Absorbance = np.log10(DI / SWcorr)
+
+        # now estimate molar absorptivity of seasalt at in situ temperature
+        # use Satlantic calibration and correct as in Sakamoto et al. 2009.
+        T = ctd_t[rows, np.newaxis]
+        T_cal = cal_temp[rows, np.newaxis]
+        SWA_Ext_at_T = (ESWA * ((Asak + Bsak * T) / (Asak + Bsak * T_cal))
+                        * np.exp(Dsak * (T - T_cal) * (WL - 210.0)))
+
+        # absorbance due to seasalt
+        A_SWA = ctd_sp[rows, np.newaxis] * SWA_Ext_at_T
+        # subtract seasalt absorbance from measured absorbance
+        Acomp = Absorbance - A_SWA
+
+        # NO3 from the least squares fit of ENO3 plus a linear baseline
+        NO3_conc[rows] = np.dot(Acomp, _nitrate_fit_row(WL, ENO3))
 
     return NO3_conc
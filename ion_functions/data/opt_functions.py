@@ -7,9 +7,7 @@
 """
 
 import numpy as np
-
-# load the temperature and salinity correction coefficients table
-from ion_functions.data.opt_functions_tscor import tscor
+from collections import OrderedDict
 
 
 # wrapper function to calculate the beam attenuation coefficients (OPTATTN_L2)
@@ -84,41 +82,32 @@ def opt_beam_attenuation(cref, csig, traw, cwl, coff, tcal, tbins, tc_arr,
 
         Variables in the argument list, regardless of the number of dimensions, are assumed
         to be vectorized to contain multiple data packets such that the first dimension
-        iterates over data packet number.
+        iterates over data packet number. All of the packets are processed at once by the
+        *_packets versions of the worker functions.
     """
     # reset shapes of input arguments
     #    using np.array([], ndmin=#) seems faster than using np.atleast_#d
-    cref = np.array(cref, ndmin=2)
-    csig = np.array(csig, ndmin=2)
-    traw = np.array(traw, ndmin=1)
+    cref = np.array(cref, ndmin=2, copy=False)
+    csig = np.array(csig, ndmin=2, copy=False)
+    traw = np.array(traw, ndmin=1, copy=False)
     cwl = np.around(np.array(cwl, ndmin=2), decimals=1)
-    coff = np.array(coff, ndmin=2)
-    tcal = np.array(tcal, ndmin=1)
-    tbins = np.array(tbins, ndmin=2)
-    T = np.array(T, ndmin=1)
-    PS = np.array(PS, ndmin=1)
+    coff = np.array(coff, ndmin=2, copy=False)
+    tcal = np.array(tcal, ndmin=1, copy=False)
+    tbins = np.array(tbins, ndmin=2, copy=False)
+    T = np.array(T, ndmin=1, copy=False)
+    PS = np.array(PS, ndmin=1, copy=False)
     # note, np.atleast_3d appends the extra dimension;
     # np.array using ndmin prepends the extra dimension.
-    tc_arr = np.array(tc_arr, ndmin=3)
-
-    # size up inputs
-    npackets = cwl.shape[0]
-    nwavelengths = cwl.shape[1]
-    # initialize output array
-    cpd_ts = np.zeros([npackets, nwavelengths])
+    tc_arr = np.array(tc_arr, ndmin=3, copy=False)
 
-    for ii in range(npackets):
+    # calculate the internal instrument temperature [deg_C]
+    tintrn = opt_internal_temp(traw)
 
-        # calculate the internal instrument temperature [deg_C]
-        tintrn = opt_internal_temp(traw[ii])
+    # calculate the uncorrected beam attenuation coefficient [m^-1]
+    cpd, _ = opt_pd_calc_packets(cref, csig, coff, tintrn, tbins, tc_arr)
 
-        # calculate the uncorrected beam attenuation coefficient [m^-1]
-        cpd, _ = opt_pd_calc(cref[ii, :], csig[ii, :], coff[ii, :], tintrn,
-                             tbins[ii, :], tc_arr[ii, :, :])
-
-        # correct the beam attenuation coefficient for temperature and salinity.
-        cpd_ts_row = opt_tempsal_corr('c', cpd, cwl[ii, :], tcal[ii], T[ii], PS[ii])
-        cpd_ts[ii, :] = cpd_ts_row
+    # correct the beam attenuation coefficient for temperature and salinity.
+    cpd_ts = opt_tempsal_corr_packets('c', cpd, cwl, tcal, T, PS)
 
     # return the temperature and salinity corrected beam attenuation
     # coefficient OPTATTN_L2 [m^-1]
@@ -200,46 +189,37 @@ def opt_optical_absorption(aref, asig, traw, awl, aoff, tcal, tbins, ta_arr,
 
         Variables in the argument list, regardless of the number of dimensions, are assumed
         to be vectorized to contain multiple data packets such that the first dimension
-        iterates over data packet number.
+        iterates over data packet number. All of the packets are processed at once by the
+        *_packets versions of the worker functions.
     """
     # reset shapes of input arguments
     #    using np.array ndmin=# seems faster than using np.atleast_#d
-    aref = np.array(aref, ndmin=2)
-    asig = np.array(asig, ndmin=2)
-    traw = np.array(traw, ndmin=1)
+    aref = np.array(aref, ndmin=2, copy=False)
+    asig = np.array(asig, ndmin=2, copy=False)
+    traw = np.array(traw, ndmin=1, copy=False)
     awl = np.around(np.array(awl, ndmin=2), decimals=1)
-    aoff = np.array(aoff, ndmin=2)
-    tcal = np.array(tcal, ndmin=1)
-    tbins = np.array(tbins, ndmin=2)
+    aoff = np.array(aoff, ndmin=2, copy=False)
+    tcal = np.array(tcal, ndmin=1, copy=False)
+    tbins = np.array(tbins, ndmin=2, copy=False)
     # note, np.atleast_3d appends the extra dimension;
     # np.array using ndmin prepends the extra dimension.
-    ta_arr = np.array(ta_arr, ndmin=3)
-    cpd_ts = np.array(cpd_ts, ndmin=2)
-    cwl = np.array(cwl, ndmin=2)
-    T = np.array(T, ndmin=1)
-    PS = np.array(PS, ndmin=1)
-
-    # size up inputs
-    npackets = awl.shape[0]
-    nwavelengths = awl.shape[1]
-    # initialize output array
-    apd_ts_s = np.zeros([npackets, nwavelengths])
+    ta_arr = np.array(ta_arr, ndmin=3, copy=False)
+    cpd_ts = np.array(cpd_ts, ndmin=2, copy=False)
+    cwl = np.array(cwl, ndmin=2, copy=False)
+    T = np.array(T, ndmin=1, copy=False)
+    PS = np.array(PS, ndmin=1, copy=False)
 
-    for ii in range(npackets):
+    # calculate the internal instrument temperature [deg_C]
+    tintrn = opt_internal_temp(traw)
 
-        # calculate the internal instrument temperature [deg_C]
-        tintrn = opt_internal_temp(traw[ii])
+    # calculate the uncorrected optical absorption coefficient [m^-1]
+    apd, _ = opt_pd_calc_packets(aref, asig, aoff, tintrn, tbins, ta_arr)
 
-        # calculate the uncorrected optical absorption coefficient [m^-1]
-        apd, _ = opt_pd_calc(aref[ii, :], asig[ii, :], aoff[ii, :], tintrn,
-                             tbins[ii, :], ta_arr[ii, :, :])
+    # correct the optical absorption coefficient for temperature and salinity.
+    apd_ts = opt_tempsal_corr_packets('a', apd, awl, tcal, T, PS)
 
-        # correct the optical absorption coefficient for temperature and salinity.
-        apd_ts = opt_tempsal_corr('a', apd, awl[ii, :], tcal[ii], T[ii], PS[ii])
-
-        # correct the optical absorption coefficient for scattering effects
-        apd_ts_s_row = opt_scatter_corr(apd_ts, awl[ii, :], cpd_ts[ii, :], cwl[ii, :], rwlngth)
-        apd_ts_s[ii, :] = apd_ts_s_row
+    # correct the optical absorption coefficient for scattering effects
+    apd_ts_s = opt_scatter_corr_packets(apd_ts, awl, cpd_ts, cwl, rwlngth)
 
     # return the temperature, salinity and scattering corrected optical
     # absorption coefficient OPTABSN_L2 [m^-1]
@@ -492,8 +472,7 @@ def opt_tempsal_corr(channel, pd, wlngth, tcal, T, PS):
     nValues = np.size(pd)
 
     # apply the temperature and salinity corrections for each wavelength
-    # use a dictionary comprehension to read in only those values required into a np array
-    np_tscor = np.array([tscor[ii] for ii in wlngth])
+    np_tscor = opt_tscor(wlngth)
     dT = T - tcal
     if channel == 'a':
         pd_ts = pd - dT * np_tscor[:, 0] - PS * np_tscor[:, 2]
@@ -597,6 +576,300 @@ def opt_scatter_corr(apd_ts, awlngth, cpd_ts, cwlngth, rwlngth=715.):
     return apd_ts_s
 
 
+# Versions of opt_pd_calc, opt_tempsal_corr and opt_scatter_corr operating on all
+# of the data packets at once. The first dimension of the (2D, or 3D for the
+# internal temperature compensation array) arguments iterates over data packet
+# number; singleton first dimensions are broadcast across the packets.
+def opt_pd_calc_packets(ref, sig, offset, tintrn, tbins, tarray):
+    """
+    Description:
+
+        Vectorized version of opt_pd_calc for multiple data packets.
+
+    Usage:
+
+        pd, deltaT = opt_pd_calc_packets(ref, sig, offset, tintrn, tbins, tarray)
+
+            where
+
+        pd = uncorrected beam attenuation or optical absorption coefficients
+            [m-1], 2D array (npackets, nwavelengths)
+        deltaT = correction due to instrument internal temperature [m-1], 2D
+        ref = raw reference light measurements [counts], 2D
+        sig = raw signal light measurements [counts], 2D
+        offset = clear water offsets [m-1], 2D
+        tintrn = internal instrument temperature [deg_C], 1D
+        tbins = internal temperature calibration bin values [deg_C], 2D
+        tarray = internal temperature calibration correction coefficients [m-1],
+            3D (npackets, nwavelengths, ntempbins)
+    """
+    ref = np.array(ref, ndmin=2, copy=False).astype(np.float)
+    sig = np.array(sig, ndmin=2, copy=False).astype(np.float)
+    offset = np.array(offset, ndmin=2, copy=False)
+    tbins = np.array(tbins, ndmin=2, copy=False)
+    tarray = np.array(tarray, ndmin=3, copy=False)
+    tintrn = np.reshape(tintrn, (-1, 1))
+    if ref.shape[-1] != sig.shape[-1]:
+        raise ValueError('Reference and Signal arrays must be the same length')
+    nValues = sig.shape[-1]
+    if offset.shape[-1] != nValues:
+        raise ValueError('The number of calibration offset channels (%d) from the cal devfile '
+                         'must match the number of Signal and Reference channels (%d) from '
+                         'the rawdata.' % (offset.shape[-1], nValues))
+    if tarray.shape[1] != nValues:
+        raise ValueError('The number of rows in the internal temperature compensation '
+                         'calibration array (%d) must match the number of wavelength '
+                         'channels in the rawdata (%d).' % (tarray.shape[1], nValues))
+    if tarray.shape[2] != tbins.shape[-1]:
+        raise ValueError('Number of columns in the internal temperature compensation '
+                         'calibration array (%d) must match the number of internal temp '
+                         'comp cal bin values = (%d).' % (tarray.shape[2], tbins.shape[-1]))
+
+    npackets = max(ref.shape[0], sig.shape[0], tintrn.shape[0])
+    tbins = np.broadcast_to(tbins, (npackets, tbins.shape[-1]))
+    tarray = np.broadcast_to(tarray, (npackets,) + tarray.shape[1:])
+
+    # find the indexes in the temperature bins corresponding to the values
+    # bracketing the internal temperature of each packet: the last bin below
+    # and the first bin above the internal temperature.
+    below = tbins - tintrn < 0
+    above = tintrn - tbins < 0
+    if not (np.all(np.any(below, axis=1)) and np.all(np.any(above, axis=1))):
+        raise IndexError('internal temperature outside of the temperature calibration bins')
+    ind1 = tbins.shape[1] - 1 - np.argmax(below[:, ::-1], axis=1)
+    ind2 = np.argmax(above, axis=1)
+    packet = np.arange(npackets)
+    T0 = tbins[packet, ind1][:, np.newaxis]    # set first bracketing temperature
+    T1 = tbins[packet, ind2][:, np.newaxis]    # set second bracketing temperaure
+
+    # Calculate the linear temperature correction.
+    dT0 = tarray[packet, :, ind1]
+    dT1 = tarray[packet, :, ind2]
+    deltaT = dT0 + ((tintrn - T0) / (T1 - T0)) * (dT1 - dT0)
+
+    # Calculate the uncorrected signal [m-1]; the pathlength is 0.25m.
+    # Apply the corrections for the clean water offsets (offset) and
+    # the instrument's internal temperature (deltaT).
+    pd = (offset - (1./0.25) * np.log(sig/ref)) - deltaT
+
+    return pd, deltaT
+
+
+def opt_tempsal_corr_packets(channel, pd, wlngth, tcal, T, PS):
+    """
+    Description:
+
+        Vectorized version of opt_tempsal_corr for multiple data packets.
+
+    Usage:
+
+        pd_ts = opt_tempsal_corr_packets(channel, pd, wlngth, tcal, T, PS)
+
+            where
+
+        pd_ts = temperature and salinity corrected data [m-1], 2D array
+            (npackets, nwavelengths)
+        channel = 'c' (beam attenuation) or 'a' (absorption)
+        pd = uncorrected absorption or attenuation data [m-1], 2D
+        wlngth = wavelengths at which measurements were made [nm], 2D
+        tcal = factory calibration reference temperature [deg_C], 1D
+        T  = TEMPWAT(L1): In situ temperature from co-located CTD [deg_C], 1D
+        PS = PRACSAL(L2): In situ practical salinity from co-located CTD, 1D
+    """
+    pd = np.array(pd, ndmin=2, copy=False)
+    wlngth = np.array(wlngth, ndmin=2, copy=False)
+    if pd.shape[-1] != wlngth.shape[-1]:
+        raise ValueError('pd and wavelength arrays must be the same length')
+    if channel == 'a':
+        col = 2
+    elif channel == 'c':
+        col = 1
+    else:
+        raise ValueError('Channel must be either "a" or "c"')
+
+    # look up the temperature and salinity corrections; when all of the packets
+    # have the same wavelengths, those of the wavelength set are cached.
+    if np.all(wlngth == wlngth[0]):
+        np_tscor = opt_tscor(wlngth[0])
+    else:
+        np_tscor = opt_tscor(wlngth)
+
+    dT = np.reshape(T, (-1, 1)) - np.reshape(tcal, (-1, 1))
+    PS = np.reshape(PS, (-1, 1))
+    pd_ts = pd - dT * np_tscor[..., 0] - PS * np_tscor[..., col]
+
+    return pd_ts
+
+
+def opt_scatter_corr_packets(apd_ts, awlngth, cpd_ts, cwlngth, rwlngth=715.):
+    """
+    Description:
+
+        Vectorized version of opt_scatter_corr for multiple data packets.
+
+    Usage:
+
+        apd_ts_s = opt_scatter_corr_packets(apd_ts, awlngth, cpd_ts, cwlngth[, rwlngth])
+
+            where
+
+        apd_ts_s = optical absorption coefficient corrected for temperature,
+            salinity, and light scattering effects (OPTABSN_L2) [m-1], 2D array
+            (npackets, nwavelengths)
+        apd_ts = T/S corrected optical absorption coefficient [m-1], 2D
+        awlngth = absorption channel wavelengths [nm], 2D
+        cpd_ts = T/S corrected beam attenuation coefficient [m-1], 2D
+        cwlngth = attenuation channel wavelengths [nm], 2D
+        rwlngth = scattering correction reference wavelength (default = 715) [nm]
+    """
+    apd_ts = np.array(apd_ts, ndmin=2, copy=False)
+    awlngth = np.array(awlngth, ndmin=2, copy=False)
+    if apd_ts.shape[-1] != awlngth.shape[-1]:
+        raise ValueError('Absorption and absorption wavelength arrays must ',
+                         'be the same length')
+    cpd_ts = np.array(cpd_ts, ndmin=2, copy=False)
+    cwlngth = np.array(cwlngth, ndmin=2, copy=False)
+    if cpd_ts.shape[-1] != cwlngth.shape[-1]:
+        raise ValueError('Attenuation and attenuation wavelength arrays must ',
+                         'be the same length')
+
+    npackets = max(apd_ts.shape[0], awlngth.shape[0], cpd_ts.shape[0], cwlngth.shape[0])
+    apd_ts = np.broadcast_to(apd_ts, (npackets, apd_ts.shape[1]))
+    awlngth = np.broadcast_to(awlngth, (npackets, awlngth.shape[1]))
+    cpd_ts = np.broadcast_to(cpd_ts, (npackets, cpd_ts.shape[1]))
+    cwlngth = np.broadcast_to(cwlngth, (npackets, cwlngth.shape[1]))
+    packet = np.arange(npackets)
+
+    # find the the 'a' channel wavelength closest to the reference wavelength
+    # for scattering and set the 'a' scattering reference value.
+    idx = (np.abs(awlngth-rwlngth)).argmin(axis=1)
+    aref = apd_ts[packet, idx]
+
+    # interpolate the 'c' channel cpd_ts values to match the 'a' channel
+    # wavelengths and set the 'c' scattering reference value.
+    cintrp = _interp_packets(awlngth, cwlngth, cpd_ts)
+    cref = cintrp[packet, idx]
+
+    # trap out potential problems in scat_ratio calculation:
+    # scat_ratio = aref / (cref - aref).
+    # aref must be > 0 AND scat_ratio must be > 0; else, scat_ratio = 0.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scat_ratio = aref / (cref - aref)
+    scat_ratio[cref - aref <= 0.0] = 0.
+    scat_ratio[aref <= 0.0] = 0.
+
+    # apply the scattering corrections
+    apd_ts_s = apd_ts - scat_ratio[:, np.newaxis] * (cintrp - apd_ts)
+    return apd_ts_s
+
+
+def _interp_packets(x, xp, fp):
+    """
+    np.interp of each row of fp, sampled at xp, at the corresponding row of x.
+    The interpolation indices and weights are calculated once for each distinct
+    pair of x and xp rows (typically, one for all of the packets) and the rows
+    of fp are interpolated together, using the arithmetic of np.interp.
+    """
+    if np.all(x == x[0]) and np.all(xp == xp[0]):
+        first, group = [0], np.zeros(x.shape[0], dtype=int)
+    else:
+        rows = np.ascontiguousarray(np.hstack((x, xp)))
+        rows = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1])))
+        _, first, group = np.unique(rows.ravel(), return_index=True, return_inverse=True)
+
+    out = np.empty(x.shape)
+    nxp = xp.shape[1]
+    for g, row in enumerate(first):
+        members = np.nonzero(group == g)[0]
+        xrow = x[row]
+        xprow = xp[row]
+        f = fp[members]
+        # index of the last sample at or below each x
+        j = np.searchsorted(xprow, xrow, side='right') - 1
+        jc = np.clip(j, 0, max(nxp - 2, 0))
+        jn = np.minimum(jc + 1, nxp - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (f[:, jn] - f[:, jc]) / (xprow[jn] - xprow[jc])
+            res = slope * (xrow - xprow[jc]) + f[:, jc]
+            # if we get nan in one direction, try the other
+            other = slope * (xrow - xprow[jn]) + f[:, jn]
+        res = np.where(np.isnan(res), other, res)
+        res = np.where(np.isnan(res) & (f[:, jc] == f[:, jn]), f[:, jc], res)
+        # samples at the sample points, and beyond either end
+        at_j = (j >= 0) & ((j == nxp - 1) | (xprow[np.maximum(j, 0)] == xrow))
+        res[:, at_j] = f[:, j[at_j]]
+        res[:, xrow < xprow[0]] = f[:, :1]
+        res[:, xrow > xprow[-1]] = f[:, -1:]
+        out[members] = res
+    return out
+
+
+# temperature and salinity correction coefficients on a 0.1 nm wavelength grid,
+# as (first grid wavelength, 2D array), loaded by opt_tscor on first use.
+_tscor_table = None
+# coefficients of recently used wavelength sets
+_tscor_cache = OrderedDict()
+TSCOR_CACHE_SIZE = 16
+
+
+def opt_tscor(wlngth):
+    """
+    Description:
+
+        Returns the temperature and salinity correction coefficients of the
+        wavelengths wlngth. The coefficients of ion_functions.data.opt_functions_tscor
+        are read into an array on a 0.1 nm wavelength grid the first time they are
+        needed, and the wavelengths are converted into grid indices arithmetically.
+        The coefficients of 1D wavelength sets (the wavelengths of an instrument)
+        are cached.
+
+    Usage:
+
+        np_tscor = opt_tscor(wlngth)
+
+            where
+
+        np_tscor = array of shape wlngth.shape + (3,) of the temperature correction
+            coefficients, the salinity correction coefficients for the 'c' channel
+            and the salinity correction coefficients for the 'a' channel. These are
+            nan outside of the wavelength range of the empirically derived
+            corrections.
+        wlngth = wavelengths [nm], rounded to tenths. A wavelength that is not a
+            tenth of a nm, or is outside of the table, raises a KeyError.
+    """
+    global _tscor_table
+    wlngth = np.asanyarray(wlngth, dtype=np.float)
+    if wlngth.ndim == 1:
+        key = wlngth.tostring()
+        np_tscor = _tscor_cache.pop(key, None)
+        if np_tscor is not None:
+            _tscor_cache[key] = np_tscor
+            return np_tscor
+
+    if _tscor_table is None:
+        from ion_functions.data.opt_functions_tscor import tscor
+        keys = np.array(sorted(tscor.keys()))
+        table = np.zeros((int(round((keys[-1] - keys[0]) * 10.)) + 1, 3)) + np.nan
+        table[np.rint((keys - keys[0]) * 10.).astype(int)] = [tscor[k] for k in keys]
+        table.flags.writeable = False
+        _tscor_table = (keys[0], table)
+    wlngth0, table = _tscor_table
+
+    scaled = (wlngth - wlngth0) * 10.
+    idx = np.rint(scaled).astype(int)
+    bad = ~((np.abs(scaled - idx) < 1.e-6) & (idx >= 0) & (idx < table.shape[0]))
+    if np.any(bad):
+        raise KeyError(wlngth[bad].flat[0])
+    np_tscor = table[idx]
+
+    if wlngth.ndim == 1:
+        np_tscor.flags.writeable = False
+        _tscor_cache[key] = np_tscor
+        if len(_tscor_cache) > TSCOR_CACHE_SIZE:
+            _tscor_cache.popitem(last=False)
+    return np_tscor
+
+
 # The next 2 functions are not used in calculating optical absorption and beam attenuation
 # coefficients from the OPTAA family of instruments. However, some of these instruments
 # may be outfitted with an auxiliary pressure sensor and/or external temperature sensor.
@@ -13,11 +13,12 @@ from ion_functions.data import adcp_functions as af
 
 # Note, the VADCP related data products use the same internal functions as the
 # family of beam wrapper functions (e.g. adcp_beam_eastward). Thus, those
-# functions won't be added to this test. The only way to really speed this
-# process up any further is to set the wrapper functions to return all the data
-# products for an instrument at once rather than singly. That way the functions
-# only need to be run once rather than 4 times for each instrument (a factor of
-# four improvement in performance).
+# functions won't be added to this test. adcp_beam_all (and vadcp_beam_all)
+# return all the data products for an instrument at once rather than singly,
+# and the single product wrappers share their coordinate transforms and
+# magnetic declinations through a memo of the most recent inputs. As the
+# profiler runs a function repeatedly on the same inputs, the tests clear the
+# memo before each run, so that they time the computations.
 
 
 @attr('PERF', group='func')
@@ -77,7 +78,11 @@ class TestADCPPerformance(PerformanceTestCase):
         z = np.repeat(self.depth, 10000)
         dt = np.repeat(self.ntp, 10000)
 
-        self.profile(stats, af.adcp_beam_eastward, b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
+        def beam_eastward(*args):
+            af.clear_adcp_memo()
+            return af.adcp_beam_eastward(*args)
+
+        self.profile(stats, beam_eastward, b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
 
     def test_adcp_beam_northward(self):
         stats = []
@@ -96,7 +101,11 @@ class TestADCPPerformance(PerformanceTestCase):
         z = np.repeat(self.depth, 10000)
         dt = np.repeat(self.ntp, 10000)
 
-        self.profile(stats, af.adcp_beam_northward, b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
+        def beam_northward(*args):
+            af.clear_adcp_memo()
+            return af.adcp_beam_northward(*args)
+
+        self.profile(stats, beam_northward, b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
 
     def test_adcp_beam_vertical(self):
         stats = []
@@ -111,7 +120,11 @@ class TestADCPPerformance(PerformanceTestCase):
         r = np.repeat(self.roll, 10000)
         vf = np.repeat(self.orient, 10000)
 
-        self.profile(stats, af.adcp_beam_vertical, b1, b2, b3, b4, h, p, r, vf)
+        def beam_vertical(*args):
+            af.clear_adcp_memo()
+            return af.adcp_beam_vertical(*args)
+
+        self.profile(stats, beam_vertical, b1, b2, b3, b4, h, p, r, vf)
 
     def test_adcp_beam_error(self):
         stats = []
@@ -123,6 +136,56 @@ class TestADCPPerformance(PerformanceTestCase):
 
         self.profile(stats, af.adcp_beam_error, b1, b2, b3, b4)
 
+    def test_adcp_beam_products(self):
+        stats = []
+
+        b1 = np.tile(self.b1, (10000, 1))
+        b2 = np.tile(self.b2, (10000, 1))
+        b3 = np.tile(self.b3, (10000, 1))
+        b4 = np.tile(self.b4, (10000, 1))
+
+        h = np.repeat(self.heading, 10000)
+        p = np.repeat(self.pitch, 10000)
+        r = np.repeat(self.roll, 10000)
+        vf = np.repeat(self.orient, 10000)
+        lat = np.repeat(self.lat, 10000)
+        lon = np.repeat(self.lon, 10000)
+        z = np.repeat(self.depth, 10000)
+        dt = np.repeat(self.ntp, 10000)
+
+        # the 4 single product wrappers called back-to-back
+        def products(*args):
+            af.clear_adcp_memo()
+            af.adcp_beam_eastward(*args)
+            af.adcp_beam_northward(*args)
+            af.adcp_beam_vertical(*args[:8])
+            af.adcp_beam_error(*args[:4])
+
+        self.profile(stats, products, b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
+
+    def test_adcp_beam_all(self):
+        stats = []
+
+        b1 = np.tile(self.b1, (10000, 1))
+        b2 = np.tile(self.b2, (10000, 1))
+        b3 = np.tile(self.b3, (10000, 1))
+        b4 = np.tile(self.b4, (10000, 1))
+
+        h = np.repeat(self.heading, 10000)
+        p = np.repeat(self.pitch, 10000)
+        r = np.repeat(self.roll, 10000)
+        vf = np.repeat(self.orient, 10000)
+        lat = np.repeat(self.lat, 10000)
+        lon = np.repeat(self.lon, 10000)
+        z = np.repeat(self.depth, 10000)
+        dt = np.repeat(self.ntp, 10000)
+
+        def beam_all(*args):
+            af.clear_adcp_memo()
+            return af.adcp_beam_all(*args)
+
+        self.profile(stats, beam_all, b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
+
     def test_adcp_earth_eastward(self):
         stats = []
 
@@ -134,7 +197,11 @@ class TestADCPPerformance(PerformanceTestCase):
         z = np.repeat(self.depth, 10000)
         dt = np.repeat(self.ntp, 10000)
 
-        self.profile(stats, af.adcp_earth_eastward, u, v, z, lat, lon, dt)
+        def earth_eastward(*args):
+            af.clear_adcp_memo()
+            return af.adcp_earth_eastward(*args)
+
+        self.profile(stats, earth_eastward, u, v, z, lat, lon, dt)
 
     def test_adcp_earth_northward(self):
         stats = []
@@ -147,7 +214,11 @@ class TestADCPPerformance(PerformanceTestCase):
         z = np.repeat(self.depth, 10000)
         dt = np.repeat(self.ntp, 10000)
 
-        self.profile(stats, af.adcp_earth_northward, u, v, z, lat, lon, dt)
+        def earth_northward(*args):
+            af.clear_adcp_memo()
+            return af.adcp_earth_northward(*args)
+
+        self.profile(stats, earth_northward, u, v, z, lat, lon, dt)
 
     def test_adcp_earth_vertical(self):
         stats = []
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+"""
+@package ion_functions.perf.test_met_performance
+@file ion_functions/perf/test_met_performance.py
+@brief Performance tests for met_functions module
+"""
+
+from ion_functions.data.perf.test_performance import PerformanceTestCase
+from ion_functions.data import met_functions as mb
+import numpy as np
+
+
+class TestMETPerformance(PerformanceTestCase):
+
+    def setUp(self):
+        # a year of hourly data with a daily cycle of solar heating
+        n = 24 * 365
+        rng = np.random.RandomState(0)
+        t = np.arange(n) / 24.0
+        timestamp = 3597523200.0 + 3600.0 * np.arange(n)  # 2014-01-01
+        lon = np.zeros(n) - 125.0
+        self.args = (np.zeros(n) + rng.rand(n) * (rng.rand(n) > 0.9),  # rain_rate
+                     timestamp, lon, 0.5,
+                     20.0 + np.sin(2 * np.pi * t) + 0.1 * rng.randn(n),   # tC_sea
+                     2.0 + 3.0 * rng.rand(n), 4.1,                         # wnd, zwindsp
+                     18.0 + np.sin(2 * np.pi * t), 3.0,                    # tC_air, ztmpair
+                     80.0 + 5.0 * rng.rand(n), 3.0,                        # relhum, zhumair
+                     1013.0 + rng.randn(n),                                # pr_air
+                     np.maximum(0.0, 900.0 * np.sin(2 * np.pi * (t + lon / 360.0 - 0.25))),
+                     380.0 + rng.randn(n),                                 # Rlong_down
+                     np.zeros(n) + 45.0, np.zeros(n) + 600.0, 1)           # lat, zinvpbl, jcool
+
+    def test_warmlayer(self):
+        stats = []
+
+        # the record by record loop is the reference
+        xpctd = mb.warmlayer(*self.args, by_day=False)
+        calc = mb.warmlayer(*self.args, by_day=True)
+        for x, c in zip(xpctd, calc):
+            np.testing.assert_array_equal(c, x)
+
+        self.profile(stats, mb.warmlayer, *self.args)
+
+    def test_coare35vn(self):
+        stats = []
+        self.profile(stats, mb.coare35vn, *self.args[4:])
+
+    def test_coare35vn_tol(self):
+        stats = []
+        self.profile(stats, mb.coare35vn, *self.args[4:], tol=1.e-3)
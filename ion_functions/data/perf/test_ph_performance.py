@@ -112,3 +112,24 @@ class TestPHPerformance(PerformanceTestCase):
         # test the function
         self.profile(stats, ph_calc_phwater, ref, light, therm, ea434, eb434,
                      ea578, eb578, ind_slp, ind_off)
+
+    def test_ph_calc_phwater_batch(self):
+        stats = []
+
+        # create 100000 data points, cycling through the 6 test records
+        nRec = 100000
+        idx = np.arange(nRec) % 6
+        light = self.light[idx]
+        ref = self.ref[idx]
+        therm = ph_thermistor(self.traw[idx])
+
+        ea434 = np.ones(nRec) * self.ea434
+        eb434 = np.ones(nRec) * self.eb434
+        ea578 = np.ones(nRec) * self.ea578
+        eb578 = np.ones(nRec) * self.eb578
+        ind_slp = np.ones(nRec) * self.ind_slp
+        ind_off = np.ones(nRec) * self.ind_off
+
+        # test the function
+        self.profile(stats, ph_calc_phwater, ref, light, therm, ea434, eb434,
+                     ea578, eb578, ind_slp, ind_off)
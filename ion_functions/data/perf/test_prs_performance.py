@@ -8,7 +8,7 @@
 """
 
 from nose.plugins.attrib import attr
-from ion_functions.data.perf.test_performance import PerformanceTestCase
+from ion_functions.data.perf.test_performance import PerformanceTestCase, a_year
 from ion_functions.data import prs_functions as pf
 import numpy as np
 
@@ -71,3 +71,17 @@ class TestPRSPerformance(PerformanceTestCase):
 
         # time it
         self.profile(stats, pf.prs_bottilt_tdir, xtilt, ytilt, ccmp)
+
+    def test_prs_botsflu_all(self):
+        stats = []
+
+        # a year of 1 Hz bottom pressure data from 2014-01-01, the start of the
+        # tide table, with a daily data gap of 10 minutes. the year has the
+        # same number of 15 sec and 24 hr bins as a year of 20 Hz data.
+        timestamp = 3597523200.0 + np.arange(a_year) + 0.525
+        timestamp = timestamp[timestamp % 86400.0 >= 600.0]
+        depth = -1510.85 - 0.002 * np.sin(timestamp / 12.42 / 3600.0 * 2 * np.pi)
+        botpres = np.around(depth / -0.67, decimals=4)
+
+        # time it
+        self.profile(stats, pf.prs_botsflu_all, timestamp, botpres)
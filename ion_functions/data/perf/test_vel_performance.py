@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 
-from ion_functions.data.perf.test_performance import PerformanceTestCase, a_day
+from ion_functions.data.perf.test_performance import PerformanceTestCase, a_day, a_week
 from ion_functions.data.vel_functions import nobska_mag_corr_east, nobska_mag_corr_north
 from ion_functions.data.vel_functions import nortek_mag_corr_east, nortek_mag_corr_north
 from ion_functions.data.vel_functions import vel3dk_east, vel3dk_north
-from ion_functions.data.generic_functions import magnetic_declination, magnetic_correction
+from ion_functions.data.generic_functions import magnetic_declination, magnetic_rotation
 
 import numpy as np
 
@@ -106,16 +106,25 @@ class TestVelPerformance(PerformanceTestCase):
         self.profile(
             stats, magnetic_declination, self.lat, self.lon, self.ts, 3)
 
+    def test_magnetic_declination_week(self):
+        """
+        Performance test for the magnetic_declination function over a week
+        of 1 Hz data from a fixed platform.
+        """
+        stats = []
+        ts = 3319563600 + np.arange(a_week, dtype=np.float)
+        self.profile(
+            stats, magnetic_declination, 14.6846, -51.044, ts, 3)
+
     def test_magnetic_correction(self):
         """
-        Performance test for the magnetic_correction function for the
-        correcting vectors for magnetic declination, used in multiple
-        data product algorithms.
+        Performance test for the magnetic_rotation function, the kernel
+        correcting vectors for magnetic declination in multiple data
+        product algorithms, on whole arrays.
         """
         stats = []
         theta = magnetic_declination(self.lat, self.lon, self.ts, 3)
-        magcor = np.vectorize(magnetic_correction)
-        self.profile(stats, magcor, theta, self.ve, self.vn)
+        self.profile(stats, magnetic_rotation, theta, self.ve, self.vn)
 
 
 class TestVel3dkPerformance(PerformanceTestCase):
@@ -10,6 +10,7 @@
 import numpy as np
 import numexpr as ne
 import scipy as sp
+from ion_functions.utils import rolling_window
 
 
 # functions to extract L0 parameters from SAMI-II pH instruments (PHSEN)
@@ -203,28 +204,25 @@ def ph_calc_phwater(ref, light, therm, ea434, eb434, ea578, eb578, ind_slp, ind_
     Y = pointph[:, 5:]
     X = np.linspace(1, 18, 18)
 
-    # create arrays for vectorized computations used in sum of squares below.
-    # reflows 1D and 2D arrays into 2D and 3D arrays, respectively, shifting
-    # each "row" of the arrays by one value, allowing the sum of square
-    # calculations to be computed in a vectorized fashion, replacing the for
-    # loop that had the computations running on 1:8, 2:9, ... 11:18.
+    # compute the sums of squares over the sliding windows of 8 points (1:8,
+    # 2:9, ... 11:18) for all records at once. The sums over each window are
+    # the differences of the cumulative sums at its ends.
     step = 7  # number of points to use
     count = step + 1
-    nPts = np.size(X) - step
-    x = np.zeros((nPts, count))
-    y = np.zeros((nRec, nPts, count))
-    for i in range(nPts):
-        x[i, :] = X[i:i+count]
-        for j in range(nRec):
-            y[j, i, :] = Y[j, i:i+count]
+    x = rolling_window(X, count)
+
+    def window_sums(a):
+        csum = np.cumsum(a, axis=-1)
+        csum = np.concatenate((np.zeros(a.shape[:-1] + (1,)), csum), axis=-1)
+        return csum[..., count:] - csum[..., :-count]
 
     # compute the range of best fitting points, using array multiplications to
     # determine the best fit via the correlation coefficient.
     sumx = np.sum(x, axis=1)
-    sumy = np.sum(y, axis=2)
-    sumxy = np.sum(x * y, axis=2)
+    sumy = window_sums(Y)
+    sumxy = window_sums(X * Y)
     sumx2 = np.sum(x**2, axis=1)
-    sumy2 = np.sum(y**2, axis=2)
+    sumy2 = window_sums(Y**2)
     sumxx = sumx * sumx
     sumyy = sumy * sumy
     ssxy = sumxy - (sumx * sumy) / count
@@ -234,14 +232,11 @@ def ph_calc_phwater(ref, light, therm, ea434, eb434, ea578, eb578, ind_slp, ind_
 
     # Range of seawater points to use
     cutoff1 = np.argmax(r2, axis=1)  # Find the first, best R-squared value
-    cutoff2 = cutoff1 + count
+    cutoff1 = np.reshape(cutoff1, (nRec, 1, 1))
 
     # Indicator and pH range limited to best points
-    IndConcS = np.zeros((nRec, count))
-    pointphS = np.zeros((nRec, count))
-    for i in range(nRec):
-        IndConcS[i, :] = IndConca[i, cutoff1[i]:cutoff2[i]]
-        pointphS[i, :] = Y[i, cutoff1[i]:cutoff2[i]]
+    IndConcS = np.take_along_axis(rolling_window(IndConca, count), cutoff1, axis=1)[:, 0, :]
+    pointphS = np.take_along_axis(rolling_window(Y, count), cutoff1, axis=1)[:, 0, :]
 
     # ************************* Final pH Calcs *************************
     sumx = np.sum(IndConcS, axis=1)
@@ -262,6 +257,6 @@ def ph_calc_phwater(ref, light, therm, ea434, eb434, ea578, eb578, ind_slp, ind_
     # pH corrections due to indicator impurity if the calculated pH is greater
     # than 8.2.
     phFlag = ph >= 8.2
-    ph[phFlag] = ph[phFlag] * ind_slp + ind_off
+    ph[phFlag] = ph[phFlag] * ind_slp[phFlag, 0] + ind_off[phFlag, 0]
 
     return ph
@@ -9,7 +9,7 @@ cdef extern from "polycals.h":
     ctypedef struct coeff_vector:
         size_t N
         double *coeff
-    size_t c_polycal "polycal" (double *out, coeff_vector *cals, double *cal_t, size_t cal_len, double *x, double *t, size_t x_len)
+    size_t c_polycal "polycal" (double *out, coeff_vector *cals, double *cal_t, size_t cal_len, double *x, double *t, size_t x_len) nogil
 
 
 cdef class CoeffVector:
@@ -59,8 +59,15 @@ def polycal(coefficients, calibration_times, x, times):
     cdef np.ndarray[double] ix = x
     cdef np.ndarray[double] itimes = times
     cdef np.ndarray[double] out = np.zeros(x.shape, dtype=np.float)
-
-    c_polycal(&out[0], v.data, &cal_t[0], cal_t.shape[0], &ix[0], &itimes[0], x.shape[0])
+    cdef size_t cal_len = cal_t.shape[0]
+    cdef size_t x_len = x.shape[0]
+    cdef double *outp = &out[0]
+    cdef double *cal_tp = &cal_t[0]
+    cdef double *ixp = &ix[0]
+    cdef double *itimesp = &itimes[0]
+
+    with nogil:
+        c_polycal(outp, v.data, cal_tp, cal_len, ixp, itimesp, x_len)
 
     return out
 
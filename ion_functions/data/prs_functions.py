@@ -7,9 +7,14 @@
     Pressure family.
 """
 
+import os
+import pkg_resources
+import tempfile
+import threading
 import numexpr as ne
 import numpy as np
 import scipy as sp
+import scipy.io
 from scipy import signal
 
 
@@ -45,15 +50,30 @@ from scipy import signal
         prs_eruption_imminent -- event notification specified by DPS
         prs_eruption_occurred -- event notification specified by DPS
 
+    Functions calculating all of the data products and event notifications.
+
+      BOTSFLU:
+
+        prs_botsflu_all -- computes all of the BOTSFLU data products and event notifications
+        BotsfluStream -- computes them incrementally from chunks of 20 Hz data
+
     Worker functions called by functions calculating data products.
 
+      BOTTILT
+
+        ccmp_table
+
       BOTSFLU
 
         anchor_bin
         calc_daydepth_plus
         calc_meandepth_plus
+        calc_5minrate
+        calc_10minrate
+        calc_wkrate
         calculate_sliding_means
         calculate_sliding_slopes
+        load_tide_table
 """
 
 
@@ -90,63 +110,28 @@ def prs_bottilt_ccmp(scmp, sn):
             >> Controlled >> 1000 System Level >>
             1341-00060_Data_Product_SPEC_BOTTILT_OOI.pdf)
     """
-
-    """
-        Currently, there are two coded algorithms:
-            (1) the straightforward original, which uses a two-element keyed dictionary;
-            (2) a faster version, which uses serial number keys to the dictionary.
-
-        Since each algorithm uses its own dictionary, the corresponding import statements
-            are TEMPORARILY placed at the beginning of their respective code sections
-            instead of at module top.
-    """
-    ###  Original coding, using a dictionary constructed with 2-element keys.
-
-    # load the corrected compass directions table [(sn, scmp) keys]
-    from ion_functions.data.prs_functions_ccmp import cmp_lookup
-
-    # use the lookup table to get the ccmp
-    ccmp = np.zeros(len(scmp))
-
-    for i in range(len(scmp)):
-        ccmp[i] = cmp_lookup[(sn[i], int(round(scmp[i])))]
+    # the corrected compass directions table, with a row for each serial number
+    # and a column for each integral sensor compass direction.
+    sernum_rows, table = ccmp_table()
+
+    # round the uncorrected compass values to the nearest integer as specified in the DPS,
+    # which uses a lookup table consisting of integral values to do the correction. halves
+    # are rounded away from zero, as the builtin round does.
+    scmp = np.asanyarray(scmp, dtype=np.float)
+    column = np.sign(scmp) * np.floor(np.abs(scmp) + 0.5)
+    if np.any(~((column >= 0) & (column <= 360))):
+        raise ValueError('sensor compass direction outside of the range 0 to 360 degrees')
+
+    # map the serial numbers onto table rows; a record typically holds few serial numbers,
+    # so only the unique ones are looked up.
+    sn = np.asanyarray(sn)
+    sernums, inverse = np.unique(sn, return_inverse=True)
+    row = np.array([sernum_rows[sernum] for sernum in sernums], dtype=int)[inverse]
+
+    ccmp = table[row.reshape(sn.shape), column.astype(int)]
     return ccmp
 
 
-    ####  Faster coding, using a dictionary constructed with 1-element keys.
-    #
-    ## load the corrected compass directions table [sn keys]
-    #from ion_functions.data.prs_functions_ccmp_lily_compass_cals import cmp_cal
-    #
-    ## initialize output array for vectorized masking operations. this will 'break'
-    ##    the code if an invalid serial number is specified in the argument list.
-    #ccmp = np.zeros(len(scmp)) + np.nan
-    #
-    ## round the uncorrected compass values to the nearest integer as specified in the DPS,
-    ##    which uses a lookup table consisting of integral values to do the correction.
-    #scmp = np.round(scmp)
-    #
-    ## find the supported tilt sensor serial numbers, which are keys in the dictionary
-    #sernum = cmp_cal.keys()
-    #
-    #for ii in range(len(sernum)):
-    #    # get the cal coeffs as a function of the iterated serial number;
-    #    #    x is the raw, uncorrected reading (scmp)
-    #    #    y is the corrected reading (ccmp)
-    #    [x, y] = cmp_cal[sernum[ii]]
-    #
-    #    # the boolean mask has 'true' entries where the elements of input vector sn
-    #    #    agree with the iterated serial number.
-    #    # np.core.defchararray.equal handles vector string comparisons.
-    #    mask = np.core.defchararray.equal(sn, sernum[ii])
-    #
-    #    ## np.interp is used to do the 'lookup' for performance reasons (vectorized)
-    #    ccmp[mask] = np.interp(scmp[mask], x, y)
-    #
-    ## round to make sure we get an integral value (but not int type)
-    #return np.round(ccmp)
-
-
 def prs_bottilt_tmag(x_tilt, y_tilt):
     """
     Description:
@@ -356,6 +341,7 @@ def prs_botsflu_predtide(time):
     Notes:
 
         Lookup table in binary file: 'ion_functions/data/prs_functions_tides_2014_thru_2019.mat'
+        (read through load_tide_table, which memory-maps a .npy copy of the table).
 
         The lookup table contains tide values every 15 seconds from 2014-01-01 to 2020-01-01
         at lat = 45.95547 lon = -130.00957 calculated by the Tide Model Driver software
@@ -377,28 +363,18 @@ def prs_botsflu_predtide(time):
     """
     time0 = 3597523200.0  # midnight, 2014-01-01
     time_interval = 15.0  # seconds
+    tidefile = 'prs_functions_tides_2014_thru_2019.mat'
 
     # for unit test data, only, feb-apr 2011
     if time[0] < time0:
         time0 = 3502828800.0  # midnight, 2011-01-01
-        # tide values are signed 4 byte integers, units [0.001mm]
-        matpath = 'ion_functions/data/matlab_scripts/botpt/'
-        dict_tides = sp.io.loadmat(matpath + 'tides_15sec_2011_for_unit_tests.mat')
-        tidevector = 0.000001 * dict_tides['tides_mat']
-        tidevector = tidevector.reshape((-1))
-        # calculate tide vector index as a function of timestamp
-        idx = np.around((time - time0)/time_interval)
-        tide = tidevector[idx.astype(int)]
-        return tide
-
-    # else, OOI data from 2014 onwards
+        tidefile = 'matlab_scripts/botpt/tides_15sec_2011_for_unit_tests.mat'
+
     # tide values are signed 4 byte integers, units [0.001mm]
-    dict_tides = sp.io.loadmat('ion_functions/data/prs_functions_tides_2014_thru_2019.mat')
-    tidevector = 0.000001 * dict_tides['tides_mat']
-    tidevector = tidevector.reshape((-1))
+    tidevector = load_tide_table(tidefile)
     # calculate tide vector index as a function of timestamp
     idx = np.around((time - time0)/time_interval)
-    tide = tidevector[idx.astype(int)]
+    tide = 0.000001 * tidevector[idx.astype(int)]
     return tide
 
 
@@ -473,26 +449,7 @@ def prs_botsflu_5minrate(timestamp, botpres):
     # calculate de-tided depth and the positions of non-zero bins in the original data.
     _, meandepth, mask_nonzero = calc_meandepth_plus(timestamp, botpres)
 
-    # initialize data product including elements representing data gap positions
-    botsflu_5minrate = np.zeros(mask_nonzero.size) + np.nan
-
-    # re-constitute the original data, with data gaps represented by nans.
-    data_w_gaps = np.copy(botsflu_5minrate)
-    data_w_gaps[mask_nonzero] = meandepth
-
-    # for 15s binned data, 5 minutes comes out to (5 minutes)/(0.25 min) = 20 intervals
-    shift = 20
-    # units of the subtraction are meter/5min; to convert to cm/min,
-    # multiply by 100cm/m and divide by 5 = 20.
-    botsflu_5minrate[shift:] = 20.0 * (data_w_gaps[shift:] - data_w_gaps[:-shift])
-
-    # this rate product now has potentially two sources of nans;
-    # definitely those at the start of the data record, and any that might
-    # have been propagated into the calculation because of the presence of
-    # data gaps. remove those only at the data dropout positions (if present)
-    # so that this data product will have a 1:1 correspondence with
-    # its associated timestamp variable (TIME15S).
-    botsflu_5minrate = botsflu_5minrate[mask_nonzero]
+    botsflu_5minrate = calc_5minrate(meandepth, mask_nonzero)
 
     return botsflu_5minrate
 
@@ -530,32 +487,7 @@ def prs_botsflu_10minrate(timestamp, botpres):
     # calculate de-tided depth and the positions of non-zero bins in the original data.
     _, meandepth, mask_nonzero = calc_meandepth_plus(timestamp, botpres)
 
-    # initialize data product including elements representing data gap positions
-    botsflu_10minrate = np.zeros(mask_nonzero.size) + np.nan
-
-    # re-constitute the original data, with data gaps represented by nans.
-    data_w_gaps = np.copy(botsflu_10minrate)
-    data_w_gaps[mask_nonzero] = meandepth
-
-    # now calculate sliding 10 minute means.
-    # the mean of the 1st 40 values will be located at timestamp position 20
-    # (python index 19).
-    window_size = 40  # 10min averages on 0.25min binned data
-    means = calculate_sliding_means(data_w_gaps, window_size)
-
-    # as above, 10 minutes = 40 intervals for 15sec binned data.
-    shift = 40
-    # units of the subtraction are meter/10min; to convert to cm/hr,
-    # multiply by 100cm/m and multiply by 6 = 600.
-    botsflu_10minrate[shift:] = 600.0 * (means[shift:] - means[:-shift])
-
-    # this rate product now has potentially two sources of nans;
-    # definitely those at the start of the data record, and any that might
-    # have been propagated into the calculation because of the presence of
-    # data gaps. remove those only at the data dropout positions (if present)
-    # so that this data product will have a 1:1 correspondence with
-    # its associated timestamp variable (TIME15S).
-    botsflu_10minrate = botsflu_10minrate[mask_nonzero]
+    botsflu_10minrate = calc_10minrate(meandepth, mask_nonzero)
 
     return botsflu_10minrate
 
@@ -669,19 +601,7 @@ def prs_botsflu_4wkrate(timestamp, botpres):
     # calculate daydepth and the mask of nonzero data bins.
     daydepth, mask_nonzero = calc_daydepth_plus(timestamp, botpres)
 
-    # re-constitute the original data, with data gaps represented by nans.
-    data_w_gaps = np.zeros(mask_nonzero.size) + np.nan
-    data_w_gaps[mask_nonzero] = daydepth
-
-    # 4 weeks of data
-    window_size = 29
-    botsflu_4wkrate = calculate_sliding_slopes(data_w_gaps, window_size)
-    # (1) remove appropriate bins to re-establish the 1:1 correspondence
-    #     to TIME24H timestamps;
-    # (2) convert units:
-    #     the units of the slopes are [y]/[x] = meters/day;
-    #     to get units of cm/yr, multiply by 100cm/m * 365 days/yr
-    botsflu_4wkrate = 100.0 * 365.0 * botsflu_4wkrate[mask_nonzero]
+    botsflu_4wkrate = calc_wkrate(daydepth, mask_nonzero, 29)
 
     return botsflu_4wkrate
 
@@ -719,19 +639,7 @@ def prs_botsflu_8wkrate(timestamp, botpres):
     # calculate daydepth and the mask of nonzero data bins.
     daydepth, mask_nonzero = calc_daydepth_plus(timestamp, botpres)
 
-    # re-constitute the original data, with data gaps represented by nans.
-    data_w_gaps = np.zeros(mask_nonzero.size) + np.nan
-    data_w_gaps[mask_nonzero] = daydepth
-
-    # 8 weeks of data
-    window_size = 57
-    botsflu_8wkrate = calculate_sliding_slopes(data_w_gaps, window_size)
-    # (1) remove appropriate bins to re-establish the 1:1 correspondence
-    #     to TIME24H timestamps;
-    # (2) convert units:
-    #     the units of the slopes are [y]/[x] = meters/day;
-    #     to get units of cm/yr, multiply by 100cm/m * 365 days/yr
-    botsflu_8wkrate = 100.0 * 365.0 * botsflu_8wkrate[mask_nonzero]
+    botsflu_8wkrate = calc_wkrate(daydepth, mask_nonzero, 57)
 
     return botsflu_8wkrate
 
@@ -826,6 +734,307 @@ def prs_eruption_occurred(botsflu_10minrate, eruption_occurred_threshold=-5.0):
     return boolean_eruption_occurred
 
 
+#**********************************************************************
+#.. ALL BOTSFLU DATA PRODUCTS AND EVENT NOTIFICATIONS
+#**********************************************************************
+def prs_botsflu_all(timestamp, botpres):
+    """
+    Description:
+
+        Calculates all of the BOTSFLU data products and event notifications
+        in one call. The 20 Hz data are binned on 15 seconds and the 15sec
+        data on 24 hours once, and the tides, sliding means and sliding
+        slopes are calculated once, instead of once for each data product.
+
+    Usage
+
+        products = prs_botsflu_all(timestamp, botpres)
+
+            where
+
+        products = dictionary of the data products keyed by the lower case
+                   data product name ('time15s', 'meanpres', 'predtide',
+                   'meandepth', '5minrate', '10minrate', 'time24h', 'daydepth',
+                   '4wkrate', '8wkrate'), and of the event notifications
+                   ('tsunami_detection', 'eruption_imminent', 'eruption_occurred').
+        timestamp = OOI system timestamps [sec since 01-01-1900]
+        botpres = BOTPRES_L1 [psia]
+
+    Notes:
+
+        The data products are identical to those of the individual data
+        product functions.
+
+    References:
+
+        OOI (2015). Data Product Specification for Seafloor Uplift and Subsidence
+            (BOTSFLU) from the BOTPT instrument. Document Control Number 1341-00080.
+    """
+    # as in calc_meandepth_plus.
+    atm_press_psi = 0.0
+    psi_2_depth = -0.67  # psi to depth in meters
+
+    # the only pass over the 20 Hz data.
+    time15s, meanpres, mask_15s = anchor_bin(timestamp, botpres, 15.0, 'both')
+    predtide = prs_botsflu_predtide(time15s)
+    meandepth = ((meanpres - atm_press_psi) * psi_2_depth) + predtide
+
+    time24h, daydepth, mask_24h = anchor_bin(time15s, meandepth, 86400.0, 'both')
+
+    products = {
+        'time15s': time15s,
+        'meanpres': meanpres,
+        'predtide': predtide,
+        'meandepth': meandepth,
+        '5minrate': calc_5minrate(meandepth, mask_15s),
+        '10minrate': calc_10minrate(meandepth, mask_15s),
+        'time24h': time24h,
+        'daydepth': daydepth,
+        '4wkrate': calc_wkrate(daydepth, mask_24h, 29),
+        '8wkrate': calc_wkrate(daydepth, mask_24h, 57),
+    }
+
+    # the event notification functions set the nans of their argument to 0,
+    # so pass them copies.
+    products['tsunami_detection'] = prs_tsunami_detection(np.copy(products['5minrate']))
+    products['eruption_imminent'] = prs_eruption_imminent(np.copy(products['10minrate']))
+    products['eruption_occurred'] = prs_eruption_occurred(np.copy(products['10minrate']))
+
+    return products
+
+
+#**********************************************************************
+#.. STREAMING BOTSFLU DATA PRODUCTS AND EVENT NOTIFICATIONS
+#**********************************************************************
+class BotsfluStream(object):
+    """
+    Description:
+
+        Streaming version of prs_botsflu_all for 20 Hz data arriving in chunks.
+        Only the samples of the 15sec bin and the 15sec bins of the 24hr bin that
+        are still open are kept between calls, along with the last 10 minutes of
+        15sec data and the filter states (lfilter zi) of the sliding 10 minute
+        means and the 4 and 8 week sliding slopes, so memory does not grow with
+        the length of the record.
+
+    Usage:
+
+        stream = BotsfluStream()
+        for timestamp, botpres in chunks:
+            products = stream.update(timestamp, botpres)
+        products = stream.flush()
+
+            where
+
+        products = dictionary keyed as for prs_botsflu_all, holding the values
+                   that became final in the call. The 15sec products are returned
+                   as soon as the 15sec bin is complete, except for the 10minrate,
+                   which needs the 5 minutes of data following its bin; the 24hr
+                   products are returned as soon as the 24hr bin is complete. The
+                   event notifications are evaluated on the rates returned in the
+                   call. flush() returns the products of the open bins and resets
+                   the stream.
+        timestamp = OOI system timestamps [sec since 01-01-1900]
+        botpres = BOTPRES_L1 [psia]
+
+    Notes:
+
+        Concatenated over the calls, the data products are those of prs_botsflu_all
+        (the 10minrate, 4wkrate and 8wkrate to within roundoff, because the filter
+        states carry partial sums across the calls).
+
+        The timestamps must be nondecreasing across chunks; data for a 15sec bin
+        that has already been returned raise a ValueError.
+    """
+    # for 15s binned data, 5 and 10 minutes come out to 20 and 40 intervals.
+    shift_5min = 20
+    shift_10min = 40
+
+    def __init__(self):
+        # sliding mean (see calculate_sliding_means) and slope (see
+        # calculate_sliding_slopes) filter coefficients.
+        self._b_10min = np.ones(self.shift_10min) / self.shift_10min
+        self._b_slopes = {}
+        for window_size in (29, 57):
+            column1 = np.ones((window_size, 1))
+            column2 = -np.arange(float(window_size)).reshape(-1, 1)
+            X = np.hstack((column1, column2))
+            self._b_slopes[window_size] = np.linalg.pinv(X)[1, :]
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the open bins; the next update starts a new data set.
+        """
+        self._start_15s = None      # start time of the 15sec bins
+        self._start_24h = None      # start time of the 24hr bins
+        self._n_15s = 0             # number of 15sec bins completed
+        self._n_24h = 0             # number of 24hr bins completed
+        # 20 Hz data in the open 15sec bin
+        self._time = np.empty(0)
+        self._pres = np.empty(0)
+        # 15sec data in the open 24hr bin
+        self._time15s = np.empty(0)
+        self._depth15s = np.empty(0)
+        # last 5 minutes of meandepth, with data gaps represented by nans.
+        self._depth_hist = np.zeros(self.shift_5min) + np.nan
+        # last 10 minutes of sliding means, and the non-empty bin mask of
+        # the bins whose 10minrate is not final yet.
+        self._means_hist = np.zeros(self.shift_10min) + np.nan
+        self._mask_hist = np.zeros(self.shift_10min / 2, dtype=bool)
+        # filter states of the sliding sums and of the sliding slopes.
+        self._zi_sums = np.zeros(self.shift_10min - 1)
+        self._zi_slopes = dict((w, np.zeros(w - 1)) for w in self._b_slopes)
+
+    def update(self, timestamp, botpres):
+        """
+        Adds a chunk of data and returns the products that became final.
+        """
+        return self._process(timestamp, botpres, False)
+
+    def flush(self):
+        """
+        Returns the products of the open bins and resets the stream.
+        """
+        products = self._process(np.empty(0), np.empty(0), True)
+        # the 10minrate of the last 5 minutes of data is nan, as the sliding
+        # means at the end of the record are.
+        products['10minrate'] = np.append(products['10minrate'],
+                                          np.zeros(np.count_nonzero(self._mask_hist)) + np.nan)
+        products['eruption_imminent'] = prs_eruption_imminent(np.copy(products['10minrate']))
+        products['eruption_occurred'] = prs_eruption_occurred(np.copy(products['10minrate']))
+        self.reset()
+        return products
+
+    def _process(self, timestamp, botpres, final):
+        timestamp = np.atleast_1d(np.asanyarray(timestamp, dtype=np.float))
+        botpres = np.atleast_1d(np.asanyarray(botpres, dtype=np.float))
+        if timestamp.size != botpres.size:
+            raise ValueError('timestamp and botpres must be of equal length')
+
+        # 15sec bins, as in calc_meandepth_plus
+        time = np.concatenate((self._time, timestamp))
+        pres = np.concatenate((self._pres, botpres))
+        if self._start_15s is None and time.size:
+            self._start_15s = np.floor((time[0] - 7.5)/15.0) * 15.0 + 7.5
+        time15s, meanpres, mask_15s, nbins = self._bin(time, pres, 'min', final)
+        self._time, self._pres = time[nbins:], pres[nbins:]
+        if time15s.size:
+            predtide = prs_botsflu_predtide(time15s)
+        else:
+            predtide = np.empty(0)
+        atm_press_psi = 0.0
+        psi_2_depth = -0.67  # psi to depth in meters
+        meandepth = ((meanpres - atm_press_psi) * psi_2_depth) + predtide
+        botsflu_5minrate, botsflu_10minrate = self._minrates(meandepth, mask_15s)
+
+        # 24hr bins, as in calc_daydepth_plus
+        time = np.concatenate((self._time15s, time15s))
+        depth = np.concatenate((self._depth15s, meandepth))
+        if self._start_24h is None and time.size:
+            self._start_24h = np.floor((time[0] - 43200.0)/86400.0) * 86400.0 + 43200.0
+        time24h, daydepth, mask_24h, nbins = self._bin(time, depth, 'day', final)
+        self._time15s, self._depth15s = time[nbins:], depth[nbins:]
+        botsflu_4wkrate = self._wkrate(daydepth, mask_24h, 29)
+        botsflu_8wkrate = self._wkrate(daydepth, mask_24h, 57)
+        self._n_24h += mask_24h.size
+
+        return {
+            'time15s': time15s,
+            'meanpres': meanpres,
+            'predtide': predtide,
+            'meandepth': meandepth,
+            '5minrate': botsflu_5minrate,
+            '10minrate': botsflu_10minrate,
+            'time24h': time24h,
+            'daydepth': daydepth,
+            '4wkrate': botsflu_4wkrate,
+            '8wkrate': botsflu_8wkrate,
+            'tsunami_detection': prs_tsunami_detection(np.copy(botsflu_5minrate)),
+            'eruption_imminent': prs_eruption_imminent(np.copy(botsflu_10minrate)),
+            'eruption_occurred': prs_eruption_occurred(np.copy(botsflu_10minrate))
+        }
+
+    def _bin(self, time, data, level, final):
+        """
+        Bins the data of the complete bins as anchor_bin does. A bin is
+        complete once data from a later bin have been received (or when
+        final). Returns the bin timestamps, binned data and mask of non-empty
+        bins of the complete bins, and the number of data binned.
+        """
+        if level == 'min':
+            bin_duration, start_time, first_bin = 15.0, self._start_15s, self._n_15s
+        else:
+            bin_duration, start_time, first_bin = 86400.0, self._start_24h, self._n_24h
+        if time.size == 0:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool), 0
+        half_bin = bin_duration/2.0
+        bin_number = np.floor((time - start_time)/bin_duration).astype(int)
+        if bin_number.min() < first_bin:
+            raise ValueError('data received for a bin that has already been returned')
+
+        end_bin = bin_number[-1] + 1 if final else bin_number[-1]
+        ndata = np.searchsorted(bin_number, end_bin)
+        bin_number = bin_number[:ndata] - first_bin
+        nbins = end_bin - first_bin
+        bin_count = np.bincount(bin_number, minlength=nbins).astype(float)
+        mask_nonzero = (bin_count != 0)
+        bin_timestamps = start_time + half_bin + bin_duration * np.arange(first_bin, end_bin)
+        bin_timestamps = bin_timestamps[mask_nonzero]
+        binned_data = np.bincount(bin_number, data[:ndata], minlength=nbins)
+        binned_data = binned_data[mask_nonzero]/bin_count[mask_nonzero]
+        return bin_timestamps, binned_data, mask_nonzero, ndata
+
+    def _minrates(self, meandepth, mask_nonzero):
+        """
+        5minrate and 10minrate of the completed 15sec bins (see calc_5minrate
+        and calc_10minrate).
+        """
+        # re-constitute the original data, with data gaps represented by nans.
+        data_w_gaps = np.zeros(mask_nonzero.size) + np.nan
+        data_w_gaps[mask_nonzero] = meandepth
+        bin_index = self._n_15s + np.arange(mask_nonzero.size)
+        self._n_15s += mask_nonzero.size
+
+        depth = np.concatenate((self._depth_hist, data_w_gaps))
+        botsflu_5minrate = 20.0 * (depth[self.shift_5min:] - depth[:-self.shift_5min])
+        botsflu_5minrate = botsflu_5minrate[mask_nonzero]
+        self._depth_hist = depth[-self.shift_5min:]
+
+        # the sliding sums of the last 40 bins, ending at the new bins, are the
+        # sliding means centered 20 bins earlier. windows extending past the
+        # start of the data are nan'd out, and windows with data gaps are nan.
+        if data_w_gaps.size:
+            sums, self._zi_sums = signal.lfilter(self._b_10min, 1, data_w_gaps, zi=self._zi_sums)
+        else:
+            sums = np.empty(0)
+        sums[bin_index < self.shift_10min - 1] = np.nan
+
+        # units of the subtraction are meter/10min; to convert to cm/hr,
+        # multiply by 100cm/m and multiply by 6 = 600.
+        means = np.concatenate((self._means_hist, sums))
+        botsflu_10minrate = 600.0 * (means[self.shift_10min:] - means[:-self.shift_10min])
+        self._means_hist = means[-self.shift_10min:]
+        mask = np.concatenate((self._mask_hist, mask_nonzero))
+        botsflu_10minrate = botsflu_10minrate[mask[:mask_nonzero.size]]
+        self._mask_hist = mask[-self.shift_10min / 2:]
+
+        return botsflu_5minrate, botsflu_10minrate
+
+    def _wkrate(self, daydepth, mask_nonzero, window_size):
+        """
+        4wkrate or 8wkrate of the completed 24hr bins (see calc_wkrate).
+        """
+        data_w_gaps = np.zeros(mask_nonzero.size) + np.nan
+        data_w_gaps[mask_nonzero] = daydepth
+        if data_w_gaps.size == 0:
+            return np.empty(0)
+        slopes, self._zi_slopes[window_size] = signal.lfilter(
+            self._b_slopes[window_size], 1, data_w_gaps, zi=self._zi_slopes[window_size])
+        slopes[self._n_24h + np.arange(slopes.size) < window_size - 1] = np.nan
+        return 100.0 * 365.0 * slopes[mask_nonzero]
+
+
 def anchor_bin(time, data, bin_duration, mode):
     """
     Description:
@@ -1052,6 +1261,142 @@ def calc_meandepth_plus(timestamp, botpres):
     return time15s, meandepth, mask_nonzero
 
 
+def calc_5minrate(meandepth, mask_nonzero):
+    """
+    Description:
+
+        Worker function to calculate the botsflu data product 5minrate from
+        meandepth.
+
+    Usage
+
+        botsflu_5minrate = calc_5minrate(meandepth, mask_nonzero)
+
+            where
+
+        botsflu_5minrate = BOTSFLU-5MINRATE_L2 [cm/min]
+        meandepth = BOTSFLU-MEANDEPTH_L2 [m]
+        mask_nonzero = boolean of positions of non-empty 15sec bins
+
+    References:
+
+        OOI (2015). Data Product Specification for Seafloor Uplift and Subsidence
+            (BOTSFLU) from the BOTPT instrument. Document Control Number 1341-00080.
+    """
+    # initialize data product including elements representing data gap positions
+    botsflu_5minrate = np.zeros(mask_nonzero.size) + np.nan
+
+    # re-constitute the original data, with data gaps represented by nans.
+    data_w_gaps = np.copy(botsflu_5minrate)
+    data_w_gaps[mask_nonzero] = meandepth
+
+    # for 15s binned data, 5 minutes comes out to (5 minutes)/(0.25 min) = 20 intervals
+    shift = 20
+    # units of the subtraction are meter/5min; to convert to cm/min,
+    # multiply by 100cm/m and divide by 5 = 20.
+    botsflu_5minrate[shift:] = 20.0 * (data_w_gaps[shift:] - data_w_gaps[:-shift])
+
+    # this rate product now has potentially two sources of nans;
+    # definitely those at the start of the data record, and any that might
+    # have been propagated into the calculation because of the presence of
+    # data gaps. remove those only at the data dropout positions (if present)
+    # so that this data product will have a 1:1 correspondence with
+    # its associated timestamp variable (TIME15S).
+    botsflu_5minrate = botsflu_5minrate[mask_nonzero]
+
+    return botsflu_5minrate
+
+
+def calc_10minrate(meandepth, mask_nonzero):
+    """
+    Description:
+
+        Worker function to calculate the botsflu data product 10minrate from
+        meandepth.
+
+    Usage
+
+        botsflu_10minrate = calc_10minrate(meandepth, mask_nonzero)
+
+            where
+
+        botsflu_10minrate = BOTSFLU-10MINRATE_L2 [cm/hr]
+        meandepth = BOTSFLU-MEANDEPTH_L2 [m]
+        mask_nonzero = boolean of positions of non-empty 15sec bins
+
+    References:
+
+        OOI (2015). Data Product Specification for Seafloor Uplift and Subsidence
+            (BOTSFLU) from the BOTPT instrument. Document Control Number 1341-00080.
+    """
+    # initialize data product including elements representing data gap positions
+    botsflu_10minrate = np.zeros(mask_nonzero.size) + np.nan
+
+    # re-constitute the original data, with data gaps represented by nans.
+    data_w_gaps = np.copy(botsflu_10minrate)
+    data_w_gaps[mask_nonzero] = meandepth
+
+    # now calculate sliding 10 minute means.
+    # the mean of the 1st 40 values will be located at timestamp position 20
+    # (python index 19).
+    window_size = 40  # 10min averages on 0.25min binned data
+    means = calculate_sliding_means(data_w_gaps, window_size)
+
+    # as above, 10 minutes = 40 intervals for 15sec binned data.
+    shift = 40
+    # units of the subtraction are meter/10min; to convert to cm/hr,
+    # multiply by 100cm/m and multiply by 6 = 600.
+    botsflu_10minrate[shift:] = 600.0 * (means[shift:] - means[:-shift])
+
+    # this rate product now has potentially two sources of nans;
+    # definitely those at the start of the data record, and any that might
+    # have been propagated into the calculation because of the presence of
+    # data gaps. remove those only at the data dropout positions (if present)
+    # so that this data product will have a 1:1 correspondence with
+    # its associated timestamp variable (TIME15S).
+    botsflu_10minrate = botsflu_10minrate[mask_nonzero]
+
+    return botsflu_10minrate
+
+
+def calc_wkrate(daydepth, mask_nonzero, window_size):
+    """
+    Description:
+
+        Worker function to calculate the botsflu data products 4wkrate and
+        8wkrate from daydepth.
+
+    Usage
+
+        botsflu_wkrate = calc_wkrate(daydepth, mask_nonzero, window_size)
+
+            where
+
+        botsflu_wkrate = BOTSFLU-4WKRATE_L2 or BOTSFLU-8WKRATE_L2 [cm/yr]
+        daydepth = BOTSFLU-DAYDEPTH_L2 [m]
+        mask_nonzero = boolean of positions of non-empty 24 hr bins
+        window_size = 29 for 4 weeks of data, 57 for 8 weeks of data.
+
+    References:
+
+        OOI (2015). Data Product Specification for Seafloor Uplift and Subsidence
+            (BOTSFLU) from the BOTPT instrument. Document Control Number 1341-00080.
+    """
+    # re-constitute the original data, with data gaps represented by nans.
+    data_w_gaps = np.zeros(mask_nonzero.size) + np.nan
+    data_w_gaps[mask_nonzero] = daydepth
+
+    botsflu_wkrate = calculate_sliding_slopes(data_w_gaps, window_size)
+    # (1) remove appropriate bins to re-establish the 1:1 correspondence
+    #     to TIME24H timestamps;
+    # (2) convert units:
+    #     the units of the slopes are [y]/[x] = meters/day;
+    #     to get units of cm/yr, multiply by 100cm/m * 365 days/yr
+    botsflu_wkrate = 100.0 * 365.0 * botsflu_wkrate[mask_nonzero]
+
+    return botsflu_wkrate
+
+
 def calculate_sliding_means(data, window_size):
     """
     Description:
@@ -1131,3 +1476,105 @@ def calculate_sliding_slopes(data, window_size):
     # if time-centered slopes are desired, circularly shift this by half a window.
 
     return slopes
+
+
+# tide tables read by load_tide_table, shared by all callers in the process
+_tide_tables = {}
+_tide_tables_lock = threading.Lock()
+
+
+def load_tide_table(tidefile):
+    """
+    Description:
+
+        Returns the tide vector of a BOTSFLU tide table (signed 4 byte integers,
+        units [0.001mm]). The table is read from a .npy copy of the matfile,
+        which is written next to the matfile the first time the table is used,
+        and is memory-mapped, so that the table is only paged in where it is
+        indexed and the pages are shared by processes forked from one parent.
+        The copy is stamped with the modification time of the matfile, and is
+        written again when the matfile has been replaced since. The tables are
+        cached for the life of the process.
+
+    Usage:
+
+        tidevector = load_tide_table(tidefile)
+
+            where
+
+        tidevector = 1D int32 array of tide values [0.001mm]
+        tidefile = path of the matfile relative to the ion_functions.data package,
+                   containing the tide values in the variable 'tides_mat'.
+
+    Notes:
+
+        If the .npy copy cannot be written (for example, the package directory
+        is read-only), the table is read from the matfile into memory instead.
+    """
+    with _tide_tables_lock:
+        tidevector = _tide_tables.get(tidefile)
+        if tidevector is None:
+            tidevector = _read_tide_table(tidefile)
+            _tide_tables[tidefile] = tidevector
+    return tidevector
+
+
+def _read_tide_table(tidefile):
+    matpath = pkg_resources.resource_filename(__name__, tidefile)
+    npypath = os.path.splitext(matpath)[0] + '.npy'
+    # the copy is current if it has the modification time of the matfile
+    mattime = os.path.getmtime(matpath)
+    if not (os.path.exists(npypath) and int(os.path.getmtime(npypath)) == int(mattime)):
+        dict_tides = sp.io.loadmat(matpath)
+        tidevector = dict_tides['tides_mat'].reshape((-1)).astype(np.int32)
+        # write to a temporary file first so that a concurrent reader never
+        # sees a partially written table.
+        tmppath = None
+        try:
+            fd, tmppath = tempfile.mkstemp(suffix='.tmp.npy', dir=os.path.dirname(npypath))
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, tidevector)
+            # mkstemp creates the file readable by its owner only
+            os.chmod(tmppath, 0o644)
+            os.utime(tmppath, (mattime, mattime))
+            os.rename(tmppath, npypath)
+        except (IOError, OSError):
+            if tmppath is not None:
+                try:
+                    os.remove(tmppath)
+                except OSError:
+                    pass
+            return tidevector
+
+    return np.load(npypath, mmap_mode='r')
+
+
+# corrected compass directions table built by ccmp_table
+_ccmp_table = None
+
+
+def ccmp_table():
+    """
+    Description:
+
+        Returns the BOTTILT-CCMP corrected compass directions table as an array,
+        built once per process from the LILY compass calibrations.
+
+    Usage:
+
+        sernum_rows, table = ccmp_table()
+
+            where
+
+        sernum_rows = dictionary of the table row of each LILY sensor serial number
+        table = 2D array of corrected compass directions [degrees]; the column index
+                is the (integral) uncorrected sensor compass direction, 0 to 360.
+    """
+    global _ccmp_table
+    if _ccmp_table is None:
+        from ion_functions.data.prs_functions_ccmp_lily_compass_cals import cmp_cal
+        sernums = sorted(cmp_cal.keys())
+        table = np.array([cmp_cal[sernum][1] for sernum in sernums], dtype=np.float)
+        table.flags.writeable = False
+        _ccmp_table = (dict((sernum, row) for row, sernum in enumerate(sernums)), table)
+    return _ccmp_table
@@ -282,6 +282,69 @@ class TestADCPFunctionsUnit(BaseUnitTestCase):
         np.testing.assert_array_almost_equal(e, evl, 4)
         np.testing.assert_array_almost_equal(ww_true, w5, 4)
 
+    def test_adcp_beam_all(self):
+        """
+        Tests that adcp_beam_all and vadcp_beam_all return the data products
+        of the single product wrappers, and that the memo shared by the
+        wrappers follows changes to the inputs.
+        """
+        rng = np.random.RandomState(1)
+        b1, b2, b3, b4, b5 = [rng.randn(20, 8) * 300. for i in range(5)]
+        h = rng.rand(20) * 36000.
+        p = rng.randn(20) * 300.
+        r = rng.randn(20) * 300.
+        vf = np.ones(20)
+        lat = np.repeat(self.lat, 20)
+        lon = np.repeat(self.lon, 20)
+        z = np.repeat(100., 20)
+        dt = self.ntp + np.arange(20) * 3600.
+        args = (b1, b2, b3, b4, h, p, r, vf, lat, lon, z, dt)
+
+        af.clear_adcp_memo()
+        expected = [af.adcp_beam_eastward(*args),
+                    af.adcp_beam_northward(*args),
+                    af.adcp_beam_vertical(*args[:8]),
+                    af.adcp_beam_error(*args[:4])]
+        # the transforms and declinations were computed once each
+        self.assertEquals(len(af._adcp_memo), 3)
+        for got, exp in zip(af.adcp_beam_all(*args), expected):
+            np.testing.assert_array_equal(got, exp)
+        self.assertEquals(len(af._adcp_memo), 3)
+
+        vargs = (b1, b2, b3, b4, b5, h, p, r, vf, lat, lon, z, dt)
+        expected = [af.vadcp_beam_eastward(*args),
+                    af.vadcp_beam_northward(*args),
+                    af.vadcp_beam_vertical_est(*args[:8]),
+                    af.vadcp_beam_vertical_true(*vargs[:9]),
+                    af.vadcp_beam_error(*args[:4])]
+        for got, exp in zip(af.vadcp_beam_all(*vargs), expected):
+            np.testing.assert_array_equal(got, exp)
+
+        # changing an input in place gives new results
+        uu_cor = af.adcp_beam_eastward(*args)
+        b1[3, 2] += 100.
+        u, v, w, _ = af.adcp_beam2ins(b1, b2, b3, b4)
+        _, _, ww = af.adcp_ins2earth(u, v, w, h / 100., p / 100., r / 100., vf)
+        self.assertNotEqual(af.adcp_beam_eastward(*args)[3, 2], uu_cor[3, 2])
+        np.testing.assert_array_equal(af.adcp_beam_vertical(*args[:8]), ww / 1000.)
+
+        # scalar arguments
+        af.clear_adcp_memo()
+        theta = af.magnetic_declination_memo(self.lat, self.lon, self.ntp, 0.0)
+        self.assertTrue(af.magnetic_declination_memo(self.lat, self.lon, self.ntp, 0.0) is theta)
+
+        # results larger than ADCP_MEMO_BYTES are not kept
+        af.clear_adcp_memo()
+        memo_bytes = af.ADCP_MEMO_BYTES
+        af.ADCP_MEMO_BYTES = 10000
+        try:
+            uu_cor = af.adcp_beam_eastward(*args)
+            self.assertEquals(len(af._adcp_memo), 1)
+            np.testing.assert_array_equal(uu_cor, af.adcp_beam_all(*args)[0])
+        finally:
+            af.ADCP_MEMO_BYTES = memo_bytes
+            af.clear_adcp_memo()
+
     def test_adcp_bin_depths(self):
                 """
         Test the adcp_bin_depths function.
@@ -49,6 +49,40 @@ class TestGenericFunctionsUnit(BaseUnitTestCase):
 
         self.assertTrue(np.allclose(out, decln, rtol=0, atol=1e-2))
 
+    def test_magnetic_declination_array(self):
+        """
+        Test that magnetic_declination, which evaluates the model once per
+        distinct position and day, matches the declination computed sample
+        by sample.
+        """
+        rng = np.random.RandomState(7)
+        n = 500
+        lat = rng.uniform(-80., 80., n)
+        lon = rng.uniform(-180., 360., n)
+        z = rng.choice([0., 1000., 100000.], n)
+        timestamp = 3471292800.0 + rng.uniform(0, 86400 * 1500, n)
+        timestamp[:5] = 3471292800.0 + 86400 * np.arange(5)   # midnights
+        # repeat positions so that some samples share a model evaluation
+        lat[::3] = lat[0]
+        lon[::3] = lon[0]
+        z[::3] = z[0]
+
+        wmm = gfunc.WMM(gfunc.set_wmm_model(2010))
+        decln = np.vectorize(gfunc.wmm_declination_remod)
+        expected = decln(lat, lon, timestamp, wmm, z, -1)
+        out = gfunc.magnetic_declination(lat, lon, timestamp, z, -1)
+        np.testing.assert_array_equal(out, expected)
+
+        # fixed position, broadcast against the timestamps
+        expected = decln(45.0, -128.0, timestamp, wmm, 0.0, -1)
+        out = gfunc.magnetic_declination(45.0, -128.0, timestamp)
+        np.testing.assert_array_equal(out, expected)
+
+        # scalar inputs give a scalar
+        out = gfunc.magnetic_declination(45.0, -128.0, 3575053740.7382507)
+        self.assertEquals(np.shape(out), ())
+        self.assertTrue(np.allclose(out, 16.46093044096720, rtol=0, atol=1e-2))
+
     def test_magnetic_correction(self):
         """
         Test magentic_correction function.
@@ -75,6 +109,42 @@ class TestGenericFunctionsUnit(BaseUnitTestCase):
         self.assertTrue(np.allclose(uu_cor, 0.472251, rtol=1e-4, atol=0))
         self.assertTrue(np.allclose(vv_cor, 0.035692, rtol=1e-4, atol=0))
 
+    def test_magnetic_rotation(self):
+        """
+        Test the magnetic_rotation kernel against the rotation matrix of
+        magnetic_correction, for ADCP shaped (ensembles x bins) inputs and
+        in place.
+        """
+        rng = np.random.RandomState(0)
+        theta = rng.rand(7) * 40. - 20.
+        u = rng.randn(7, 5)
+        v = rng.randn(7, 5)
+
+        uu_exp = np.zeros((7, 5))
+        vv_exp = np.zeros((7, 5))
+        for i in range(7):
+            rad = np.radians(theta[i])
+            M = np.array([[np.cos(rad), np.sin(rad)],
+                          [-np.sin(rad), np.cos(rad)]])
+            uu_exp[i], vv_exp[i] = np.dot(M, np.array([u[i], v[i]]))
+
+        # one declination per ensemble, across all bins
+        uu_cor, vv_cor = gfunc.magnetic_rotation(theta, u, v)
+        np.testing.assert_allclose(uu_cor, uu_exp, rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(vv_cor, vv_exp, rtol=1e-12, atol=1e-15)
+
+        # single declination
+        uu_cor, vv_cor = gfunc.magnetic_rotation(theta[0], u[0], v[0])
+        np.testing.assert_allclose(uu_cor, uu_exp[0], rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(vv_cor, vv_exp[0], rtol=1e-12, atol=1e-15)
+
+        # in place
+        uu_cor, vv_cor = gfunc.magnetic_rotation(theta, u, v, out_u=u, out_v=v)
+        self.assertTrue(uu_cor is u)
+        self.assertTrue(vv_cor is v)
+        np.testing.assert_allclose(u, uu_exp, rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(v, vv_exp, rtol=1e-12, atol=1e-15)
+
     def test_ntp_to_unix_time(self):
         """
         Test ntp_to_unix_time function.
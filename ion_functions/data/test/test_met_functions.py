@@ -634,6 +634,41 @@ class TestMetFunctionsUnit(BaseUnitTestCase):
                 calc[ctr, :] = mb.met_tempskn(*args_vector)
         np.testing.assert_allclose(calc, xpctd, rtol=1.e-8, atol=0.0)
 
+    def test_met_bulkflx_all(self):
+        """
+            Checks that met_bulkflx_all gives the products of the individual
+            functions and that the warmlayer/coolskin front end is shared.
+        """
+        names = [name for name, _ in mb.BULKFLX_PRODUCTS]
+        for args in (self.args_vector_inputs + (1, 1),
+                     self.args_vector_inputs + (0, 1),
+                     self.args_multiple_days):
+            mb.clear_bulkflux_cache()
+            xpctd = {}
+            for name, dpa in mb.BULKFLX_PRODUCTS:
+                xpctd[name] = dpa(*args)
+                mb.clear_bulkflux_cache()
+            xpctd['timeflx'] = mb.met_timeflx(args[4])
+
+            calc = mb.met_bulkflx_all(*args)
+            self.assertEquals(sorted(calc.keys()), sorted(names + ['timeflx']))
+            for name in calc:
+                np.testing.assert_array_equal(calc[name], xpctd[name])
+            # one context was computed for all of the products
+            self.assertEquals(len(mb._bulkflux_cache), 1)
+
+        # changing the input data invalidates the cached context
+        mb.clear_bulkflux_cache()
+        args = list(self.args_vector_inputs + (1, 1))
+        args[0] = np.copy(args[0])
+        first = mb.met_latnflx(*args)
+        args[0] += 1.0
+        second = mb.met_latnflx(*args)
+        self.assertEquals(len(mb._bulkflux_cache), 2)
+        self.assertFalse(np.any(first == second))
+        # the inputs are not made read-only by the cache
+        self.assertTrue(all(a.flags.writeable for a in args if isinstance(a, np.ndarray)))
+
     """
         Description
 
@@ -871,6 +906,59 @@ class TestMetFunctionsUnit(BaseUnitTestCase):
 
         np.testing.assert_allclose(calc, xpctd, rtol=1.e-8, atol=1.e-8)
 
+    def test_hourly_accumulator(self):
+        """
+            Checks that HourlyAccumulator, fed in chunks, gives the hourly data of
+            make_hourly_data for data starting at the top of an hour.
+        """
+        rng = np.random.RandomState(3)
+        n = 600
+        # each minute data with a gap, starting at the top of an hour
+        timestamp = 3580020000.0 + 60.0 * np.arange(n)
+        timestamp[200:] += 3 * 3600.0
+        tC_sea = 20.0 + rng.randn(n)
+        wnd = 5.0 + rng.rand(n)
+        args = [np.cumsum(rng.rand(n)), timestamp, np.zeros(n) - 125.0, 0.5, tC_sea,
+                wnd, 4.1, tC_sea - 1.0, 3.0, 80.0 + rng.rand(n), 3.0, 1013.0 + rng.randn(n),
+                500.0 * rng.rand(n), 380.0 + rng.randn(n), np.zeros(n) + 45.0,
+                np.zeros(n) + 600.0, 1, 1]
+        args = mb.condition_data(*args)
+        xpctd = mb.make_hourly_data(*args)
+
+        for chunk in (1, 7, 60, 250, n):
+            acc = mb.HourlyAccumulator()
+            calc = []
+            for start in range(0, n, chunk):
+                chunk_args = [a[start:start+chunk] if np.size(a) == n else a for a in args]
+                calc.append(acc.update(*chunk_args))
+                # at most the latest hour is held back
+                self.assertTrue(calc[-1][1].size == 0 or
+                                calc[-1][1][-1] < timestamp[start:start+chunk][-1])
+            calc.append(acc.flush())
+            for ii in range(18):
+                if np.size(xpctd[ii]) == np.size(xpctd[1]):
+                    calc_ii = np.hstack([c[ii] for c in calc])
+                    np.testing.assert_allclose(calc_ii, xpctd[ii], rtol=1.e-12, atol=0.0)
+                else:
+                    np.testing.assert_array_equal(calc[-1][ii], xpctd[ii])
+
+        # the bins do not depend on the first timestamp
+        acc = mb.HourlyAccumulator()
+        late = acc.update(tC_sea[30:], timestamp[30:]) + acc.flush()
+        acc = mb.HourlyAccumulator()
+        early = acc.update(tC_sea, timestamp) + acc.flush()
+        # both give (data, timestamps) for the hours completed by update and
+        # for the remaining hours from flush.
+        np.testing.assert_array_equal(late[1], early[1])
+        np.testing.assert_array_equal(late[3], early[3])
+        np.testing.assert_allclose(late[0][1:], early[0][1:], rtol=1.e-12, atol=0.0)
+        self.assertNotAlmostEqual(late[0][0], early[0][0])
+
+        # data for an hour already returned are rejected
+        acc = mb.HourlyAccumulator()
+        acc.update(tC_sea[:120], timestamp[:120])
+        self.assertRaises(ValueError, acc.update, tC_sea[:10], timestamp[:10])
+
     def test_met_timeflx(self):
         """
             Uses the timestamp data as in test_make_hourly_data.
@@ -966,6 +1054,65 @@ class TestMetFunctionsUnit(BaseUnitTestCase):
             #print timeflx, xpctd
             np.testing.assert_allclose(calc, xpctd, rtol=1.e-8, atol=1.e-8)
 
+    def test_warmlayer_by_day(self):
+        """
+            Checks that processing the days together gives the results of the
+            record by record warmlayer loop, including days set to nans.
+        """
+        (tC_sea, wnd, tC_air, relhum, timestamp, lon, ztmpwat, zwindsp, ztmpair,
+            zhumair, lat, pr_air, Rshort_down, Rlong_down, cumu_prcp,
+            zinvpbl) = self.args_multiple_days
+        for ii in range(4):
+            ts = np.copy(timestamp)
+            if ii < 3:
+                # the ii_th day does not start before 6AM
+                ts[ii*30:ii*30+30] = ts[ii*30:ii*30+30] + 5 * 3600.0
+            args = [cumu_prcp, ts, lon, ztmpwat, tC_sea, wnd, zwindsp,
+                    tC_air, ztmpair, relhum, zhumair, pr_air, Rshort_down,
+                    Rlong_down, lat, zinvpbl, 1, 1]
+            args = mb.condition_data(*args)
+            args = mb.make_hourly_data(*args)
+            args[0] = mb.calc_rain_rate(*args[0:2])
+
+            xpctd = mb.warmlayer(*args[0:-1], by_day=False)
+            calc = mb.warmlayer(*args[0:-1], by_day=True)
+            for x, c in zip(xpctd, calc):
+                np.testing.assert_array_equal(c, x)
+
+    def test_coare35vn_tol(self):
+        """
+            Checks the convergence controlled iteration of coare35vn against
+            the fixed number of iterations.
+        """
+        rng = np.random.RandomState(0)
+        n = 1000
+        tC_sea = 20.0 + 5.0 * rng.randn(n)
+        tC_air = tC_sea - 1.0 + 2.0 * rng.randn(n)
+        # stable cases: warm air over cold water with light winds
+        tC_air[:20] = tC_sea[:20] + 8.0
+        wnd = 0.5 + 12.0 * rng.rand(n)
+        wnd[:20] = 0.2
+        args = (tC_sea, wnd, np.array([4.1]), tC_air, np.array([3.0]),
+                60.0 + 35.0 * rng.rand(n), np.array([3.0]), 1013.0 + 5.0 * rng.randn(n),
+                1000.0 * rng.rand(n), 380.0 + 30.0 * rng.randn(n),
+                np.zeros(n) + 45.0, np.zeros(n) + 600.0, 1)
+
+        xpctd = mb.coare35vn(*args)
+        np.testing.assert_array_equal(mb.coare35vn(*args, tol=None), xpctd)
+
+        # without convergence every element runs all of the iterations
+        calc = mb.coare35vn(*args, tol=0.0)
+        for x, c in zip(xpctd[0:3], calc[0:3]):
+            np.testing.assert_allclose(c, x, rtol=1.e-8, atol=0.0)
+
+        calc = mb.coare35vn(*args, tol=1.e-3)
+        for x, c in zip(xpctd[0:3], calc[0:3]):
+            np.testing.assert_allclose(c, x, rtol=1.e-2, atol=0.0)
+
+        # the stable cases (k50) keep their first iteration solution
+        for x, c in zip(xpctd, calc):
+            np.testing.assert_array_equal(c[:20], x[:20])
+
     def test_rain_heat_flux(self):
         """
             Tests new formulation of rain heat flux, independent of coare bulk algorithms.
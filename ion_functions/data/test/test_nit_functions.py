@@ -11,6 +11,7 @@ from nose.plugins.attrib import attr
 from ion_functions.test.base_test import BaseUnitTestCase
 
 import numpy as np
+from ion_functions.data import nit_functions as nitfunc
 from ion_functions.data.nit_functions import ts_corrected_nitrate
 
 
@@ -139,3 +140,62 @@ class TestNitFunctionsUnit(BaseUnitTestCase):
     # compare calculated results to expected results
     np.testing.assert_allclose(NO3_conc_calc, nit_expected, rtol=0.000001, atol=0.000001)
 
+
+    def test_ts_corrected_nitrate_groups(self):
+        """
+        Test ts_corrected_nitrate on packets whose cal coeffs and fit limits
+        change within the call, on spectra synthesized from known nitrate
+        concentrations.
+        """
+        rng = np.random.RandomState(7)
+        n = 60
+        wl = np.tile(np.linspace(190., 395., 256), (n, 1))
+        eno3 = np.tile(np.exp(-(wl[0] - 200.) / 12.) * 0.02, (n, 1))
+        eswa = rng.rand(n, 256) * 1e-3
+        di = np.tile(np.linspace(30000., 20000., 256), (n, 1))
+        # a second instrument for the last third of the packets
+        wl[40:] += 0.4
+        eno3[40:] *= 1.05
+        wllower = np.where(np.arange(n) % 2, 217., 220.)
+        wlupper = np.where(np.arange(n) % 2, 240., 245.)
+        cal_temp = np.tile(20.08, n)
+        ctd_t = rng.rand(n) * 20.
+        ctd_sp = rng.rand(n) * 35.
+        dark_value = np.tile(909., n)
+        frame_type = np.array(['SLB', 'SLB', 'SDB', 'SLF', 'NDF', 'NLF'] * 10)
+
+        # absorbance of nitrate, a linear baseline and the temperature
+        # corrected seasalt absorbance
+        no3 = rng.rand(n) * 40.
+        swa = (eswa * ((1.1500276 + 0.02840 * ctd_t[:, None]) / (1.1500276 + 0.02840 * cal_temp[:, None]))
+               * np.exp(0.001222 * (ctd_t[:, None] - cal_temp[:, None]) * (wl - 210.)))
+        absorbance = (no3[:, None] * eno3 + 0.002 - 0.5 * wl / 1000.
+                      + ctd_sp[:, None] * swa)
+        data_in = di / 10 ** absorbance + dark_value[:, None]
+
+        expected = no3.copy()
+        expected[np.in1d(frame_type, ['SDB', 'SDF', 'NDF'])] = np.nan
+
+        nitfunc._nitrate_fit_cache.clear()
+        out = ts_corrected_nitrate(cal_temp, wl, eno3, eswa, di, dark_value,
+                                   ctd_t, ctd_sp, data_in, frame_type,
+                                   wllower, wlupper)
+        np.testing.assert_allclose(out, expected, rtol=1e-8, atol=1e-8)
+        # one fit per instrument and pair of fit limits
+        self.assertEquals(len(nitfunc._nitrate_fit_cache), 4)
+
+        # a single packet gives the same result
+        for i in (0, 3, 41, 59):
+            out = ts_corrected_nitrate(cal_temp[i:i+1], wl[i:i+1], eno3[i:i+1],
+                                       eswa[i:i+1], di[i:i+1], dark_value[i:i+1],
+                                       ctd_t[i:i+1], ctd_sp[i:i+1], data_in[i:i+1],
+                                       frame_type[i:i+1], wllower[i], wlupper[i])
+            np.testing.assert_allclose(out, expected[i:i+1], rtol=1e-8, atol=1e-8)
+
+        # the cache is bounded
+        for k in xrange(nitfunc.NITRATE_FIT_CACHE_SIZE + 5):
+            ts_corrected_nitrate(cal_temp[:1], wl[:1] + k, eno3[:1], eswa[:1],
+                                 di[:1], dark_value[:1], ctd_t[:1], ctd_sp[:1],
+                                 data_in[:1], frame_type[:1])
+        self.assertEquals(len(nitfunc._nitrate_fit_cache), nitfunc.NITRATE_FIT_CACHE_SIZE)
+        nitfunc._nitrate_fit_cache.clear()
@@ -584,6 +584,73 @@ class TestOptFunctionsUnit(BaseUnitTestCase):
                                                    tbins, tarr, cpd_ts, cwlngth, T, PS)
         np.testing.assert_allclose(a_ts_s700, apd_ts_s_ref700, rtol=1e-6, atol=1e-6)
 
+    def test_opt_functions_OPTAA_packets(self):
+        """
+        Test the *_packets versions of the OPTAA sub-functions, used by the wrapper
+        functions, against the sub-functions applied packet by packet. The packets
+        have different internal temperatures and two sets of wavelengths, one of
+        them outside of the range of valid temperature and salinity corrections.
+        """
+        rng = np.random.RandomState(0)
+        npackets, nwlngth, ntbins = 20, 8, 7
+        traw = rng.randint(45000, 52000, npackets)
+        Tcal = np.zeros(npackets) + 20.0
+        T = rng.uniform(2.0, 20.0, npackets)
+        PS = rng.uniform(30.0, 36.0, npackets)
+        cwlngth = np.tile(np.linspace(398.5, 750.0, nwlngth), (npackets, 1))
+        awlngth = np.tile(np.linspace(410.0, 715.0, nwlngth), (npackets, 1))
+        awlngth[::2] = np.linspace(400.0, 761.2, nwlngth)
+        cwlngth, awlngth = np.around(cwlngth, 1), np.around(awlngth, 1)
+        ref = rng.randint(400, 600, (npackets, nwlngth))
+        sig = rng.randint(100, 500, (npackets, nwlngth))
+        off = rng.uniform(0.1, 1.4, (npackets, nwlngth))
+        tbins = np.tile(np.linspace(0.0, 35.0, ntbins), (npackets, 1))
+        tarr = rng.uniform(-0.005, 0.0, (npackets, nwlngth, ntbins))
+
+        tintrn = optfunc.opt_internal_temp(traw)
+        c, dT = optfunc.opt_pd_calc_packets(ref, sig, off, tintrn, tbins, tarr)
+        c_ts = optfunc.opt_tempsal_corr_packets('c', c, cwlngth, Tcal, T, PS)
+        a_ts = optfunc.opt_tempsal_corr_packets('a', c, awlngth, Tcal, T, PS)
+        a_ts_s = optfunc.opt_scatter_corr_packets(a_ts, awlngth, c_ts, cwlngth, 600.0)
+        for ii in range(npackets):
+            xc, xdT = optfunc.opt_pd_calc(ref[ii], sig[ii], off[ii], tintrn[ii], tbins[ii], tarr[ii])
+            np.testing.assert_array_equal(c[ii], xc)
+            np.testing.assert_array_equal(dT[ii], xdT)
+            xc_ts = optfunc.opt_tempsal_corr('c', xc, cwlngth[ii], Tcal[ii], T[ii], PS[ii])
+            np.testing.assert_array_equal(c_ts[ii], xc_ts)
+            xa_ts = optfunc.opt_tempsal_corr('a', xc, awlngth[ii], Tcal[ii], T[ii], PS[ii])
+            np.testing.assert_array_equal(a_ts[ii], xa_ts)
+            xa_ts_s = optfunc.opt_scatter_corr(xa_ts, awlngth[ii], xc_ts, cwlngth[ii], 600.0)
+            np.testing.assert_array_equal(a_ts_s[ii], xa_ts_s)
+        self.assertTrue(np.any(np.isnan(c_ts)))
+
+        # the internal temperature must be bracketed by the temperature bins
+        np.testing.assert_raises(IndexError, optfunc.opt_pd_calc_packets, ref, sig, off,
+                                 tintrn + 40.0, tbins, tarr)
+
+    def test_opt_tscor(self):
+        """
+        Test the look-up of the temperature and salinity correction coefficients
+        in the wavelength grid array against the tscor dictionary.
+        """
+        from ion_functions.data.opt_functions_tscor import tscor
+
+        wlngth = np.array(sorted(tscor.keys()))
+        xpctd = np.array([tscor[ii] for ii in wlngth])
+        np.testing.assert_array_equal(optfunc.opt_tscor(wlngth), xpctd)
+
+        # 2D wavelength arrays, and wavelength sets are cached
+        wlngth = np.array([[398.5, 540., 580.1, 761.2], [400.0, 510.3, 755.0, 755.1]])
+        xpctd = np.array([[tscor[ii] for ii in row] for row in wlngth])
+        np.testing.assert_array_equal(optfunc.opt_tscor(wlngth), xpctd)
+        calc = optfunc.opt_tscor(wlngth[0])
+        np.testing.assert_array_equal(calc, xpctd[0])
+        self.assertTrue(optfunc.opt_tscor(list(wlngth[0])) is calc)
+
+        # wavelengths that are not keys of the dictionary
+        for wl in (379.9, 775.1, 510.05):
+            np.testing.assert_raises(KeyError, optfunc.opt_tscor, np.array([500.0, wl]))
+
     def test_opt_par_satlantic(self):
         """
         Test the opt_par_satlantic function.
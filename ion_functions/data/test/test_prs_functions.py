@@ -10,6 +10,9 @@
 from nose.plugins.attrib import attr
 from ion_functions.test.base_test import BaseUnitTestCase
 
+import os
+import shutil
+import tempfile
 import numpy as np
 import scipy.io as sio
 import datetime as dt
@@ -207,6 +210,36 @@ class TestPRSFunctionsUnit(BaseUnitTestCase):
         # How'd we do?
         np.testing.assert_array_equal(out, ccmp)
 
+    def test_prs_bottilt_ccmp_table(self):
+        """
+        Test prs_bottilt_ccmp against the (serial number, compass direction) keyed
+        lookup table for every entry, with the serial numbers mixed in one call.
+        """
+        from ion_functions.data.prs_functions_ccmp import cmp_lookup
+
+        keys = sorted(cmp_lookup.keys())
+        np.random.RandomState(0).shuffle(keys)
+        sn = np.array([key[0] for key in keys])
+        scmp = np.array([key[1] for key in keys], dtype=float)
+        xpctd = np.array([cmp_lookup[key] for key in keys])
+
+        # the compass directions are rounded to the nearest integer, halves away from zero
+        offset = np.random.RandomState(1).uniform(-0.49, 0.49, scmp.size)
+        offset[scmp == 0] = np.abs(offset[scmp == 0])
+        offset[scmp == 360] = -np.abs(offset[scmp == 360])
+        np.testing.assert_array_equal(prsfunc.prs_bottilt_ccmp(scmp, sn), xpctd)
+        np.testing.assert_array_equal(prsfunc.prs_bottilt_ccmp(scmp + offset, sn), xpctd)
+        calc = prsfunc.prs_bottilt_ccmp(np.array([0.5, 10.5, 359.5]), np.array(['N9651'] * 3))
+        np.testing.assert_array_equal(calc, [cmp_lookup[('N9651', 1)],
+                                             cmp_lookup[('N9651', 11)],
+                                             cmp_lookup[('N9651', 360)]])
+
+        # unknown serial numbers and compass directions
+        np.testing.assert_raises(KeyError, prsfunc.prs_bottilt_ccmp,
+                                 np.array([10.0]), np.array(['N0000']))
+        np.testing.assert_raises(ValueError, prsfunc.prs_bottilt_ccmp,
+                                 np.array([360.5]), np.array(['N9651']))
+
     def test_prs_bottilt_tmag(self):
         """
         Test prs_bottilt_tmag function.
@@ -429,6 +462,40 @@ class TestPRSFunctionsUnit(BaseUnitTestCase):
         predtide = prsfunc.prs_botsflu_predtide(ooi_timestamps)
         np.testing.assert_allclose(predtide, xpctd_tides, rtol=0, atol=1.e-6)
 
+    def test_load_tide_table(self):
+        """
+        Test that the memory-mapped tide table holds the values of the matfile and
+        is read once per process.
+        """
+        tidefile = 'matlab_scripts/botpt/tides_15sec_2011_for_unit_tests.mat'
+        dict_tides = sio.loadmat('ion_functions/data/' + tidefile)
+        xpctd = dict_tides['tides_mat'].reshape((-1))
+
+        tidevector = prsfunc.load_tide_table(tidefile)
+        np.testing.assert_array_equal(tidevector, xpctd)
+        self.assertEquals(tidevector.dtype, np.int32)
+        self.assertTrue(tidevector is prsfunc.load_tide_table(tidefile))
+
+        # the predicted tides are the scaled table values
+        time0 = 3502828800.0  # midnight, 2011-01-01
+        idx = np.array([3000, 3001, 400000])
+        predtide = prsfunc.prs_botsflu_predtide(time0 + 15.0 * idx)
+        np.testing.assert_array_equal(predtide, 0.000001 * xpctd[idx])
+
+        # a .npy copy left from an older matfile is written again
+        tmpdir = tempfile.mkdtemp()
+        try:
+            matpath = os.path.join(tmpdir, 'tides.mat')
+            shutil.copy('ion_functions/data/' + tidefile, matpath)
+            np.save(os.path.join(tmpdir, 'tides.npy'), np.zeros(10, dtype=np.int32))
+            os.utime(os.path.join(tmpdir, 'tides.npy'), (0, 0))
+            tidevector = prsfunc.load_tide_table(matpath)
+            np.testing.assert_array_equal(tidevector, xpctd)
+            del tidevector
+            prsfunc._tide_tables.pop(matpath)
+        finally:
+            shutil.rmtree(tmpdir)
+
     def test_prs_botsflu_meandepth(self):
         """
         Test the calculation of MEANDEPTH.
@@ -516,6 +583,99 @@ class TestPRSFunctionsUnit(BaseUnitTestCase):
         calc = b_8wkrate[self.idx_24h]
         np.testing.assert_allclose(calc, xpctd_8wkrate, rtol=0, atol=1.e-4)
 
+    def test_prs_botsflu_all(self):
+        """
+        Test that prs_botsflu_all returns the data products and event notifications
+        of the individual functions.
+        """
+        # 60 days of 0.5 Hz data (so that the 8wkrate is not all nans) covered
+        # by the unit test tide table, with a data gap of half a day.
+        time0 = 3505507200.0  # midnight, 2011-02-01
+        timestamp = time0 + 2.0 * np.arange(60 * 43200) + 0.525
+        timestamp = np.delete(timestamp, np.s_[20 * 43200:20 * 43200 + 21600])
+        rng = np.random.RandomState(0)
+        depth = -1510.85 - 0.002 * rng.randn(timestamp.size)
+        depth[timestamp > time0 + 45 * 86400.0] -= 2.0
+        botpres = np.around(depth / -0.67, decimals=4)
+
+        products = prsfunc.prs_botsflu_all(timestamp, botpres)
+
+        time15s = prsfunc.prs_botsflu_time15s(timestamp)
+        xpctd = {
+            'time15s': time15s,
+            'meanpres': prsfunc.prs_botsflu_meanpres(timestamp, botpres),
+            'predtide': prsfunc.prs_botsflu_predtide(time15s),
+            'meandepth': prsfunc.prs_botsflu_meandepth(timestamp, botpres),
+            '5minrate': prsfunc.prs_botsflu_5minrate(timestamp, botpres),
+            '10minrate': prsfunc.prs_botsflu_10minrate(timestamp, botpres),
+            'time24h': prsfunc.prs_botsflu_time24h(time15s),
+            'daydepth': prsfunc.prs_botsflu_daydepth(timestamp, botpres),
+            '4wkrate': prsfunc.prs_botsflu_4wkrate(timestamp, botpres),
+            '8wkrate': prsfunc.prs_botsflu_8wkrate(timestamp, botpres)
+        }
+        self.assertEquals(sorted(products.keys()),
+                          sorted(xpctd.keys() + ['tsunami_detection', 'eruption_imminent',
+                                                 'eruption_occurred']))
+        for name in xpctd:
+            np.testing.assert_array_equal(products[name], xpctd[name])
+        self.assertTrue(np.any(np.isfinite(products['8wkrate'])))
+
+        # the flags are those of the (unmodified) rate products
+        self.assertEquals(products['tsunami_detection'],
+                          prsfunc.prs_tsunami_detection(xpctd['5minrate']))
+        self.assertEquals(products['eruption_imminent'],
+                          prsfunc.prs_eruption_imminent(np.copy(xpctd['10minrate'])))
+        self.assertEquals(products['eruption_occurred'],
+                          prsfunc.prs_eruption_occurred(xpctd['10minrate']))
+        self.assertTrue(products['tsunami_detection'])
+        self.assertTrue(np.any(np.isnan(products['5minrate'])))
+
+    def test_botsflu_stream(self):
+        """
+        Test that BotsfluStream, fed the data in chunks, returns the data products
+        and event notifications of prs_botsflu_all.
+        """
+        time0 = 3505507200.0  # midnight, 2011-02-01
+        timestamp = time0 + 2.0 * np.arange(60 * 43200) + 0.525
+        timestamp = np.delete(timestamp, np.s_[20 * 43200:20 * 43200 + 21600])
+        rng = np.random.RandomState(0)
+        depth = -1510.85 - 0.002 * rng.randn(timestamp.size)
+        depth[timestamp > time0 + 45 * 86400.0] -= 2.0
+        botpres = np.around(depth / -0.67, decimals=4)
+
+        xpctd = prsfunc.prs_botsflu_all(timestamp, botpres)
+
+        for max_chunk in (5000, 1000000):
+            stream = prsfunc.BotsfluStream()
+            products = []
+            start = 0
+            while start < timestamp.size:
+                stop = start + rng.randint(0, max_chunk + 1)
+                products.append(stream.update(timestamp[start:stop], botpres[start:stop]))
+                start = stop
+            products.append(stream.flush())
+
+            for name in xpctd:
+                if name in ('tsunami_detection', 'eruption_imminent', 'eruption_occurred'):
+                    self.assertEquals(any(p[name] for p in products), xpctd[name])
+                    continue
+                calc = np.concatenate([p[name] for p in products])
+                if name in ('10minrate', '4wkrate', '8wkrate'):
+                    # the filter states carry partial sums across the calls
+                    np.testing.assert_allclose(calc, xpctd[name], rtol=0, atol=1.e-6)
+                else:
+                    np.testing.assert_array_equal(calc, xpctd[name])
+
+        # the 15sec products of a bin are returned as soon as it is complete: 30
+        # values at 2 sec intervals complete 4 bins, and the last 4 values are
+        # those of the open bin.
+        stream = prsfunc.BotsfluStream()
+        products = stream.update(timestamp[:30], botpres[:30])
+        np.testing.assert_array_equal(products['time15s'], xpctd['time15s'][:4])
+        np.testing.assert_array_equal(stream._time, timestamp[26:30])
+        # data for a bin that has already been returned
+        np.testing.assert_raises(ValueError, stream.update, timestamp[:1], botpres[:1])
+
     def test_prs_tsunami_detection(self):
         """
         Test prs_tsunami_detection.
@@ -16,6 +16,7 @@ from ion_functions.data.vel_functions import velpt_mag_corr_east, velpt_mag_corr
 from ion_functions.data.vel_functions import velpt_up_vel
 from ion_functions.data.vel_functions import vel3dk_east, vel3dk_north
 from ion_functions.data.vel_functions import vel3dk_up
+from ion_functions.data.vel_functions import generate_ENU_transform, generate_ENU_transforms
 from ion_functions.data.vel_functions import valid_lat, valid_lon
 from ion_functions.data.vel_functions import vel_mag_correction
 from ion_functions.data.vel_functions import fsi_acm_rsn_east, fsi_acm_rsn_north
@@ -416,6 +417,21 @@ class TestVelFunctionsUnit(BaseUnitTestCase):
         np.testing.assert_array_almost_equal(vn_calcd, VN_expected, decimal=7)
         np.testing.assert_array_almost_equal(vu_calcd, vU_expected, decimal=7)
 
+    def test_generate_ENU_transforms(self):
+        """
+        Tests that the stacked cartesian-to-Earth transforms used by
+        vel3dk_transform match the single record transforms.
+        """
+        hdg = 0.1 * HDG
+        ptch = 0.1 * PTCH
+        rll = 0.1 * RLL
+        transforms = generate_ENU_transforms(hdg, ptch, rll)
+        self.assertEquals(transforms.shape, (hdg.size, 3, 3))
+        for ii in range(hdg.size):
+            np.testing.assert_allclose(
+                transforms[ii], generate_ENU_transform(hdg[ii], ptch[ii], rll[ii]),
+                rtol=1e-14, atol=1e-15)
+
     def test_zero_case(self, ):
         """
         Tests the case of all zero inputs to the main function
@@ -10,7 +10,7 @@ import numpy as np
 import numexpr as ne
 from numpy import sin, cos, radians
 
-from ion_functions.data.generic_functions import magnetic_declination, magnetic_correction
+from ion_functions.data.generic_functions import magnetic_declination, magnetic_rotation
 
 # NOTE:
 #    The previous version of this module had each function return an
@@ -69,6 +69,7 @@ Subfunctions:
     generate_beam_transforms  -- used by vel3d-k
     get_XYZ_transform         -- used by vel3d-k
     generate_ENU_transform    -- used by vel3d-k
+    generate_ENU_transforms   -- used by vel3d-k
     vel3dk_transform          -- used by vel3d-k
     vel_mag_correction        -- used by most of the horz vel fns
 
@@ -1791,6 +1792,60 @@ def generate_ENU_transform(heading, pitch, roll):
     return XYZ2ENU
 
 
+def generate_ENU_transforms(heading, pitch, roll):
+    """
+    Description:
+        Vectorized version of generate_ENU_transform. Creates the
+        cartesian-to-Earth coordinate transform matrices for arrays of
+        heading, pitch, and roll data from the attitude sensor on board
+        the Aquadopp II, one matrix per record.
+
+    Usage:
+        XYZ2Earth_trans = generate_ENU_transforms(heading, pitch, roll)
+
+        where
+
+        XYZ2Earth_trans = (N, 3, 3) array of the cartesian-to-Earth
+            coordinate transform matrices, where XYZ2Earth_trans[i] is the
+            matrix returned by generate_ENU_transform(heading[i],
+            pitch[i], roll[i]).
+        heading, pitch, roll = (N,) arrays of the attitude measurements by
+            the Aquadopp II velocity instrument [degrees].
+    """
+    heading = np.radians(np.atleast_1d(heading).astype(np.float))
+    # need to make pitch and roll angles negative so that rotation matrices
+    # effectively unpitch and unroll the data
+    pitch = np.radians(-1.0 * np.atleast_1d(pitch))
+    roll = np.radians(-1.0 * np.atleast_1d(roll))
+    nrec = heading.size
+
+    # "un"-roll transform matrices
+    Rx = np.zeros((nrec, 3, 3))
+    Rx[:, 0, 0] = 1.0
+    Rx[:, 1, 1] = cos(roll)
+    Rx[:, 1, 2] = sin(roll)
+    Rx[:, 2, 1] = -sin(roll)
+    Rx[:, 2, 2] = cos(roll)
+    # "un"-pitch transform matrices
+    Ry = np.zeros((nrec, 3, 3))
+    Ry[:, 0, 0] = cos(pitch)
+    Ry[:, 0, 2] = -sin(pitch)
+    Ry[:, 1, 1] = 1.0
+    Ry[:, 2, 0] = sin(pitch)
+    Ry[:, 2, 2] = cos(pitch)
+    # "un"-heading transform matrices
+    Rz = np.zeros((nrec, 3, 3))
+    Rz[:, 0, 0] = cos(heading)
+    Rz[:, 0, 1] = sin(heading)
+    Rz[:, 1, 0] = -sin(heading)
+    Rz[:, 1, 1] = cos(heading)
+    Rz[:, 2, 2] = 1.0
+
+    # multiply together to create the XYZ to Earth coordinate transforms
+    XYZ2ENU = np.matmul(np.matmul(Rz, Ry), Rx)
+    return XYZ2ENU
+
+
 def vel3dk_transform(
         vel0, vel1, vel2, heading, pitch, roll, beams, vel3=0):
     """
@@ -1911,25 +1966,24 @@ def vel3dk_transform(
     heading = heading[mask]
     pitch = pitch[mask]
     roll = roll[mask]
-    data = data[:, mask]
-    # initialize loop product variable
-    ENU_loop = np.matrix(np.ones_like(data)) * np.nan  # East, North, Up velocities
-
-    # Now grab the first beam configuration and the transform to start
-    beams_used = list(beams[0, :])
-    t_beam2XYZ = get_XYZ_transform(beams_used)
+    data = np.asarray(data[:, mask], dtype=np.float)
 
     # need a transformation matrix for each measurement
     # because Heading Pitch & Roll will change with each record
-    for ii in range(np.size(heading)):
-        if list(beams[ii, :]) != beams_used:
-            beams_used = list(beams[ii, :])
-            t_beam2XYZ = get_XYZ_transform(beams_used)
-        t_XYZ2ENU = generate_ENU_transform(heading[ii], pitch[ii], roll[ii])
-        ENU_loop[:, ii] = t_XYZ2ENU * t_beam2XYZ * data[:, ii]
+    t_XYZ2ENU = generate_ENU_transforms(heading, pitch, roll)
+
+    # the records are transformed in groups sharing the same beam
+    # configuration (and so the same beam-to-XYZ transform)
+    ENU_good = np.empty((t_XYZ2ENU.shape[1], data.shape[1]))
+    configs, inverse = np.unique(beams, axis=0, return_inverse=True)
+    for ii, beams_used in enumerate(configs):
+        t_beam2XYZ = np.asarray(get_XYZ_transform(list(beams_used)))
+        idx = np.flatnonzero(inverse == ii)
+        transform = np.matmul(t_XYZ2ENU[idx], t_beam2XYZ)
+        ENU_good[:, idx] = np.einsum('nij,jn->in', transform, data[:, idx])
 
-    # now insert calculated loop product into output variable
-    ENU[:, mask] = ENU_loop
+    # now insert calculated product into output variable
+    ENU[:, mask] = ENU_good
 
     return ENU
 
@@ -2001,8 +2055,7 @@ def vel_mag_correction(u, v, lat, lon, ntp_timestamp, z=0.0, zflag=-1):
     theta = magnetic_declination(lat, lon, ntp_timestamp, z, zflag)
 
     # apply the magnetic declination correction
-    magvar = np.vectorize(magnetic_correction)
-    u_cor, v_cor = magvar(theta, u, v)
+    u_cor, v_cor = magnetic_rotation(theta, u, v)
 
     return u_cor, v_cor
 
@@ -7,7 +7,7 @@
 """
 import numpy as np
 
-from ion_functions.data.generic_functions import magnetic_declination
+from ion_functions.data.generic_functions import magnetic_declination, magnetic_rotation
 from ion_functions.utils import fill_value
 
 
@@ -446,10 +446,9 @@ def magnetic_correction_einsum(theta, u, v):
     """
     Description:
 
-        The executable code in this function is identical to that in the function
-        magnetic_correction_vctrzd in the module adcp_functions. At some point in
-        the future the function magnetic_correction in generic_functions may be
-        deprecated and replaced with this vectorized and much faster version.
+        This function and the function magnetic_correction in the module
+        adcp_functions both rotate the vectors with the kernel magnetic_rotation
+        in generic_functions, shared by all the magnetic corrections.
 
         This function corrects velocity profiles for the magnetic variation
         (declination) at the measurement location.  The magnetic declination
@@ -501,37 +500,11 @@ def magnetic_correction_einsum(theta, u, v):
     """
     # force shapes of inputs to arrays
     theta = np.atleast_1d(theta)
-    uv = np.atleast_2d(u)
+    u = np.atleast_2d(u)
     v = np.atleast_2d(v)
 
-    theta_rad = np.radians(theta)
-    cosT = np.cos(theta_rad)
-    sinT = np.sin(theta_rad)
-
-    # set up rotation matrix
-    M = np.array([[cosT, sinT],
-                  [-sinT, cosT]])
-
-    # roll axes so that the lead index represents data packet #.
-    M = np.rollaxis(M, 2)
-
-    # construct the uncorrected velocity matrix.
-    # the coordinate system is 2D, so the middle dimension is sized at 2.
-    uv = np.zeros((u.shape[0], 2, u.shape[1]))
-
-    # load the coordinates to be rotated into the appropriate slices
-    uv[:, 0, :] = u
-    uv[:, 1, :] = v
-
-    # the Einstein summation is here configured to do the matrix
-    # multiplication uv_cor(i,k) = M(i,j) * uv(j,k) on each slice h.
-    uv_cor = np.einsum('hij,hjk->hik', M, uv)
-
-    # the magnetically corrected u values are:
-    u_cor = uv_cor[:, 0, :]
-
-    # the magnetically corrected v values are:
-    v_cor = uv_cor[:, 1, :]
+    # rotate the coordinates of each packet by its theta
+    u_cor, v_cor = magnetic_rotation(theta, u, v)
 
     # return corrected u and v values
     return (u_cor, v_cor)
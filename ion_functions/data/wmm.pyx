@@ -4,6 +4,7 @@ cimport numpy as np
 cimport cython
 import os
 import datetime
+import threading
 import pkg_resources
 
 np.import_array()
@@ -22,8 +23,25 @@ cdef extern from "wmm.h":
 
     int wmm_initialize(char *filename, WMM_Model **model)
     int wmm_free(WMM_Model *model)
-    double wmm_declination(WMM_Model *model, double lat, double lon, double z, int year, int month, int day)
-    size_t wmm_velocity_correction(velocity_profile *in_vp, WMM_Model *model, velocity_profile *out_vp)
+    double wmm_declination(WMM_Model *model, double lat, double lon, double z, int year, int month, int day) nogil
+    size_t wmm_velocity_correction(velocity_profile *in_vp, WMM_Model *model, velocity_profile *out_vp) nogil
+
+cdef extern from "time.h":
+    ctypedef long time_t
+    struct tm:
+        int tm_year
+        int tm_mon
+        int tm_mday
+    tm *gmtime_r(time_t *timep, tm *result) nogil
+
+# Seconds between the NTP (1900-01-01) and UNIX (1970-01-01) epochs
+cdef double NTP_OFFSET = 2208988800.
+
+# wmm_declination time adjusts the coefficients in place in the model, and
+# models are shared between WMM instances initialized from the same file, so
+# the computations are serialized on this lock. The GIL is released while
+# they run so threads running other kernels are not held up.
+_model_lock = threading.Lock()
 
 cdef class WMM:
     # CSF change this to us a pointer to a WMM_Model.  wmm_initialize will
@@ -70,9 +88,61 @@ cdef class WMM:
             raise TypeError("date is not a datetime.date object")
 
 
-        cdef retval = wmm_declination(<WMM_Model *>self.model, <double>lat, <double>lon, <double>z, <int> date.year, <int> date.month, <int> date.day)
+        cdef int year = date.year
+        cdef int month = date.month
+        cdef int day = date.day
+        cdef double retval
+        with _model_lock:
+            with nogil:
+                retval = wmm_declination(<WMM_Model *>self.model, lat, lon, z, year, month, day)
         return retval
 
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def declination_array(self, lat, lon, z, ntp_timestamps):
+        '''
+        Vectorized declination, broadcasting the inputs against each other.
+        The declination is evaluated once for each distinct combination of
+        position and UTC day (the model resolves time to a day), so long
+        records from a fixed platform cost one evaluation per day.
+        lat: degrees north
+        lon: degrees east
+        z: km (MSL)
+        ntp_timestamps: NTP timestamps (seconds since 1900-01-01)
+        '''
+        args = [np.asanyarray(a, dtype=np.float) for a in (lat, lon, z)]
+        ts = np.asanyarray(ntp_timestamps, dtype=np.float)
+        shape = np.broadcast(ts, *args).shape
+        days = np.floor((ts - NTP_OFFSET) / 86400.)
+
+        if all(a.size == 1 for a in args):
+            # Fixed position, only the days differ
+            udays, inverse = np.unique(np.broadcast_to(days, shape).ravel(), return_inverse=True)
+            keys = np.empty((udays.size, 4), dtype=np.float)
+            keys[:, :3] = [a.flat[0] for a in args]
+            keys[:, 3] = udays
+        else:
+            keys = np.column_stack([np.broadcast_to(a, shape).ravel() for a in args + [days]])
+            keys = np.ascontiguousarray(keys)
+            rows = keys.view(np.dtype((np.void, keys.dtype.itemsize * 4))).ravel()
+            _, index, inverse = np.unique(rows, return_index=True, return_inverse=True)
+            keys = keys[index]
+
+        cdef np.ndarray[double, ndim=2] ukeys = np.ascontiguousarray(keys)
+        cdef np.ndarray[double] decl = np.empty(ukeys.shape[0], dtype=np.float)
+        cdef Py_ssize_t i, n = ukeys.shape[0]
+        cdef time_t t
+        cdef tm date
+        with _model_lock:
+            with nogil:
+                for i in range(n):
+                    t = <time_t>(ukeys[i, 3] * 86400.)
+                    gmtime_r(&t, &date)
+                    decl[i] = wmm_declination(<WMM_Model *>self.model,
+                                              ukeys[i, 0], ukeys[i, 1], ukeys[i, 2],
+                                              date.tm_year + 1900, date.tm_mon + 1, date.tm_mday)
+        return decl[inverse].reshape(shape)
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
     def velocity_correction(self, uu, vv, lat, lon, z, timestamp, zflag=-1):
@@ -129,7 +199,9 @@ cdef class WMM:
         out_vp.uu = &uu_cor[0]
         out_vp.vv = &vv_cor[0]
 
-        retval = wmm_velocity_correction(&in_vp, self.model, &out_vp)
+        with _model_lock:
+            with nogil:
+                retval = wmm_velocity_correction(&in_vp, self.model, &out_vp)
         if retval != uu.shape[0]:
             raise RuntimeError("Failed to Process All Vector Elements")
         return uu_cor, vv_cor
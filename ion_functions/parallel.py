@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+@package ion_functions.parallel
+@file ion_functions/parallel.py
+@brief Runs the compiled kernels over long records on a pool of threads
+
+The C kernels behind the QC tests release the GIL, so splitting a long record
+into chunks and running them on threads scales across cores. Kernels whose
+output at a value depends on the values around it are given overlapping
+chunks: each chunk is extended by a halo of values on both sides, which are
+computed and discarded, so the result is that of a single call on the whole
+record. (The spike test of windows longer than the kernel evaluates directly
+keeps a running sum of each window from the start of its input, so a value
+within rounding of the threshold may be flagged differently than in a single
+call.)
+"""
+
+import numpy as np
+from multiprocessing import cpu_count
+
+# concurrent.futures is only in the standard library from Python 3 (the
+# futures backport provides it for Python 2), fall back to the thread pool of
+# multiprocessing if it is unavailable.
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+    from multiprocessing.pool import ThreadPool
+
+from ion_functions.qc import qc_functions as qcfunc
+
+# Below this many values per chunk the thread overhead outweighs the gain
+MIN_CHUNK_SIZE = 65536
+
+
+def _map(func, items, workers):
+    if ThreadPoolExecutor is not None:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def chunk_bounds(n, halo, workers=None, chunk_size=None, window=1):
+    '''
+    Splits range(n) into chunks for the workers. Returns a list of
+    (start, stop, lo, hi) tuples, where [start, stop) is the part of the
+    output produced by the chunk and [lo, hi) the input it is computed from,
+    the chunk extended by up to halo values on each side. The input of a
+    chunk is at least window values long (the first and last chunks are
+    extended further into the record if need be).
+    '''
+    workers = workers or cpu_count()
+    if chunk_size is None:
+        chunk_size = max(MIN_CHUNK_SIZE, -(-n // workers))
+    # A chunk must be at least as long as its halos for the kernels to see
+    # full windows
+    chunk_size = max(int(chunk_size), 2 * halo + 1, 1)
+    bounds = []
+    for start in xrange(0, n, chunk_size):
+        stop = min(n, start + chunk_size)
+        lo = max(0, start - halo)
+        hi = min(n, max(stop + halo, lo + window))
+        lo = max(0, min(lo, hi - window))
+        bounds.append((start, stop, lo, hi))
+    return bounds
+
+
+def map_chunks(func, arrays, halo=0, workers=None, chunk_size=None, window=1):
+    '''
+    Calls func(*chunks) for overlapping chunks of the 1-D arrays (all of the
+    same length) on a thread pool and returns the concatenated results.
+
+    func must return a vector with one value per input value, whose value at
+    i depends only on the inputs within halo values of i (values within halo
+    of either end of a record may be computed differently, e.g. against the
+    first/last window of window values).
+    '''
+    arrays = [np.asanyarray(a) for a in arrays]
+    n = arrays[0].shape[0]
+    bounds = chunk_bounds(n, halo, workers, chunk_size, window)
+    if len(bounds) <= 1:
+        return func(*arrays)
+
+    def run(bound):
+        start, stop, lo, hi = bound
+        out = func(*[a[lo:hi] for a in arrays])
+        return out[start - lo:stop - lo]
+
+    return np.concatenate(_map(run, bounds, workers or cpu_count()))
+
+
+def spiketest(dat, acc, N=5, L=5, workers=None, chunk_size=None):
+    '''
+    dataqc_spiketest on a thread pool. A value depends on the L/2 values on
+    either side of it, the first and last L/2 values on the first/last L values.
+    '''
+    L = int(L)
+    return map_chunks(lambda d: qcfunc.dataqc_spiketest(d, acc, N, L),
+                      [np.asanyarray(dat, dtype=np.float)], L // 2, workers, chunk_size,
+                      max(L, 1))
+
+
+def stuckvaluetest(x, reso, num=10, workers=None, chunk_size=None):
+    '''
+    dataqc_stuckvaluetest on a thread pool. A value depends on the num-1
+    values on either side of it.
+    '''
+    num = int(np.abs(num))
+    x = np.asanyarray(x, dtype=np.float)
+    if x.size < num:
+        return qcfunc.dataqc_stuckvaluetest(x, reso, num)
+    return map_chunks(lambda d: qcfunc.dataqc_stuckvaluetest(d, reso, num),
+                      [x], max(num - 1, 0), workers, chunk_size, max(num, 1))
+
+
+def globalrangetest(dat, datlim, workers=None, chunk_size=None):
+    '''
+    dataqc_globalrangetest on a thread pool.
+    '''
+    return map_chunks(lambda d: qcfunc.dataqc_globalrangetest(d, datlim),
+                      [dat], 0, workers, chunk_size)
+
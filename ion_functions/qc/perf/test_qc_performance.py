@@ -5,8 +5,12 @@ from ion_functions.qc.qc_functions import dataqc_stuckvaluetest as stuckvalue
 from ion_functions.qc.qc_functions import dataqc_polytrendtest as trend
 from ion_functions.qc.qc_functions import dataqc_gradienttest as grad
 from ion_functions.qc.qc_functions import dataqc_localrangetest as local
+from ion_functions.qc.qc_functions import dataqc_fusedtest as fused
+from ion_functions.qc.qc_functions import dataqc_solarelevation as solarelevation
 from ion_functions.qc.qc_functions import ntp_to_month
 
+from ion_functions import parallel
+
 import numpy as np
 import unittest
 
@@ -36,6 +40,35 @@ class TestQCPerformance(PerformanceTestCase):
         self.profile(stats, spiketest, sample_set, 0.1)
 
 
+    def test_spiketest_window_sweep(self):
+        sample_set = np.empty(a_year, dtype=np.float)
+        sample_set.fill(3)
+        indexes = [i for i in xrange(a_day * 2) if not i%20]
+        sample_set[indexes] = 40
+
+        # The sliding window kernel should not depend on the window length
+        for L in [5, 11, 51, 201, 1001, 2001]:
+            stats = []
+            print 'L = %i' % L
+            self.profile(stats, spiketest, sample_set, 0.1, 5, L)
+
+
+    def test_spiketest_batched(self):
+        # An ensemble matrix, 50 bins of a day of 1 Hz data
+        stats = []
+        sample_set = np.random.randn(50, a_day)
+        sample_set[:, ::20] = 40
+        self.profile(stats, spiketest, sample_set, 0.1, 5, 5, False, False, 1)
+
+    def test_spiketest_parallel(self):
+        # The kernels release the GIL, so this should scale with the cores
+        sample_set = np.random.randn(a_year)
+        sample_set[::20] = 40
+        for workers in [1, 2, 4, 8]:
+            stats = []
+            print 'workers = %i' % workers
+            self.profile(stats, parallel.spiketest, sample_set, 0.1, 5, 51, workers)
+
     def test_stuckvalue(self):
         stats = []
         
@@ -44,6 +77,16 @@ class TestQCPerformance(PerformanceTestCase):
         sample_set[0:len(v)] = v
         self.profile(stats, stuckvalue, sample_set, 0.001, 4)
 
+    def test_stuckvalue_num_sweep(self):
+        sample_set = np.arange(a_year, dtype=np.float)
+        sample_set[a_day:a_day * 2] = 3.33 # a stuck day
+
+        # The single pass kernel should not depend on num
+        for num in [10, 100, 1000]:
+            stats = []
+            print 'num = %i' % num
+            self.profile(stats, stuckvalue, sample_set, 0.001, num)
+
     def test_trend(self):
         stats = []
         x = np.arange(a_year, dtype=np.float)
@@ -56,6 +99,26 @@ class TestQCPerformance(PerformanceTestCase):
 
         self.profile(stats, grad, sample_set, sample_set, [-50,50], .1, [], 5)
 
+    def test_fused(self):
+        x = np.arange(a_year, dtype=np.float)
+        sample_set = np.sin(np.pi * 2 * x/60.) * 6 + 3.
+        sample_set[a_day:a_day * 2] = 3.33
+        indexes = [i for i in xrange(a_day * 2) if not i%20]
+        sample_set[indexes] = 40
+
+        def separate(dat, x):
+            grt(dat, -10, 10)
+            spiketest(dat, 0.1)
+            stuckvalue(dat, 0.001, 10)
+            grad(dat, x, [-50, 50], .1, [], 5)
+
+        stats = []
+        print 'separate'
+        self.profile(stats, separate, sample_set, x)
+        stats = []
+        print 'fused'
+        self.profile(stats, fused, sample_set, x, [-10, 10], (0.1, 5, 5), (0.001, 10), ([-50, 50], .1, [], 5))
+
     def test_local_range(self):
         stats = []
         dat = np.sin(np.arange(a_year) / 60.) * 4 + 2
@@ -65,6 +128,31 @@ class TestQCPerformance(PerformanceTestCase):
         datlimz = np.arange(a_year)
         self.profile(stats, local, dat, z, datlim, datlimz)
 
+    def test_local_range_2d(self):
+        # A limits table fixed per deployment, applied granule by granule
+        stats = []
+        np.random.seed(1)
+        datlimz = np.column_stack([np.random.rand(2000) * 100, np.random.randint(1, 13, 2000)])
+        datlim = np.column_stack([np.zeros(2000), np.random.rand(2000) + 5])
+        z = np.column_stack([np.random.rand(a_day) * 100, np.random.randint(1, 13, a_day)])
+        dat = np.sin(np.arange(a_day) / 60.) * 4 + 2
+
+        def granules(dat, z, datlim, datlimz):
+            for i in xrange(0, a_day, 3600):
+                local(dat[i:i + 3600], z[i:i + 3600], datlim, datlimz)
+        self.profile(stats, granules, dat, z, datlim, datlimz)
+
+    def test_solarelevation(self):
+        # A year of 1 minute met data
+        n = a_year / 60
+        dt = 1356998400. + np.arange(n) * 60.
+        lon = np.ones(n) * -70.
+        lat = np.ones(n) * 40.
+        for daily in [False, True]:
+            stats = []
+            print 'daily = %s' % daily
+            self.profile(stats, solarelevation, lon, lat, dt, daily)
+
     def test_ntp_to_month(self):
         stats = []
         t0 = 1356998400 + 2208988800 # 2013-01-01 + NTP Offset
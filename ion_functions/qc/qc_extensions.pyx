@@ -6,53 +6,290 @@ cimport cython
 np.import_array()
 
 cdef extern from "stuck.h":
-    int stuck(signed char *out, double *dat, size_t len, double reso, int num)
+    int stuck(signed char *out, double *dat, size_t len, double reso, int num) nogil
 
 cdef extern from "spike.h":
-    int spike(signed char *out, double *dat, size_t len, int L, double N, double acc)
+    int spike(signed char *out, double *dat, size_t len, int L, double N, double acc) nogil
 
 cdef extern from "gradient.h":
-    int gradient(signed char *out, double *dat, double *x, size_t len, double grad_min, double grad_max, double mindx, double startdat, double toldat, double skipped_value)
+    ctypedef struct gradient_state:
+        double startdat
+        int skipped
+        bint bad
+    int gradient(signed char *out, double *dat, double *x, size_t len, double grad_min, double grad_max, double mindx, double startdat, double toldat, double skipped_value) nogil
+    void gradient_start(gradient_state *state, signed char *out, double *dat, double startdat, double toldat) nogil
+    int gradient_resume(signed char *out, double *dat, double *x, size_t start, size_t len, double grad_min, double grad_max, double mindx, double toldat, signed char skipped_value, gradient_state *state) nogil
     
+cdef extern from "fused.h":
+    ctypedef struct fused_params:
+        bint globalrange
+        double dat_min
+        double dat_max
+        bint spike
+        int spike_L
+        double spike_N
+        double spike_acc
+        bint stuck
+        double stuck_reso
+        int stuck_num
+        bint gradient
+        double grad_min
+        double grad_max
+        double mindx
+        double startdat
+        double toldat
+        signed char skipped_value
+    int FUSED_NTESTS
+    int fused(signed char *out, double *dat, double *x, size_t len, fused_params *p) nogil
+
 cdef extern from "time_utils.h":
-    int ntp_month_vector(short int *out, double *input, size_t len)
+    int ntp_month_vector(short int *out, double *input, size_t len) nogil
+
+
+
 
 
+def _rows(dat, axis):
+    '''
+    Returns a C-contiguous 2-D array of doubles holding one series per row
+    '''
+    dat = np.asanyarray(dat, dtype=np.float)
+    if dat.ndim != 2:
+        raise ValueError('\'dat\' must be a 1-D or 2-D array')
+    if axis in (0, -2):
+        dat = dat.T
+    elif axis not in (1, -1):
+        raise ValueError('\'axis\' must be 0 or 1')
+    return np.ascontiguousarray(dat)
 
+def _row_param(param, nrows, dtype=np.float):
+    '''
+    Returns a parameter given as a scalar or one value per row as a vector
+    with one value per row
+    '''
+    param = np.asanyarray(param, dtype=dtype)
+    if param.ndim > 1 or (param.ndim == 1 and param.size not in (1, nrows)):
+        raise ValueError('Parameters must be scalars or have one value per series')
+    return np.ascontiguousarray(np.resize(param, nrows))
 
+def _from_rows(out, axis):
+    if axis in (0, -2):
+        return out.T
+    return out
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def stuckvalues(dat, reso, num):
+def stuckvalues(dat, reso, num, axis=-1):
+    '''
+    Stuck value flags of dat. If dat is 2-D, every series along axis is
+    tested, reso and num may then be given per series.
+    '''
+    if dat.ndim != 1:
+        return _stuckvalues_2d(dat, reso, num, axis)
     cdef int dat_shape = dat.shape[0]
     cdef np.ndarray[double] x = dat
     cdef np.ndarray[signed char] out = np.zeros([dat_shape], dtype=np.int8)
+    cdef double _reso = reso
+    cdef int _num = num
+    cdef int status
     out.fill(1)
-    stuck(&out[0], &x[0], dat_shape, reso, num)
+    with nogil:
+        status = stuck(&out[0], &x[0], dat_shape, _reso, _num)
+    if status < 0:
+        raise MemoryError()
 
     return out
-            
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def spikevalues(dat, L, N, acc):
+def _stuckvalues_2d(dat, reso, num, axis):
+    cdef np.ndarray[double, ndim=2] idat = _rows(dat, axis)
+    cdef size_t nrows = idat.shape[0]
+    cdef size_t ncols = idat.shape[1]
+    cdef np.ndarray[double] ireso = _row_param(reso, nrows)
+    cdef np.ndarray[int] inum = _row_param(num, nrows, np.intc)
+    cdef np.ndarray[signed char, ndim=2] out = np.ones([nrows, ncols], dtype=np.int8)
+    cdef size_t i
+    cdef int status = 0
+    if nrows and ncols:
+        with nogil:
+            for i in range(nrows):
+                if stuck(&out[i, 0], &idat[i, 0], ncols, ireso[i], inum[i]) < 0:
+                    status = -1
+    if status < 0:
+        raise MemoryError()
+    return _from_rows(out, axis)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def spikevalues(dat, L, N, acc, axis=-1):
+    '''
+    Spike flags of dat. If dat is 2-D, every series along axis is tested, L,
+    N and acc may then be given per series.
+    '''
+    if dat.ndim != 1:
+        return _spikevalues_2d(dat, L, N, acc, axis)
     cdef int dat_shape = dat.shape[0]
     cdef np.ndarray[double] x = dat
     cdef np.ndarray[signed char] out = np.zeros([dat_shape], dtype=np.int8)
+    cdef int _L = L
+    cdef double _N = N
+    cdef double _acc = acc
     out.fill(1)
-    spike(&out[0], &x[0], dat_shape, L, N, acc)
+    with nogil:
+        spike(&out[0], &x[0], dat_shape, _L, _N, _acc)
 
     return out
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def gradientvalues(dat, x, grad_min, grad_max, mindx, startdat, toldat, skipped_value=-99):
+def _spikevalues_2d(dat, L, N, acc, axis):
+    cdef np.ndarray[double, ndim=2] idat = _rows(dat, axis)
+    cdef size_t nrows = idat.shape[0]
+    cdef size_t ncols = idat.shape[1]
+    cdef np.ndarray[int] iL = _row_param(L, nrows, np.intc)
+    cdef np.ndarray[double] iN = _row_param(N, nrows)
+    cdef np.ndarray[double] iacc = _row_param(acc, nrows)
+    cdef np.ndarray[signed char, ndim=2] out = np.ones([nrows, ncols], dtype=np.int8)
+    cdef size_t i
+    if nrows and ncols:
+        with nogil:
+            for i in range(nrows):
+                spike(&out[i, 0], &idat[i, 0], ncols, iL[i], iN[i], iacc[i])
+    return _from_rows(out, axis)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def gradientvalues(dat, x, grad_min, grad_max, mindx, startdat, toldat, skipped_value=-99, axis=-1):
+    '''
+    Gradient flags of dat along x. If dat is 2-D, every series along axis is
+    tested, x may then be shared by every series (1-D) or given per series
+    (same shape as dat), and the other parameters may be given per series.
+    '''
+    if dat.ndim != 1:
+        return _gradientvalues_2d(dat, x, grad_min, grad_max, mindx, startdat, toldat, skipped_value, axis)
     cdef int dat_shape = dat.shape[0]
     cdef np.ndarray[double] idat = dat
     cdef np.ndarray[double] ix = x
     cdef np.ndarray[signed char] out = np.zeros([dat_shape], dtype=np.int8)
     cdef signed char _skip = skipped_value
+    cdef double _grad_min = grad_min
+    cdef double _grad_max = grad_max
+    cdef double _mindx = mindx
+    cdef double _startdat = startdat
+    cdef double _toldat = toldat
     out.fill(1)
-    gradient(&out[0], &idat[0], &ix[0], dat_shape, grad_min, grad_max, mindx, startdat, toldat, _skip)
+    with nogil:
+        gradient(&out[0], &idat[0], &ix[0], dat_shape, _grad_min, _grad_max, _mindx, _startdat, _toldat, _skip)
+    return out
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _gradientvalues_2d(dat, x, grad_min, grad_max, mindx, startdat, toldat, skipped_value, axis):
+    cdef np.ndarray[double, ndim=2] idat = _rows(dat, axis)
+    cdef size_t nrows = idat.shape[0]
+    cdef size_t ncols = idat.shape[1]
+    cdef np.ndarray[double, ndim=2] ix
+    cdef size_t xstride = 0
+    cdef np.ndarray[double] igrad_min = _row_param(grad_min, nrows)
+    cdef np.ndarray[double] igrad_max = _row_param(grad_max, nrows)
+    cdef np.ndarray[double] imindx = _row_param(mindx, nrows)
+    cdef np.ndarray[double] istartdat = _row_param(startdat, nrows)
+    cdef np.ndarray[double] itoldat = _row_param(toldat, nrows)
+    cdef np.ndarray[signed char, ndim=2] out = np.ones([nrows, ncols], dtype=np.int8)
+    cdef signed char _skip = skipped_value
+    cdef size_t i
+    x = np.asanyarray(x, dtype=np.float)
+    if x.ndim == 1:
+        # A coordinate shared by every series
+        ix = np.ascontiguousarray(x.reshape(1, x.size))
+    else:
+        ix = _rows(x, axis)
+        xstride = 1
+    if ix.shape[1] != ncols or (xstride and ix.shape[0] != nrows):
+        raise ValueError('\'dat\' and \'x\' must be of equal len')
+    if nrows and ncols:
+        with nogil:
+            for i in range(nrows):
+                gradient(&out[i, 0], &idat[i, 0], &ix[i * xstride, 0], ncols, igrad_min[i], igrad_max[i], imindx[i], istartdat[i], itoldat[i], _skip)
+    return _from_rows(out, axis)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def gradientvalues_resume(dat, x, out, start, state, grad_min, grad_max, mindx, startdat, toldat, skipped_value=-99):
+    '''
+    Evaluates dat[start:] into out, continuing from state, the
+    (startdat, skipped, bad) tuple returned by the previous call. The
+    skipped + 1 values preceding start must be included in dat, x and out. If
+    state is None a new series starts at dat[0] (startdat is only used then).
+    Returns the state after the last value.
+    '''
+    cdef int dat_shape = dat.shape[0]
+    cdef np.ndarray[double] idat = dat
+    cdef np.ndarray[double] ix = x
+    cdef np.ndarray[signed char] iout = out
+    cdef signed char _skip = skipped_value
+    cdef gradient_state _state
+    cdef size_t _start = start
+    if dat_shape == 0:
+        return state
+    cdef double _grad_min = grad_min
+    cdef double _grad_max = grad_max
+    cdef double _mindx = mindx
+    cdef double _toldat = toldat
+    if state is None:
+        gradient_start(&_state, &iout[0], &idat[0], startdat, toldat)
+        _start = 1
+    else:
+        _state.startdat, _state.skipped, _state.bad = state
+    with nogil:
+        gradient_resume(&iout[0], &idat[0], &ix[0], _start, dat_shape, _grad_min, _grad_max, _mindx, _toldat, _skip, &_state)
+    return (_state.startdat, _state.skipped, _state.bad)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def fusedvalues(dat, x, datlim=None, spike=None, stuck=None, gradient=None, skipped_value=-99):
+    '''
+    Runs every enabled test in a single pass over dat. Each test is enabled
+    by passing its parameters:
+        datlim   = (dat_min, dat_max)
+        spike    = (acc, N, L)
+        stuck    = (reso, num)
+        gradient = (grad_min, grad_max, mindx, startdat, toldat), requires x
+    Returns a (4, len(dat)) array of flags, one row per test in the order
+    above. The rows of the tests not enabled are left at 1.
+    '''
+    cdef int dat_shape = dat.shape[0]
+    cdef np.ndarray[double] idat = dat
+    cdef np.ndarray[double] ix
+    cdef double *xptr = NULL
+    cdef np.ndarray[signed char, ndim=2] out = np.ones([FUSED_NTESTS, dat_shape], dtype=np.int8)
+    cdef fused_params p
+    p.globalrange = datlim is not None
+    if p.globalrange:
+        p.dat_min, p.dat_max = datlim
+    p.spike = spike is not None
+    if p.spike:
+        p.spike_acc, p.spike_N, p.spike_L = spike
+    p.stuck = stuck is not None
+    if p.stuck:
+        p.stuck_reso, p.stuck_num = stuck
+    p.gradient = gradient is not None
+    if p.gradient:
+        p.grad_min, p.grad_max, p.mindx, p.startdat, p.toldat = gradient
+        p.skipped_value = skipped_value
+        ix = x
+        if ix.shape[0] != dat_shape:
+            raise ValueError('\'dat\' and \'x\' must be of equal len')
+        if dat_shape:
+            xptr = &ix[0]
+    if dat_shape == 0:
+        return out
+    cdef int status
+    with nogil:
+        status = fused(&out[0, 0], &idat[0], xptr, dat_shape, &p)
+    if status < 0:
+        raise MemoryError()
     return out
 
 @cython.boundscheck(False)
@@ -62,6 +299,7 @@ def ntp_to_month(dat):
     cdef np.ndarray[double] idat = dat
     cdef np.ndarray[short int] out = np.zeros([dat_shape], dtype=np.int16)
     
-    ntp_month_vector(&out[0], &idat[0], dat_shape)
+    with nogil:
+        ntp_month_vector(&out[0], &idat[0], dat_shape)
     return out
 
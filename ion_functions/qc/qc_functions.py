@@ -6,11 +6,12 @@
 @author Christopher Mueller
 @brief Module containing QC functions ported from matlab samples in DPS documents
 """
-from ion_functions.qc.qc_extensions import stuckvalues, spikevalues, gradientvalues, ntp_to_month 
+from ion_functions.qc.qc_extensions import stuckvalues, spikevalues, gradientvalues, fusedvalues, ntp_to_month 
 
-import time
+import hashlib
 import numpy as np
 import numexpr as ne
+from collections import OrderedDict
 from scipy.interpolate import LinearNDInterpolator
 from ion_functions import utils
 from ion_functions.utils import fill_value
@@ -40,7 +41,7 @@ def dataqc_globalrangetest_minmax(dat, dat_min, dat_max, strict_validation=False
     return dataqc_globalrangetest(dat, [np.atleast_1d(dat_min)[-1], np.atleast_1d(dat_max)[-1]], strict_validation=strict_validation)
 
 
-def dataqc_globalrangetest(dat, datlim, strict_validation=False):
+def dataqc_globalrangetest(dat, datlim, strict_validation=False, packed=False):
     """
     Description:
 
@@ -69,6 +70,8 @@ def dataqc_globalrangetest(dat, datlim, strict_validation=False):
             considered to be valid.
         strict_validation = Flag (default is False) to assert testing of input
             types (e.g. isreal, isnumeric)
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
 
     References:
 
@@ -96,7 +99,44 @@ def dataqc_globalrangetest(dat, datlim, strict_validation=False):
         if len(datlim) < 2:  # Must have at least 2 elements
             raise ValueError('\'datlim\' must have at least 2 elements')
 
-    return (datlim.min() <= dat) & (dat <= datlim.max()).astype('int8')
+    qcflag = (datlim.min() <= dat) & (dat <= datlim.max()).astype('int8')
+    if packed:
+        return pack_flags(qcflag)
+    return qcflag
+
+# Interpolators of the local range limits, keyed by the contents of the
+# limits table, most recently used last. The tables are fixed per deployment
+# so the Delaunay triangulation only needs to be computed once.
+_localrange_cache = OrderedDict()
+LOCALRANGE_CACHE_SIZE = 32
+
+
+def _array_key(arr):
+    arr = np.ascontiguousarray(arr)
+    return (arr.shape, arr.dtype.str, hashlib.sha1(arr.view(np.uint8)).hexdigest())
+
+
+def _localrange_interpolator(datlim, datlimz):
+    '''
+    Returns a LinearNDInterpolator of both columns of datlim over a single
+    Delaunay triangulation of datlimz, cached across calls.
+    '''
+    key = (_array_key(datlimz), _array_key(datlim))
+    F = _localrange_cache.pop(key, None)
+    if F is None:
+        F = LinearNDInterpolator(datlimz, datlim)
+        while len(_localrange_cache) >= LOCALRANGE_CACHE_SIZE:
+            _localrange_cache.popitem(last=False)
+    _localrange_cache[key] = F
+    return F
+
+
+def clear_localrange_cache():
+    '''
+    Discards the cached local range test interpolators
+    '''
+    _localrange_cache.clear()
+
 
 def dataqc_localrangetest_wrapper(dat, datlim, datlimz, dims, pval_callback):
     if is_none(datlim) or np.all(np.atleast_1d(datlim).flatten() == -9999):
@@ -136,7 +176,7 @@ def dataqc_localrangetest_wrapper(dat, datlim, datlimz, dims, pval_callback):
     return dataqc_localrangetest(dat, z, datlim, datlimz)
 
 
-def dataqc_localrangetest(dat, z, datlim, datlimz, strict_validation=False):
+def dataqc_localrangetest(dat, z, datlim, datlimz, strict_validation=False, packed=False):
     """
     Description:
 
@@ -166,6 +206,8 @@ def dataqc_localrangetest(dat, z, datlim, datlimz, strict_validation=False):
             (column 2) values considered valid.
         datlimz = array with the locations where datlim is given. must have
             same # of rows as datlim and same # of columns as z.
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
 
     References:
 
@@ -247,15 +289,13 @@ def dataqc_localrangetest(dat, z, datlim, datlimz, strict_validation=False):
         # determine the upper limits using linear interpolation
         lim2 = np.interp(z, datlimz, datlim[:, 1], left=np.nan, right=np.nan)
     else:
-        # Compute Delaunay Triangulation and use linear interpolation to
-        # determine the N-dimensional lower limits
-        F = LinearNDInterpolator(datlimz, datlim[:, 0].reshape(numlim, 1))
-        lim1 = F(z).reshape(dat.size)
-
-        # Compute Delaunay Triangulation and use linear interpolation to
-        # determine the N-dimensional upper limits
-        F = LinearNDInterpolator(datlimz, datlim[:, 1].reshape(numlim, 1))
-        lim2 = F(z).reshape(dat.size)
+        # Use linear interpolation over the Delaunay Triangulation of datlimz
+        # (computed once per limits table) to determine the N-dimensional
+        # lower and upper limits at once
+        F = _localrange_interpolator(datlim, datlimz)
+        lims = F(z).reshape(dat.size, 2)
+        lim1 = lims[:, 0]
+        lim2 = lims[:, 1]
 
     # replace NaNs from above interpolations
     ff = (np.isnan(lim1)) | (np.isnan(lim2))
@@ -264,6 +304,8 @@ def dataqc_localrangetest(dat, z, datlim, datlimz, strict_validation=False):
 
     # compute the qcflags
     qcflag = (dat >= lim1) & (dat <= lim2)
+    if packed:
+        return pack_flags(qcflag)
     return qcflag.astype('int8')
 
 
@@ -274,7 +316,7 @@ def dataqc_spiketest_wrapper(dat, acc, N, L, strict_validation=False):
         return out
     return dataqc_spiketest(dat, np.atleast_1d(acc)[-1], np.atleast_1d(N)[-1], np.atleast_1d(L)[-1], strict_validation=strict_validation)
 
-def dataqc_spiketest(dat, acc, N=5, L=5, strict_validation=False):
+def dataqc_spiketest(dat, acc, N=5, L=5, strict_validation=False, packed=False, axis=-1):
     """
     Description:
 
@@ -317,6 +359,11 @@ def dataqc_spiketest(dat, acc, N=5, L=5, strict_validation=False):
         acc = Accuracy of any input measurement.
         N = (optional, defaults to 5) Range multiplier, cf. above
         L = (optional, defaults to 5) Window len, cf. above
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
+        axis = (optional, defaults to -1) If dat is a 2-D array, every series
+            along axis is tested in one call and the parameters may be given
+            per series (vectors) or shared (scalars).
 
     References:
 
@@ -345,7 +392,9 @@ def dataqc_spiketest(dat, acc, N=5, L=5, strict_validation=False):
                 raise ValueError('\'{0}\' must be real'.format(k))
     dat = np.asanyarray(dat, dtype=np.float)
     
-    out = spikevalues(dat, L, N, acc)
+    out = spikevalues(dat, L, N, acc, axis=axis)
+    if packed:
+        return pack_flags(out)
     return out
 
 
@@ -356,7 +405,7 @@ def dataqc_polytrendtest_wrapper(dat, t, ord_n, nstd, strict_validation=False):
         return out
     return dataqc_polytrendtest(dat, t, np.atleast_1d(ord_n)[-1], np.atleast_1d(nstd)[-1], strict_validation=strict_validation)
 
-def dataqc_polytrendtest(dat, t, ord_n=1, nstd=3, strict_validation=False):
+def dataqc_polytrendtest(dat, t, ord_n=1, nstd=3, strict_validation=False, packed=False):
     """
     Description:
 
@@ -396,6 +445,8 @@ def dataqc_polytrendtest(dat, t, ord_n=1, nstd=3, strict_validation=False):
             deviation must be reduced before qcflag switches from 1 to 0
         strict_validation (optional, defaults to False) = Flag asserting
             testing of inputs.
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
 
     References:
 
@@ -441,6 +492,8 @@ def dataqc_polytrendtest(dat, t, ord_n=1, nstd=3, strict_validation=False):
 
     # insure output size equals input, even though test yields a single value.
     qcflag = np.ones(dat.shape).astype('int8') * trndtst
+    if packed:
+        return pack_flags(qcflag)
     return qcflag
 
 
@@ -451,7 +504,7 @@ def dataqc_stuckvaluetest_wrapper(x, reso, num, strict_validation=False):
         return out
     return  dataqc_stuckvaluetest(x, np.atleast_1d(reso)[-1], np.atleast_1d(num)[-1], strict_validation=strict_validation)
 
-def dataqc_stuckvaluetest(x, reso, num=10, strict_validation=False):
+def dataqc_stuckvaluetest(x, reso, num=10, strict_validation=False, packed=False, axis=-1):
     """
     Description:
 
@@ -478,6 +531,11 @@ def dataqc_stuckvaluetest(x, reso, num=10, strict_validation=False):
         num = Minimum number of successive values within reso of each other
             that will trigger the "stuck value". num is optional and defaults
             to 10 if omitted or empty.
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
+        axis = (optional, defaults to -1) If dat is a 2-D array, every series
+            along axis is tested in one call and the parameters may be given
+            per series (vectors) or shared (scalars).
 
     References:
 
@@ -510,13 +568,20 @@ def dataqc_stuckvaluetest(x, reso, num=10, strict_validation=False):
 
     num = np.abs(num)
     dat = np.asanyarray(dat, dtype=np.float)
-    ll = len(x)
-    if ll < num:
+    if dat.ndim == 2:
+        out = stuckvalues(dat, reso, num, axis=axis)
+        # Series shorter than their 'num' are returned as zeros
+        short = np.resize(num, dat.size // dat.shape[axis]) > dat.shape[axis]
+        if short.any():
+            np.rollaxis(out, axis, 2)[short] = 0
+    elif len(x) < num:
         # Warn - 'num' is greater than len(x), returning zeros
         out = np.zeros(dat.size, dtype='int8')
     else:
         out = stuckvalues(dat, reso, num)
 
+    if packed:
+        return pack_flags(out)
     return out
 
 def dataqc_gradienttest_wrapper(dat, x, ddatdx, mindx, startdat, toldat, strict_validation=False):
@@ -528,7 +593,7 @@ def dataqc_gradienttest_wrapper(dat, x, ddatdx, mindx, startdat, toldat, strict_
     return outqc
 
 
-def dataqc_gradienttest(dat, x, ddatdx, mindx, startdat, toldat, strict_validation=False):
+def dataqc_gradienttest(dat, x, ddatdx, mindx, startdat, toldat, strict_validation=False, packed=False, axis=-1):
     """
     Description
 
@@ -581,6 +646,11 @@ def dataqc_gradienttest(dat, x, ddatdx, mindx, startdat, toldat, strict_validati
         toldat = tolerance value (scalar) for dat; threshold to within which
             dat must return to be counted as good, after exceeding a ddatdx
             threshold detected bad data.
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
+        axis = (optional, defaults to -1) If dat is a 2-D array, every series
+            along axis is tested in one call and the parameters may be given
+            per series (vectors) or shared (scalars).
 
     References:
 
@@ -601,7 +671,14 @@ def dataqc_gradienttest(dat, x, ddatdx, mindx, startdat, toldat, strict_validati
         if not all(np.diff(x) > 0):
             raise ValueError('\'x\' must be montonically increasing')
 
-    dat = np.asanyarray(dat, dtype=np.float).flatten()
+    dat = np.asanyarray(dat, dtype=np.float)
+    if dat.ndim == 2:
+        out = _gradienttest_2d(dat, x, ddatdx, mindx, startdat, toldat, axis)
+        if packed:
+            return pack_flags(out)
+        return out
+
+    dat = dat.flatten()
     x = np.asanyarray(x, dtype=np.float).flatten()
 
     if np.isnan(mindx):
@@ -624,6 +701,8 @@ def dataqc_gradienttest(dat, x, ddatdx, mindx, startdat, toldat, strict_validati
         out = np.zeros(x.shape)
         out.fill(1)
         log.warn('Too few values to inspect')
+        if packed:
+            return pack_flags(out)
         return out
 
 
@@ -631,10 +710,131 @@ def dataqc_gradienttest(dat, x, ddatdx, mindx, startdat, toldat, strict_validati
     grad_max = ddatdx[1]
     out = gradientvalues(dat, x, grad_min, grad_max, mindx, startdat, toldat)
 
+    if packed:
+        return pack_flags(out)
+    return out
+
+
+def _gradienttest_2d(dat, x, ddatdx, mindx, startdat, toldat, axis):
+    '''
+    dataqc_gradienttest of every series along axis of dat, x is either
+    shared by every series or has the shape of dat.
+    '''
+    x = np.asanyarray(x, dtype=np.float)
+    mindx = np.atleast_1d(np.asanyarray(mindx, dtype=np.float))
+    if not mindx.size:
+        mindx = np.zeros(1)
+    mindx[np.isnan(mindx)] = 0
+    startdat = np.atleast_1d(np.asanyarray(startdat, dtype=np.float))
+    if not startdat.size:
+        startdat = np.zeros(1)
+    startdat[np.isnan(startdat)] = 0
+
+    out = gradientvalues(dat, x, ddatdx[0], ddatdx[1], mindx, startdat, toldat, axis=axis)
+
+    # Series with too few values to inspect are flagged good
+    nseries = dat.size // dat.shape[axis]
+    if x.ndim == 1:
+        span = np.abs(x[0] - x[-1])
+    else:
+        x = np.rollaxis(x, axis, 2)
+        span = np.abs(x[:, 0] - x[:, -1])
+    short = np.resize(span < mindx, nseries)
+    if short.any():
+        np.rollaxis(out, axis, 2)[short] = 1
+    return out
+
+
+def dataqc_fusedtest(dat, x=None, datlim=None, spike=None, stuck=None, gradient=None, strict_validation=False, packed=False):
+    """
+    Description:
+
+        Runs the global range, spike, stuck value and gradient tests on one
+        data set in a single pass over the data, instead of one pass (and one
+        conversion and allocation of the input) per test. The flags of each
+        test are identical to those of the respective dataqc_* function.
+
+    Usage:
+
+        qcflags = dataqc_fusedtest(dat, x, datlim, spike, stuck, gradient)
+
+            where
+
+        qcflags = int8 array of shape (4, len(dat)) holding the flags of the
+            global range, spike, stuck value and gradient tests, in that
+            order. The rows of the tests that are not enabled are filled with
+            -99.
+
+        dat = Input dataset, a numeric real vector.
+        x = Coordinate of dat (e.g. time), only used by the gradient test.
+        datlim = Enables the global range test, see dataqc_globalrangetest.
+        spike = Enables the spike test, (acc, N, L) as for dataqc_spiketest.
+        stuck = Enables the stuck value test, (reso, num) as for
+            dataqc_stuckvaluetest.
+        gradient = Enables the gradient test, (ddatdx, mindx, startdat,
+            toldat) as for dataqc_gradienttest.
+        strict_validation = Flag (default is False) to assert testing of input
+            types (e.g. isreal, isnumeric)
+        packed = (optional, defaults to False) Flag to return the flags
+            packed one bit per value (see pack_flags)
+    """
+    dat = np.asanyarray(dat, dtype=np.float).flatten()
+
+    if strict_validation:
+        if not utils.isnumeric(dat).all():
+            raise ValueError('\'dat\' must be numeric')
+
+        if not utils.isreal(dat).all():
+            raise ValueError('\'dat\' must be real')
+
+    if datlim is not None:
+        datlim = np.atleast_1d(datlim)
+        datlim = (datlim.min(), datlim.max())
+    if spike is not None:
+        acc, N, L = spike
+        spike = (acc, N, int(L))
+    stuck_short = False
+    if stuck is not None:
+        reso, num = stuck
+        num = np.abs(num)
+        stuck = (reso, num)
+        stuck_short = dat.size < num
+    gradient_short = False
+    if gradient is not None:
+        ddatdx, mindx, startdat, toldat = gradient
+        if x is None:
+            raise ValueError('The gradient test requires \'x\'')
+        x = np.asanyarray(x, dtype=np.float).flatten()
+        if len(dat) != len(x):
+            raise ValueError('\'dat\' and \'x\' must be of equal len')
+        if strict_validation:
+            if not all(np.diff(x) > 0):
+                raise ValueError('\'x\' must be montonically increasing')
+        if np.isnan(mindx):
+            mindx = 0
+        mindx = mindx or 0
+        if np.isnan(startdat):
+            startdat = 0
+        startdat = startdat or 0
+        gradient = (ddatdx[0], ddatdx[1], mindx, startdat, toldat)
+        gradient_short = x.size > 0 and np.abs(x[0] - x[-1]) < mindx
+
+    out = fusedvalues(dat, x, datlim, spike, stuck, gradient)
+
+    # Same special cases as the individual tests
+    if stuck_short:
+        out[2].fill(0)
+    if gradient_short:
+        out[3].fill(1)
+    for i, params in enumerate((datlim, spike, stuck, gradient)):
+        if params is None:
+            out[i].fill(-99)
+    if packed:
+        return pack_flags(out)
     return out
 
 
-def dataqc_solarelevation(lon, lat, dt):
+def dataqc_solarelevation(lon, lat, dt, daily=False):
     """
     Description
 
@@ -664,7 +864,7 @@ def dataqc_solarelevation(lon, lat, dt):
 
     Usage:
 
-        z, sorad = dataqc_solarelevation(lon, lat, dt)
+        z, sorad = dataqc_solarelevation(lon, lat, dt, daily)
 
             where
 
@@ -674,6 +874,11 @@ def dataqc_solarelevation(lon, lat, dt):
         lon = longitude (east is positive) [decimal degress]
         lat = latitude [decimal degrees]
         dt = date and time stamp in UTC [seconds since 1970-01-01]
+        daily = (optional, defaults to False) Flag to compute the solar
+            declination, radius vector and equation of time once per UTC day
+            (at 12:00) and use them for every time stamp of that day. They
+            vary slowly, the solar altitude is then within about 0.2 degrees
+            of the exact computation.
 
     Examples
 
@@ -707,33 +912,80 @@ def dataqc_solarelevation(lon, lat, dt):
     #   (1995), Earth System Monitor, 6, 6-10.
     solar_const = 1368.0
 
-    # Create a time tuple in UTC from the Epoch time input, and then create
-    # scalars or numpy arrays of time elements for subsequent calculations.
-    ldt = len(dt)
-    yy = np.zeros(ldt, dtype=np.int)
-    mn = np.zeros(ldt, dtype=np.int)
-    dd = np.zeros(ldt, dtype=np.int)
-    hh = np.zeros(ldt, dtype=np.int)
-    mm = np.zeros(ldt, dtype=np.int)
-    ss = np.zeros(ldt, dtype=np.int)
-    for i in range(ldt):
-        # create time tuple in UTC
-        gtime = time.gmtime(dt[i])
-        # create scalar elements
-        yy[i] = gtime[0]
-        mn[i] = gtime[1]
-        dd[i] = gtime[2]
-        hh[i] = gtime[3]
-        mm[i] = gtime[4]
-        ss[i] = gtime[5]
-
     #constants used in function
     deg2rad = np.pi / 180.0
     rad2deg = 1 / deg2rad
 
+    # Split the Epoch time input into UTC days and seconds of the day, the
+    # same truncation to whole seconds as time.gmtime
+    dt = np.floor(np.asanyarray(dt, dtype=np.float)).astype(np.int64)
+    days = dt // 86400
+    secs = dt - days * 86400
+    hh = secs // 3600
+    mm = secs % 3600 // 60
+    ss = secs % 60
+
     # compute Universal Time in hours
     utime = hh + (mm + ss / 60.0) / 60.0
 
+    if daily:
+        # The ephemeris of every UTC day, computed once at 12:00
+        udays, index = np.unique(days, return_inverse=True)
+        decln, rho, eqt = _solar_ephemeris(udays, 12.0)
+        decln = decln[index]
+        rho = rho[index]
+        eqt = eqt[index]
+    else:
+        decln, rho, eqt = _solar_ephemeris(days, utime)
+
+    # compute local hour angle from global hour angle
+    gha = 15.0 * (utime-12) + 15.0 * eqt / 60.0
+    lha = gha - lon
+
+    # compute radius vector
+    rv = np.sqrt(rho)
+
+    # compute solar altitude
+    sz = (np.sin(deg2rad*lat) * np.sin(decln) + np.cos(deg2rad*lat)
+          * np.cos(decln) * np.cos(deg2rad*lha))
+    z = rad2deg * np.arcsin(sz)
+
+    # compute solar radiation outside atmosphere (defaults to 0 when solar
+    # altitude is below the horizon)
+    sorad = (solar_const / rv**2) * np.sin(deg2rad * z)
+    sorad[z < 0] = 0
+
+    return (z, sorad)
+
+def _civil_from_days(days):
+    '''
+    Returns the year, month and day of the month of days since 1970-01-01 in
+    the proleptic Gregorian calendar (the civil_from_days algorithm of H.
+    Hinnant), vectorized over integer arrays.
+    '''
+    z = np.asanyarray(days, dtype=np.int64) + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    dd = doy - (153 * mp + 2) // 5 + 1
+    mn = np.where(mp < 10, mp + 3, mp - 9)
+    yy = yoe + era * 400 + (mn <= 2)
+    return yy, mn, dd
+
+
+def _solar_ephemeris(days, utime):
+    '''
+    Returns the solar declination [radians], the square of the radius vector
+    and the equation of time [minutes] at the Universal Time utime [hours]
+    of the UTC days (days since 1970-01-01), see dataqc_solarelevation.
+    '''
+    #constants used in function
+    deg2rad = np.pi / 180.0
+
+    yy, mn, dd = _civil_from_days(days)
+
     # compute Julian ephemeris date in days (Day 1 is 1 Jan 4713 B.C. which
     # equals -4712 Jan 1)
     jed = (367.0 * yy - np.fix(7.0*(yy+np.fix((mn+9)/12.0))/4.0)
@@ -790,24 +1042,8 @@ def dataqc_solarelevation(lon, lat, dt):
            - 12.7 * np.sin(4*l))
     eqt = eqt / 60.0
 
-    # compute local hour angle from global hour angle
-    gha = 15.0 * (utime-12) + 15.0 * eqt / 60.0
-    lha = gha - lon
-
-    # compute radius vector
-    rv = np.sqrt(rho)
+    return decln, rho, eqt
 
-    # compute solar altitude
-    sz = (np.sin(deg2rad*lat) * np.sin(decln) + np.cos(deg2rad*lat)
-          * np.cos(decln) * np.cos(deg2rad*lha))
-    z = rad2deg * np.arcsin(sz)
-
-    # compute solar radiation outside atmosphere (defaults to 0 when solar
-    # altitude is below the horizon)
-    sorad = (solar_const / rv**2) * np.sin(deg2rad * z)
-    sorad[z < 0] = 0
-
-    return (z, sorad)
 
 def dataqc_propagateflags_wrapper(strict_validation=False, *args):
     '''
@@ -821,11 +1057,64 @@ def dataqc_propagateflags_wrapper(strict_validation=False, *args):
         if not (shapes == shapes[0]).all():
             raise ValueError('Input vectors are not the same shape')
 
+        # Reduce the flags one vector at a time rather than stacking them
+        # into an M-by-N matrix first
+        return dataqc_propagateflags(args)
+
     return dataqc_propagateflags(np.array(args), strict_validation=strict_validation)
 
 
+def pack_flags(flags):
+    """
+    Description:
+
+        Packs QC flags one bit per value, 8 values per byte (see
+        numpy.packbits), to cut the memory and I/O of flag arrays by 8x. The
+        bit of a value is set unless its flag is 0 (bad), so flags of
+        values that were not evaluated (e.g. -99) are packed as good, as
+        dataqc_propagateflags counts them.
+
+    Usage:
+
+        packed = pack_flags(flags)
+
+            where
+
+        packed = uint8 array, the last axis of flags packed into
+            ceil(N / 8) bytes.
 
-def dataqc_propagateflags(inflags, strict_validation=False):
+        flags = QC flags, a vector of N values or an M-by-N matrix holding
+            one vector of flags per row.
+    """
+    flags = np.atleast_1d(flags)
+    return np.packbits(flags != 0, axis=-1)
+
+
+def unpack_flags(packed, n):
+    """
+    Description:
+
+        Unpacks flags packed by pack_flags into 0 (bad) and 1 (good) int8
+        flags.
+
+    Usage:
+
+        flags = unpack_flags(packed, n)
+
+            where
+
+        flags = int8 flags, the last axis of packed unpacked into n values.
+
+        packed = uint8 array returned by pack_flags.
+        n = number of values that were packed (the length of the last axis
+            of the original flags).
+    """
+    packed = np.atleast_1d(packed)
+    flags = np.unpackbits(packed, axis=-1)[..., :n]
+    return flags.view(np.int8)
+
+
+def dataqc_propagateflags(inflags, strict_validation=False, packed=False):
     """
     Description:
 
@@ -858,7 +1147,11 @@ def dataqc_propagateflags(inflags, strict_validation=False):
 
         inflags = an M-by-N boolean matrix, where each of the M rows contains
             flags of an independent data set such that "0" means bad data and
-            "1" means good data.
+            "1" means good data. May also be a sequence of M vectors, which
+            are then combined one at a time without building the matrix.
+        packed = (optional, defaults to False) Flag indicating the rows of
+            inflags are packed (see pack_flags). The rows are then combined
+            byte-wise, 8 values at a time, and outflag is packed as well.
 
     References:
 
@@ -874,6 +1167,19 @@ def dataqc_propagateflags(inflags, strict_validation=False):
             raise ValueError('\'inflags\' must be \'0\' or \'1\' '
                              'integer flag array')
 
+    if packed:
+        # A value is good when its bit is set in every row
+        outflag = np.array(inflags[0], dtype=np.uint8)
+        for row in inflags[1:]:
+            np.bitwise_and(outflag, row, out=outflag)
+        return outflag
+
+    if not isinstance(inflags, np.ndarray):
+        outflag = np.array(inflags[0], dtype=np.bool)
+        for row in inflags[1:]:
+            np.logical_and(outflag, row, out=outflag)
+        return outflag.astype('int8')
+
     array_size = inflags.shape
     nrows = array_size[0]
     if nrows < 2:
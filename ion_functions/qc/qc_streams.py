@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""
+@package ion_functions.qc.qc_streams
+@file ion_functions/qc/qc_streams.py
+@brief Resumable QC tests that carry their window state across granules of a
+    series
+"""
+
+from ion_functions.qc.qc_extensions import stuckvalues, spikevalues, gradientvalues_resume
+
+import numpy as np
+
+
+class QCStream(object):
+    """
+    Base class of the streaming QC tests.
+
+    Data are passed to update() in chunks of any size (granules). Each call
+    returns the flags of the values that have become final, i.e. values whose
+    flag can no longer change no matter what data follow. Once the series
+    ends, flush() returns the flags of the remaining values. The flags
+    emitted by the update() calls and flush() concatenated are exactly the
+    flags of the batch QC function run on the concatenated series.
+
+    Only the tail of the series needed to finalize the next values is kept
+    between calls.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the state, the next update() starts a new series
+        """
+        self._dat = np.empty(0, dtype=np.float)
+        self._offset = 0    # index in the series of self._dat[0]
+        self.emitted = 0    # number of values whose flags have been returned
+        self.received = 0   # number of values received
+
+    def _append(self, chunk):
+        chunk = np.asanyarray(chunk, dtype=np.float).flatten()
+        self._dat = np.concatenate([self._dat, chunk])
+        self.received += chunk.size
+        return self._dat
+
+    def _emit(self, flags, end, keep):
+        """
+        Returns the flags (of the values in the buffer) from the first value
+        not emitted yet up to the value with index end in the series. Then
+        drops the buffered values that precede index keep.
+        """
+        out = flags[self.emitted - self._offset:end - self._offset]
+        self.emitted = end
+        keep = max(keep, self._offset)
+        self._drop(keep - self._offset)
+        self._offset = keep
+        return out.astype(np.int8)
+
+    def _drop(self, n):
+        """
+        Drops the first n buffered values
+        """
+        self._dat = self._dat[n:]
+
+
+class SpikeTestStream(QCStream):
+    """
+    Streaming equivalent of dataqc_spiketest.
+
+    A value is final once the L-L/2-1 values after it have been received (or
+    the first L values at the start of the series), so the latency is at most
+    L-1 values.
+
+    Usage:
+
+        stream = SpikeTestStream(acc, N, L)
+        for chunk in granules:
+            qcflag = stream.update(chunk)
+        qcflag = stream.flush()
+    """
+    def __init__(self, acc, N=5, L=5):
+        self.acc = acc
+        self.N = N
+        self.L = int(L)
+        QCStream.__init__(self)
+
+    def update(self, dat):
+        dat = self._append(dat)
+        L = self.L
+        if self.received < L:
+            return np.empty(0, dtype=np.int8)
+
+        # The window of a value extends L-L/2-1 values past it and L/2
+        # values before it. The last window of the series (used at flush)
+        # starts L/2+1 values before the first value not final yet.
+        end = self.received - (L - L // 2 - 1)
+        flags = spikevalues(dat, L, self.N, self.acc)
+        return self._emit(flags, end, end - L // 2 - 1)
+
+    def flush(self):
+        """
+        Returns the flags of the remaining values and resets the stream
+        """
+        dat = self._dat
+        flags = spikevalues(dat, self.L, self.N, self.acc)
+        out = self._emit(flags, self.received, self.received)
+        self.reset()
+        return out
+
+
+class StuckValueStream(QCStream):
+    """
+    Streaming equivalent of dataqc_stuckvaluetest.
+
+    A value is final once the num-1 values after it have been received, so
+    the latency is at most num-1 values.
+
+    Usage:
+
+        stream = StuckValueStream(reso, num)
+        for chunk in granules:
+            qcflag = stream.update(chunk)
+        qcflag = stream.flush()
+    """
+    def __init__(self, reso, num=10):
+        self.reso = reso
+        self.num = int(np.abs(num))
+        QCStream.__init__(self)
+
+    def update(self, x):
+        dat = self._append(x)
+        num = self.num
+        if self.received < num:
+            return np.empty(0, dtype=np.int8)
+
+        # A value is part of the runs of num values that start up to num-1
+        # values before it.
+        end = self.received - max(num - 1, 0)
+        flags = stuckvalues(dat, self.reso, num)
+        return self._emit(flags, end, end - max(num - 1, 0))
+
+    def flush(self):
+        """
+        Returns the flags of the remaining values and resets the stream
+        """
+        if self.received < self.num:
+            # dataqc_stuckvaluetest returns zeros for series shorter than num
+            flags = np.zeros(self._dat.size, dtype=np.int8)
+        else:
+            flags = stuckvalues(self._dat, self.reso, self.num)
+        out = self._emit(flags, self.received, self.received)
+        self.reset()
+        return out
+
+
+class GradientTestStream(QCStream):
+    """
+    Streaming equivalent of dataqc_gradienttest.
+
+    Values closer than mindx to the last evaluated value are skipped, and
+    their flag is set to 0 if the next evaluated value turns out bad, so
+    skipped values are final only once a value further than mindx away has
+    been received. Every other value is final immediately. As for
+    dataqc_gradienttest, x is expected to be monotonically increasing.
+
+    Usage:
+
+        stream = GradientTestStream(ddatdx, mindx, startdat, toldat)
+        for dat_chunk, x_chunk in granules:
+            qcflag = stream.update(dat_chunk, x_chunk)
+        qcflag = stream.flush()
+    """
+    def __init__(self, ddatdx, mindx, startdat, toldat, skipped_value=-99):
+        # Same defaults as dataqc_gradienttest
+        if np.isnan(mindx):
+            mindx = 0
+        mindx = mindx or 0
+        if np.isnan(startdat):
+            startdat = 0
+        startdat = startdat or 0
+
+        self.grad_min = ddatdx[0]
+        self.grad_max = ddatdx[1]
+        self.mindx = mindx
+        self.startdat = startdat
+        self.toldat = toldat
+        self.skipped_value = skipped_value
+        QCStream.__init__(self)
+
+    def reset(self):
+        QCStream.reset(self)
+        self._x = np.empty(0, dtype=np.float)
+        self._flags = np.empty(0, dtype=np.int8)
+        self._x0 = None
+        self._state = None
+
+    def update(self, dat, x):
+        start = self._dat.size
+        dat = self._append(dat)
+        x = np.asanyarray(x, dtype=np.float).flatten()
+        if x.size != dat.size - start:
+            raise ValueError('\'dat\' and \'x\' must be of equal len')
+        x = self._x = np.concatenate([self._x, x])
+        flags = self._flags = np.concatenate([self._flags, np.ones(x.size - start, dtype=np.int8)])
+        if not x.size:
+            return np.empty(0, dtype=np.int8)
+        if self._x0 is None:
+            self._x0 = x[0]
+
+        self._state = gradientvalues_resume(dat, x, flags, start, self._state,
+                                            self.grad_min, self.grad_max,
+                                            self.mindx, self.startdat,
+                                            self.toldat, self.skipped_value)
+        skipped = self._state[1]
+        if skipped == self.received - 1:
+            # Everything after the first value was skipped so far, in which
+            # case the batch test may flag the whole series good (see flush)
+            return np.empty(0, dtype=np.int8)
+
+        # The last skipped + 1 values are needed to continue
+        end = self.received - skipped
+        return self._emit(flags, end, end - 1)
+
+    def _drop(self, n):
+        QCStream._drop(self, n)
+        self._x = self._x[n:]
+        self._flags = self._flags[n:]
+
+    def flush(self):
+        """
+        Returns the flags of the remaining values and resets the stream
+        """
+        flags = self._flags
+        if self._state is not None and self._state[1] == self.received - 1:
+            if np.abs(self._x0 - self._x[-1]) < self.mindx:
+                # dataqc_gradienttest: too few values to inspect
+                flags = np.ones(flags.size, dtype=np.int8)
+        out = self._emit(flags, self.received, self.received)
+        self.reset()
+        return out
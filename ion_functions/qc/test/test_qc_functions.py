@@ -222,6 +222,41 @@ class TestQCFunctionsUnit(BaseUnitTestCase):
             qc = qcfunc.dataqc_localrangetest(dat, z, datlim, datlimz)
             np.testing.assert_array_equal(qc, expected)
 
+    def test_dataqc_localrangetest_cache(self):
+        from scipy.interpolate import LinearNDInterpolator
+        np.random.seed(13)
+        datlimz = np.random.rand(50, 2) * 10
+        datlim = np.column_stack([np.random.rand(50) * 2, np.random.rand(50) * 2 + 3])
+        z = np.random.rand(1000, 2) * 10
+        dat = np.random.rand(1000) * 5
+
+        # Reference: one interpolator (and triangulation) per column
+        lim1 = LinearNDInterpolator(datlimz, datlim[:, 0])(z)
+        lim2 = LinearNDInterpolator(datlimz, datlim[:, 1])(z)
+        ff = np.isnan(lim1) | np.isnan(lim2)
+        lim1[ff] = np.max(datlim[:, 1])
+        lim2[ff] = np.min(datlim[:, 0])
+        expected = ((dat >= lim1) & (dat <= lim2)).astype(np.int8)
+
+        qcfunc.clear_localrange_cache()
+        got = qcfunc.dataqc_localrangetest(dat, z, datlim, datlimz)
+        np.testing.assert_array_equal(got, expected)
+        self.assertEquals(len(qcfunc._localrange_cache), 1)
+        # A cache hit gives the same result
+        got = qcfunc.dataqc_localrangetest(dat, z, datlim, datlimz.copy())
+        np.testing.assert_array_equal(got, expected)
+        self.assertEquals(len(qcfunc._localrange_cache), 1)
+
+        # Changing the limits builds a new interpolator
+        got = qcfunc.dataqc_localrangetest(dat, z, datlim + 1, datlimz)
+        self.assertEquals(len(qcfunc._localrange_cache), 2)
+
+        # The cache is bounded, least recently used tables are evicted first
+        for i in xrange(qcfunc.LOCALRANGE_CACHE_SIZE + 5):
+            qcfunc.dataqc_localrangetest(dat, z, datlim + i + 2, datlimz)
+        self.assertEquals(len(qcfunc._localrange_cache), qcfunc.LOCALRANGE_CACHE_SIZE)
+        qcfunc.clear_localrange_cache()
+
     def test_lrt_wrapper(self):
         t = np.array([3580144703.7555027, 3580144704.7555027, 3580144705.7555027, 3580144706.7555027, 3580144707.7555027, 3580144708.7555027, 3580144709.7555027, 3580144710.7555027, 3580144711.7555027, 3580144712.7555027])
         pressure = np.random.rand(10) * 2 + 33.0
@@ -322,6 +357,28 @@ class TestQCFunctionsUnit(BaseUnitTestCase):
         # Delete the indices and make sure everything that's left is 1
         self.assertTrue((np.delete(out, out_inds) == 1).all())
 
+    def test_dataqc_spiketest_window_lengths(self):
+        # Compare against a direct evaluation of every window, including the
+        # first and last L/2 values that share the first/last window.
+        np.random.seed(42)
+        dat = np.random.randn(3000)
+        dat[::53] += 25.
+        dat[1000:1010] = np.nan
+        for L in [3, 4, 5, 9, 50, 201, 1001]:
+            L2 = L / 2
+            expected = np.ones(dat.size, dtype=np.int8)
+            for i in xrange(dat.size):
+                start = min(max(i - L2, 0), dat.size - L)
+                window = dat[start:start + L]
+                focus = i - start
+                peers = np.delete(window, focus)
+                R = max(peers.max() - peers.min(), 0.1)
+                if np.abs(window[focus] - peers.mean()) > 5 * R:
+                    expected[i] = 0
+
+            got = qcfunc.dataqc_spiketest(dat, 0.1, N=5, L=L)
+            np.testing.assert_array_equal(got, expected)
+
     def test_dataqc_polytrendtest(self):
         """
         Test of the Trend Test function.
@@ -424,6 +481,24 @@ class TestQCFunctionsUnit(BaseUnitTestCase):
         self.assertTrue((np.delete(out, sl) == 1).all())
 
 
+    def test_dataqc_stuckvaluetest_parity(self):
+        # Compare against a direct evaluation of every run of num values:
+        # a run is stuck if all of its values are within reso of its last.
+        np.random.seed(3)
+        steps = np.random.randint(-2, 3, 5000) * (np.random.rand(5000) < 0.25)
+        dat = np.cumsum(steps * 0.5)
+        dat[2500] = np.nan
+        for num in [1, 2, 4, 10, 60]:
+            for reso in [0.001, 0.75]:
+                expected = np.ones(dat.size, dtype=np.int8)
+                for i in xrange(dat.size - num + 1):
+                    run = dat[i:i + num]
+                    if np.all(np.abs(run[-1] - run) < reso):
+                        expected[i:i + num] = 0
+
+                got = qcfunc.dataqc_stuckvaluetest(dat, reso, num)
+                np.testing.assert_array_equal(got, expected)
+
 
     def test_dataqc_gradienttest(self):
         """
@@ -517,6 +592,53 @@ class TestQCFunctionsUnit(BaseUnitTestCase):
 
         np.testing.assert_array_equal(gotqc, outqc)
 
+    def test_dataqc_batched(self):
+        # 2-D inputs give the same flags as testing every series on its own
+        np.random.seed(17)
+        steps = np.random.randint(-2, 3, (6, 300)) * (np.random.rand(6, 300) < 0.3)
+        dat = np.cumsum(steps * 0.5, axis=1)
+        dat[:, ::23] += 15.
+        x = np.cumsum(np.random.rand(6, 300), axis=1)
+        L = np.array([3, 5, 7, 11, 51, 5])
+        num = np.array([2, 3, 4, 5, 400, 3])
+        mindx = np.array([0, 0.5, 1, np.nan, 0, 1000])
+        for axis, d, xx in [(1, dat, x), (0, dat.T, x.T)]:
+            spike = qcfunc.dataqc_spiketest(d, 0.1, 3, L, axis=axis)
+            stuck = qcfunc.dataqc_stuckvaluetest(d, 0.1, num, axis=axis)
+            grad = qcfunc.dataqc_gradienttest(d, xx, [-4, 4], mindx, 0, 2, axis=axis)
+            shared = qcfunc.dataqc_gradienttest(d, x[0], [-4, 4], mindx, 0, 2, axis=axis)
+            if axis == 0:
+                spike, stuck, grad, shared = spike.T, stuck.T, grad.T, shared.T
+            for i in xrange(dat.shape[0]):
+                np.testing.assert_array_equal(spike[i], qcfunc.dataqc_spiketest(dat[i], 0.1, 3, L[i]))
+                np.testing.assert_array_equal(stuck[i], qcfunc.dataqc_stuckvaluetest(dat[i], 0.1, num[i]))
+                np.testing.assert_array_equal(grad[i], qcfunc.dataqc_gradienttest(dat[i], x[i], [-4, 4], mindx[i], 0, 2))
+                np.testing.assert_array_equal(shared[i], qcfunc.dataqc_gradienttest(dat[i], x[0], [-4, 4], mindx[i], 0, 2))
+
+        with self.assertRaises(ValueError):
+            qcfunc.dataqc_spiketest(dat, 0.1, 3, [5, 5])
+
+    def test_dataqc_fusedtest(self):
+        # Every row must match the respective test run on its own
+        np.random.seed(5)
+        steps = np.random.randint(-2, 3, 10000) * (np.random.rand(10000) < 0.25)
+        dat = np.cumsum(steps * 0.5)
+        dat[::41] += 20.
+        dat[5000] = np.nan
+        x = np.cumsum(np.random.rand(10000) * 2)
+        for L in [5, 51]:
+            got = qcfunc.dataqc_fusedtest(dat, x, [-10, 10], (0.1, 3, L), (0.01, 6), ([-5, 5], 1.2, np.nan, 1))
+            np.testing.assert_array_equal(got[0], qcfunc.dataqc_globalrangetest(dat, [-10, 10]))
+            np.testing.assert_array_equal(got[1], qcfunc.dataqc_spiketest(dat, 0.1, 3, L))
+            np.testing.assert_array_equal(got[2], qcfunc.dataqc_stuckvaluetest(dat, 0.01, 6))
+            np.testing.assert_array_equal(got[3], qcfunc.dataqc_gradienttest(dat, x, [-5, 5], 1.2, np.nan, 1))
+
+        # Disabled tests and short series
+        got = qcfunc.dataqc_fusedtest(dat[:5], stuck=(0.01, 6))
+        np.testing.assert_array_equal(got[2], np.zeros(5))
+        for i in [0, 1, 3]:
+            np.testing.assert_array_equal(got[i], np.ones(5) * -99)
+
     def test_dataqc_propagateflags(self):
         """
         Test of the dataqc_propagateflags function.
@@ -576,6 +698,35 @@ class TestQCFunctionsUnit(BaseUnitTestCase):
         got = qcfunc.dataqc_propagateflags(inflags)
         self.assertTrue(np.array_equal(got, outflags))
 
+    def test_pack_flags(self):
+        np.random.seed(9)
+        flags = np.random.randint(0, 2, (3, 1001)).astype(np.int8)
+        flags[0, ::7] = -99
+
+        packed = qcfunc.pack_flags(flags)
+        self.assertEquals(packed.shape, (3, 126))
+        self.assertEquals(packed.dtype, np.uint8)
+        np.testing.assert_array_equal(qcfunc.unpack_flags(packed, 1001), flags != 0)
+        np.testing.assert_array_equal(qcfunc.unpack_flags(packed[1], 1001), flags[1])
+
+        # Packed propagation matches the unpacked one
+        got = qcfunc.dataqc_propagateflags([packed[0], packed[1], packed[2]], packed=True)
+        np.testing.assert_array_equal(qcfunc.unpack_flags(got, 1001), qcfunc.dataqc_propagateflags(flags))
+        got = qcfunc.dataqc_propagateflags(packed, packed=True)
+        np.testing.assert_array_equal(qcfunc.unpack_flags(got, 1001), qcfunc.dataqc_propagateflags(flags))
+        got = qcfunc.dataqc_propagateflags_wrapper(False, flags[0], flags[1], flags[2])
+        np.testing.assert_array_equal(got, qcfunc.dataqc_propagateflags(flags))
+
+        # Opt-in packed output of the QC functions
+        dat = np.random.randn(1001)
+        dat[500:520] = 1.
+        for func, args in [(qcfunc.dataqc_globalrangetest, ([-1, 1],)),
+                           (qcfunc.dataqc_spiketest, (0.1, 2, 5)),
+                           (qcfunc.dataqc_stuckvaluetest, (0.01, 5)),
+                           (qcfunc.dataqc_gradienttest, (np.arange(1001.), [-1, 1], 0, 0, 1))]:
+            got = func(dat, *args, packed=True)
+            np.testing.assert_array_equal(got, qcfunc.pack_flags(func(dat, *args)))
+
     def test_dataqc_solarelevation(self):
         """
         Test of the dataqc_solarelevation function.
@@ -620,6 +771,24 @@ class TestQCFunctionsUnit(BaseUnitTestCase):
         self.assertTrue(np.allclose(got_z, z, rtol=1e-3, atol=0))
         self.assertTrue(np.allclose(got_sorad, sorad, rtol=1e-3, atol=0))
 
+    def test_dataqc_solarelevation_calendar(self):
+        import time
+        # The vectorized calendar matches time.gmtime from 1970 to 2100
+        np.random.seed(29)
+        dt = np.sort(np.random.rand(2000) * 4102444800.)
+        dt[:4] = [0, 951782400, 951868799.5, 4102444799]  # leap days, edges
+        yy, mn, dd = qcfunc._civil_from_days(np.floor(dt).astype(np.int64) // 86400)
+        for i in xrange(dt.size):
+            self.assertEquals((yy[i], mn[i], dd[i]), time.gmtime(dt[i])[:3])
+
+        # The daily ephemeris stays within 0.2 degrees of the exact altitude
+        dt = 1329177600. + np.arange(0, 86400 * 10, 60.)
+        lon = np.ones(dt.size) * 120
+        lat = np.ones(dt.size) * 30
+        z, sorad = qcfunc.dataqc_solarelevation(lon, lat, dt)
+        z_daily, sorad_daily = qcfunc.dataqc_solarelevation(lon, lat, dt, daily=True)
+        self.assertTrue(np.max(np.abs(z - z_daily)) < 0.2)
+
     def test_dataqc_condcompress(self):
         """
         Test of the dataqc_condcompress function.
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+@package ion_functions.qc.test.test_qc_streams
+@file ion_functions/qc/test/test_qc_streams.py
+@brief Unit tests for the streaming QC tests
+"""
+
+from nose.plugins.attrib import attr
+from ion_functions.test.base_test import BaseUnitTestCase
+
+import numpy as np
+from ion_functions.qc import qc_functions as qcfunc
+from ion_functions.qc.qc_streams import SpikeTestStream, StuckValueStream, GradientTestStream
+
+
+def chunked(n, rng, max_chunk):
+    """
+    Splits range(n) into consecutive slices of random sizes (including empty
+    ones)
+    """
+    start = 0
+    while start < n:
+        stop = min(n, start + rng.randint(0, max_chunk + 1))
+        yield slice(start, stop)
+        start = stop
+
+
+@attr('UNIT', group='func')
+class TestQCStreamsUnit(BaseUnitTestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(42)
+
+    def run_stream(self, stream, n, max_chunk, *arrays):
+        flags = []
+        for s in chunked(n, self.rng, max_chunk):
+            out = stream.update(*[a[s] for a in arrays])
+            flags.append(out)
+            # Only values that can no longer change are emitted
+            self.assertTrue(stream.emitted <= stream.received)
+        flags.append(stream.flush())
+        return np.concatenate(flags)
+
+    def test_spiketest_stream(self):
+        for L in (3, 4, 5, 11, 30, 51):
+            for n in (L - 1, L, L + 1, 500):
+                dat = self.rng.randn(n)
+                dat[self.rng.randint(0, n, n // 20 + 1)] = 8.
+                expected = qcfunc.dataqc_spiketest(dat, 0.1, 2, L)
+                for max_chunk in (1, 7, 100):
+                    stream = SpikeTestStream(0.1, 2, L)
+                    flags = self.run_stream(stream, n, max_chunk, dat)
+                    np.testing.assert_array_equal(flags, expected)
+
+    def test_spiketest_stream_latency(self):
+        L = 11
+        stream = SpikeTestStream(0.1, 3, L)
+        dat = self.rng.randn(100)
+        for i in xrange(dat.size):
+            stream.update(dat[i:i + 1])
+            if stream.received >= L:
+                self.assertEquals(stream.received - stream.emitted, L - L // 2 - 1)
+        self.assertTrue(stream._dat.size <= L)
+
+    def test_stuckvaluetest_stream(self):
+        for num in (1, 2, 5, 10, 40):
+            for n in (num - 1, num, num + 1, 500):
+                dat = np.round(self.rng.randn(n) * 2) / 2.
+                dat[n // 3:n // 3 + 2 * num] = 1.
+                expected = qcfunc.dataqc_stuckvaluetest(dat, 0.1, num)
+                for max_chunk in (1, 7, 100):
+                    stream = StuckValueStream(0.1, num)
+                    flags = self.run_stream(stream, n, max_chunk, dat)
+                    np.testing.assert_array_equal(flags, expected)
+
+    def test_gradienttest_stream(self):
+        ddatdx = [-1, 1]
+        for mindx in (0, 0.5, 2.5, 1000):
+            for toldat in (0.5, 5):
+                n = 400
+                dat = np.cumsum(self.rng.randn(n))
+                x = np.cumsum(self.rng.rand(n))
+                expected = qcfunc.dataqc_gradienttest(dat, x, ddatdx, mindx, 0, toldat)
+                for max_chunk in (1, 7, 100):
+                    stream = GradientTestStream(ddatdx, mindx, 0, toldat)
+                    flags = self.run_stream(stream, n, max_chunk, dat, x)
+                    np.testing.assert_array_equal(flags, expected)
+
+    def test_stream_reuse(self):
+        # flush() resets the stream for the next series
+        dat = self.rng.randn(50)
+        stream = StuckValueStream(0.1, 5)
+        first = np.concatenate([stream.update(dat), stream.flush()])
+        second = np.concatenate([stream.update(dat), stream.flush()])
+        np.testing.assert_array_equal(first, second)
+        self.assertEquals(first.size, dat.size)
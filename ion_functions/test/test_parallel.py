@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+@package ion_functions.test.test_parallel
+@file ion_functions/test/test_parallel.py
+@brief Unit tests for the thread pool helpers
+"""
+
+from nose.plugins.attrib import attr
+from ion_functions.test.base_test import BaseUnitTestCase
+
+import numpy as np
+from ion_functions import parallel
+from ion_functions.qc import qc_functions as qcfunc
+
+
+@attr('UNIT', group='func')
+class TestParallelUnit(BaseUnitTestCase):
+
+    def setUp(self):
+        np.random.seed(23)
+        steps = np.random.randint(-2, 3, 20000) * (np.random.rand(20000) < 0.25)
+        self.dat = np.cumsum(steps * 0.5)
+        self.dat[::37] += 20.
+
+    def test_chunk_bounds(self):
+        bounds = parallel.chunk_bounds(100, 3, workers=4, chunk_size=30)
+        self.assertEquals(bounds, [(0, 30, 0, 33), (30, 60, 27, 63), (60, 90, 57, 93), (90, 100, 87, 100)])
+        # Chunks are never shorter than their halos
+        bounds = parallel.chunk_bounds(100, 10, workers=4, chunk_size=5)
+        self.assertEquals(bounds[0], (0, 21, 0, 31))
+        # The inputs of the first and last chunks hold a full window
+        bounds = parallel.chunk_bounds(100, 3, workers=4, chunk_size=30, window=20)
+        self.assertEquals(bounds[-1], (90, 100, 80, 100))
+        bounds = parallel.chunk_bounds(100, 3, workers=4, chunk_size=10, window=20)
+        self.assertEquals(bounds[0], (0, 10, 0, 20))
+
+    def test_chunked_kernels(self):
+        # The chunked results are those of a single call (the data are
+        # multiples of 0.5, so the running sums of the spike test are exact)
+        for chunk_size in [1000, 1999, 7000]:
+            for L in [5, 8, 51]:
+                np.testing.assert_array_equal(
+                    parallel.spiketest(self.dat, 0.1, 3, L, workers=3, chunk_size=chunk_size),
+                    qcfunc.dataqc_spiketest(self.dat, 0.1, 3, L))
+            for num in [1, 4, 30]:
+                np.testing.assert_array_equal(
+                    parallel.stuckvaluetest(self.dat, 0.01, num, workers=3, chunk_size=chunk_size),
+                    qcfunc.dataqc_stuckvaluetest(self.dat, 0.01, num))
+            np.testing.assert_array_equal(
+                parallel.globalrangetest(self.dat, [-10, 10], workers=3, chunk_size=chunk_size),
+                qcfunc.dataqc_globalrangetest(self.dat, [-10, 10]))
+
+    def test_chunked_spiketest_tail(self):
+        # A short last chunk still sees the last full window
+        dat = self.dat.copy()
+        dat[-3] += 500.
+        for L in [5, 8, 51]:
+            flags = parallel.spiketest(dat, 0.1, 3, L, workers=3, chunk_size=1999)
+            self.assertEquals(flags[-3], 0)
+            np.testing.assert_array_equal(flags, qcfunc.dataqc_spiketest(dat, 0.1, 3, L))
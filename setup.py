@@ -27,6 +27,7 @@ qc_extension_sources = ["ion_functions/qc/qc_extensions.pyx",
                      "extensions/stuck.c",
                      "extensions/spike.c",
                      "extensions/gradient.c",
+                     "extensions/fused.c",
                      "extensions/utils.c",
                      "extensions/time_utils.c",]
 
@@ -69,7 +70,7 @@ setup(name = 'ion-functions',
             'scipy==0.11.0',
             'cython'
         ],
-        package_data = {'ion_functions.data':['WMM*.COF']},
+        package_data = {'ion_functions.data':['WMM*.COF', 'prs_functions_tides_*.mat']},
 
 )
 